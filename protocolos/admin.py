@@ -1,8 +1,18 @@
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.widgets import AutocompleteSelect
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import User
-from django.db.models import Case, When
-from .models import Cliente, Protocolo, Atualizacao
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.html import format_html, format_html_join
+from . import eventos
+from .busca import atualizar_indice_busca, filtro_clientes, filtro_protocolos
+from .historico import invalidar_historico
+from .models import Cliente, Protocolo, Atualizacao, Exportacao, HistoricoCompactado
+from .paginacao import PaginadorEstimado
+from .transicoes import TRANSICOES, aplicar_transicao
 
 # Customização do Admin de Usuários
 class CustomUserAdmin(BaseUserAdmin):
@@ -31,6 +41,82 @@ admin.site.unregister(User)
 admin.site.register(User, CustomUserAdmin)
 
 
+class FiltroAutocomplete(admin.RelatedFieldListFilter):
+    """
+    Filtro de chave estrangeira com busca (select2 e o autocomplete do admin),
+    em vez de uma lista com todos os objetos relacionados. O admin do modelo
+    relacionado precisa de search_fields.
+    """
+    template = 'admin/protocolos/filtro_autocomplete.html'
+
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        super().__init__(field, request, params, model, model_admin, field_path)
+        self.app_label = model._meta.app_label
+        self.model_name = model._meta.model_name
+
+    def field_choices(self, field, request, model_admin):
+        # Só o valor selecionado; as demais opções vêm do autocomplete
+        if not self.lookup_val:
+            return []
+        try:
+            return field.get_choices(
+                include_blank=False, limit_choices_to={f'{field.target_field.name}__in': self.lookup_val}
+            )
+        except (ValueError, ValidationError):
+            return []
+
+    def has_output(self):
+        return True
+
+
+class FiltroArquivo(admin.SimpleListFilter):
+    """
+    Por padrão a listagem mostra só os protocolos fora do arquivo (e usa os
+    índices parciais deles); os arquivados ficam a um clique.
+    """
+    title = 'arquivo'
+    parameter_name = 'arquivo'
+
+    def lookups(self, request, model_admin):
+        return (('arquivados', 'Arquivados'), ('todos', 'Todos'))
+
+    def choices(self, changelist):
+        yield {
+            'selected': self.value() is None,
+            'query_string': changelist.get_query_string(remove=[self.parameter_name]),
+            'display': 'Ativos',
+        }
+        for valor, rotulo in self.lookup_choices:
+            yield {
+                'selected': self.value() == valor,
+                'query_string': changelist.get_query_string({self.parameter_name: valor}),
+                'display': rotulo,
+            }
+
+    def queryset(self, request, queryset):
+        if self.value() == 'arquivados':
+            return queryset.arquivados()
+        if self.value() == 'todos':
+            return queryset
+        return queryset.quentes()
+
+
+def _acao_transicao(nome):
+    """Ação do admin que aplica a transição `nome` em lote (ver transicoes.py)"""
+    transicao = TRANSICOES[nome]
+
+    @admin.action(description=transicao.rotulo, permissions=['change'])
+    def acao(modeladmin, request, queryset):
+        alterados = aplicar_transicao(nome, queryset, request.user)
+        status = dict(Protocolo.STATUS_CHOICES)[transicao.destino]
+        modeladmin.message_user(
+            request, f'{len(alterados)} protocolo(s) alterado(s) para "{status}".', messages.SUCCESS
+        )
+
+    acao.__name__ = f'transicao_{nome}'
+    return acao
+
+
 # Inline para Atualizações no Admin de Protocolos
 class AtualizacaoInline(admin.TabularInline):
     model = Atualizacao
@@ -50,9 +136,15 @@ class ProtocoloAdmin(admin.ModelAdmin):
     list_display = (
         'numero', 'status', 'buic_dispositivo', 'usuario_criador', 'data_criacao', 'data_finalizacao'
     )
-    list_filter = ('status', 'data_criacao', 'usuario_criador')
-    search_fields = ('numero__iexact', 'clientes__nome__icontains', 'descricao_problema__icontains')
+    list_filter = (FiltroArquivo, 'status', 'data_criacao', ('usuario_criador', FiltroAutocomplete))
+    list_select_related = ('usuario_criador',)
+    # Só habilita a caixa de busca: a busca em si é feita por get_search_results
+    search_fields = ('numero',)
+    search_help_text = 'Número, BUIC, descrição, cliente ou texto das atualizações.'
+    paginator = PaginadorEstimado
+    show_full_result_count = False
     inlines = [AtualizacaoInline]
+    actions = [_acao_transicao(nome) for nome in TRANSICOES]
     
     # Campos organizados em fieldsets
     fieldsets = (
@@ -65,7 +157,9 @@ class ProtocoloAdmin(admin.ModelAdmin):
     )
     
     # Campos somente leitura
-    readonly_fields = ('numero_exibicao', 'usuario_criador', 'data_criacao', 'data_finalizacao')
+    readonly_fields = (
+        'numero_exibicao', 'usuario_criador', 'data_criacao', 'data_finalizacao', 'historico_compactado_exibicao'
+    )
     
     # Campos que aparecem ao criar um novo protocolo
     add_fieldsets = (
@@ -77,7 +171,11 @@ class ProtocoloAdmin(admin.ModelAdmin):
     def get_fieldsets(self, request, obj=None):
         if not obj:  # Criando um novo protocolo
             return self.add_fieldsets
-        return super().get_fieldsets(request, obj)
+        fieldsets = super().get_fieldsets(request, obj)
+        if obj.status == 'finalizado' and HistoricoCompactado.objects.filter(protocolo_id=obj.pk).exists():
+            # As atualizações compactadas não aparecem no inline, que lê a tabela
+            fieldsets += (('Histórico compactado', {'fields': ('historico_compactado_exibicao',)}),)
+        return fieldsets
 
     def get_readonly_fields(self, request, obj=None):
         readonly = list(self.readonly_fields)
@@ -93,16 +191,37 @@ class ProtocoloAdmin(admin.ModelAdmin):
             return f"#{Protocolo.get_proximo_numero()} (será gerado automaticamente)"
     numero_exibicao.short_description = "Número do Protocolo"
 
+    @admin.display(description="Atualizações")
+    def historico_compactado_exibicao(self, obj):
+        compactado = HistoricoCompactado.objects.filter(protocolo_id=obj.pk).first() if obj else None
+        if compactado is None:
+            return "-"
+        atualizacoes = sorted(compactado.atualizacoes(), key=lambda a: (a.data_hora, a.pk), reverse=True)
+        return format_html(
+            '<ul>{}</ul>',
+            format_html_join('', '<li><strong>{}</strong> ({}): {}</li>', (
+                (a.usuario.username, timezone.localtime(a.data_hora).strftime('%d/%m/%Y %H:%M'), a.descricao)
+                for a in atualizacoes
+            )),
+        )
+
     def get_queryset(self, request):
         qs = super().get_queryset(request)
-        return qs.order_by(
-            Case(
-                When(status='aberto', then=0),
-                When(status='em_andamento', then=1),
-                When(status='finalizado', then=2),
-                default=99,
-            )
-        )
+        # status_ordem é uma coluna gerada e indexada; evita calcular um CASE por linha
+        return qs.order_by('status_ordem', '-data_criacao')
+
+    def get_search_results(self, request, queryset, search_term):
+        # Pelos índices da busca global (ver busca.py), sem JOIN em clientes e sem DISTINCT
+        if not search_term.strip():
+            return queryset, False
+        return queryset.filter(filtro_protocolos(search_term)), False
+
+    @property
+    def media(self):
+        # select2 e autocomplete.js para o FiltroAutocomplete
+        campo = Protocolo._meta.get_field('usuario_criador')
+        filtro = forms.Media(js=['protocolos/js/filtro_autocomplete.js'])
+        return super().media + AutocompleteSelect(campo, self.admin_site).media + filtro
 
     def save_model(self, request, obj, form, change):
         if not obj.pk:  # Se for um novo protocolo
@@ -111,10 +230,28 @@ class ProtocoloAdmin(admin.ModelAdmin):
 
     def save_formset(self, request, form, formset, change):
         instances = formset.save(commit=False)
+        for obj in formset.deleted_objects:
+            obj.delete()
+
+        novas = []
         for instance in instances:
             if not instance.pk:  # Se for uma nova atualização
                 instance.usuario = request.user
-            instance.save()
+                novas.append(instance)
+            else:
+                instance.save()
+
+        if novas:
+            # Um INSERT para todas as novas atualizações e uma única transição
+            # de status para o protocolo (o admin já roda em uma transação)
+            Atualizacao.objects.bulk_create(novas)
+            protocolo = formset.instance
+            if Protocolo.iniciar_atendimento([protocolo.pk]):
+                protocolo.status = protocolo._status_original = 'em_andamento'
+            atualizar_indice_busca([protocolo.pk])
+            # bulk_create não dispara post_save
+            transaction.on_commit(lambda: invalidar_historico(protocolo.pk))
+            eventos.publicar_atualizacoes(novas)
         formset.save_m2m()
 
 
@@ -122,8 +259,27 @@ class ProtocoloAdmin(admin.ModelAdmin):
 @admin.register(Cliente)
 class ClienteAdmin(admin.ModelAdmin):
     list_display = ('nome', 'email', 'data_cadastro', 'ativo')
-    search_fields = ('nome__icontains', 'email__icontains')
+    search_fields = ('nome', 'email')
     list_filter = ('ativo', 'data_cadastro')
+    paginator = PaginadorEstimado
+    show_full_result_count = False
+
+    def get_search_results(self, request, queryset, search_term):
+        # O termo inteiro, e não palavra por palavra, para usar os índices de trigramas
+        if not search_term.strip():
+            return queryset, False
+        return queryset.filter(filtro_clientes(search_term)), False
+
+
+@admin.register(Exportacao)
+class ExportacaoAdmin(admin.ModelAdmin):
+    list_display = ('id', 'usuario', 'formato', 'status', 'linhas_processadas', 'total_linhas', 'data_criacao', 'data_conclusao')
+    list_filter = ('status', 'formato')
+    list_select_related = ('usuario',)
+    readonly_fields = ('usuario', 'formato', 'filtros', 'status', 'linhas_processadas', 'total_linhas', 'arquivo', 'erro', 'data_criacao', 'data_inicio', 'data_conclusao')
+
+    def has_add_permission(self, request):
+        return False
 
 
 # Customização da interface administrativa
@@ -0,0 +1,194 @@
+"""
+API JSON de leitura (protocolos, clientes e atualizações).
+
+As linhas vêm direto de values(), sem instanciar modelos, e são serializadas
+com orjson quando instalado (json da biblioteca padrão, caso contrário). A
+paginação é por cursor (paginacao.py) e `?fields=` restringe as colunas
+selecionadas no próprio SELECT.
+
+ETag e Last-Modified vêm das versões dos grupos de cache (cache.py), que são
+o instante, em nanossegundos, da última alteração confirmada nos dados de
+cada recurso. Uma consulta repetida sem alterações responde 304 lendo apenas
+o cache, sem tocar nas tabelas. data_criacao e data_hora não serviriam para
+isso: mudanças de status, de clientes ou o arquivamento não as alteram.
+"""
+import datetime
+import hashlib
+import json
+
+from .busca import GRUPO_AUTOCOMPLETE, GRUPO_BUSCA, cache_autocomplete, cache_busca, filtro_clientes
+from .cache import versao_grupo
+from .historico import ORDENACAO_HISTORICO, versao_historico
+from .models import Atualizacao, Cliente, HistoricoCompactado, Protocolo
+from .paginacao import paginar_keyset, paginar_lista
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+LIMITE_PADRAO = 50
+LIMITE_MAXIMO = 200
+
+
+class ParametroInvalido(ValueError):
+    pass
+
+
+class Recurso:
+    """Campos públicos (nome -> caminho no ORM) e ordenação de um recurso"""
+
+    def __init__(self, model, campos, ordenacao):
+        self.model = model
+        self.campos = campos
+        self.ordenacao = ordenacao
+
+    def selecionar(self, fields):
+        """Campos pedidos em `?fields=` (todos se vazio), na ordem de self.campos"""
+        if not fields:
+            return list(self.campos)
+        pedidos = {campo.strip() for campo in fields.split(',') if campo.strip()}
+        desconhecidos = pedidos - set(self.campos)
+        if desconhecidos:
+            raise ParametroInvalido(f"Campos desconhecidos: {', '.join(sorted(desconhecidos))}.")
+        return [campo for campo in self.campos if campo in pedidos]
+
+    def valores(self, queryset, campos):
+        """values() com os campos pedidos mais os da ordenação, que o cursor precisa"""
+        caminhos = {self.campos[campo] for campo in campos if self.campos[campo]}
+        return queryset.values(*caminhos | {campo.lstrip('-') for campo in self.ordenacao})
+
+    def recortar(self, itens, campos):
+        """Linhas de values() com as chaves públicas, só com os campos pedidos"""
+        return [{campo: item[self.campos[campo] or campo] for campo in campos} for item in itens]
+
+
+PROTOCOLOS = Recurso(Protocolo, {
+    'id': 'id',
+    'numero': 'numero',
+    'status': 'status',
+    'buic_dispositivo': 'buic_dispositivo',
+    'descricao_problema': 'descricao_problema',
+    'usuario': 'usuario_criador__username',
+    'data_criacao': 'data_criacao',
+    'data_finalizacao': 'data_finalizacao',
+    'arquivado': 'arquivado',
+    'clientes': None,  # ids dos clientes, em uma consulta à parte
+}, ['-data_criacao', '-id'])
+
+CLIENTES = Recurso(Cliente, {
+    'id': 'id',
+    'nome': 'nome',
+    'email': 'email',
+    'ativo': 'ativo',
+    'data_cadastro': 'data_cadastro',
+}, ['nome', 'id'])
+
+ATUALIZACOES = Recurso(Atualizacao, {
+    'id': 'id',
+    'descricao': 'descricao',
+    'usuario': 'usuario__username',
+    'data_hora': 'data_hora',
+}, ORDENACAO_HISTORICO)
+
+
+def limite_pedido(valor):
+    if not valor:
+        return LIMITE_PADRAO
+    try:
+        limite = int(valor)
+    except ValueError:
+        raise ParametroInvalido("limite deve ser um número inteiro.")
+    return max(1, min(limite, LIMITE_MAXIMO))
+
+
+def pagina_protocolos(protocolos, fields=None, cursor=None, limite=LIMITE_PADRAO):
+    campos = PROTOCOLOS.selecionar(fields)
+    simples = [campo for campo in campos if campo != 'clientes']
+    pagina = paginar_keyset(PROTOCOLOS.valores(protocolos, simples), PROTOCOLOS.ordenacao, cursor, limite)
+    if 'clientes' in campos:
+        Vinculo = Protocolo.clientes.through
+        clientes = {}
+        vinculos = Vinculo.objects.filter(protocolo_id__in=[item['id'] for item in pagina.itens])
+        for protocolo_id, cliente_id in vinculos.order_by('cliente_id').values_list('protocolo_id', 'cliente_id'):
+            clientes.setdefault(protocolo_id, []).append(cliente_id)
+        for item in pagina.itens:
+            item['clientes'] = clientes.get(item['id'], [])
+    return {'resultados': PROTOCOLOS.recortar(pagina.itens, campos), 'proximo_cursor': pagina.proximo_cursor}
+
+
+def pagina_clientes(clientes, fields=None, cursor=None, limite=LIMITE_PADRAO):
+    campos = CLIENTES.selecionar(fields)
+    pagina = paginar_keyset(CLIENTES.valores(clientes, campos), CLIENTES.ordenacao, cursor, limite)
+    return {'resultados': CLIENTES.recortar(pagina.itens, campos), 'proximo_cursor': pagina.proximo_cursor}
+
+
+def pagina_atualizacoes(protocolo, fields=None, cursor=None, limite=LIMITE_PADRAO):
+    """Inclui as atualizações do histórico compactado (ver compactacao.py)"""
+    campos = ATUALIZACOES.selecionar(fields)
+    linhas = ATUALIZACOES.valores(Atualizacao.objects.filter(protocolo_id=protocolo.pk), campos)
+    compactado = None
+    if protocolo.status == 'finalizado':
+        compactado = HistoricoCompactado.objects.filter(protocolo_id=protocolo.pk).first()
+    if compactado is None:
+        pagina = paginar_keyset(linhas, ATUALIZACOES.ordenacao, cursor, limite)
+    else:
+        itens = [
+            {'id': pk, 'descricao': descricao, 'usuario__username': username,
+             'data_hora': datetime.datetime.fromisoformat(data_hora)}
+            for pk, _usuario_id, username, data_hora, descricao in compactado.registros()
+        ]
+        pagina = paginar_lista(itens + list(linhas), Atualizacao, ATUALIZACOES.ordenacao, cursor, limite)
+    return {'resultados': ATUALIZACOES.recortar(pagina.itens, campos), 'proximo_cursor': pagina.proximo_cursor}
+
+
+def filtrar_clientes(parametros):
+    clientes = Cliente.objects.all()
+    termo = (parametros.get('q') or '').strip()
+    if termo:
+        clientes = clientes.filter(filtro_clientes(termo))
+    ativo = parametros.get('ativo')
+    if ativo is not None:
+        if ativo not in ('0', '1'):
+            raise ParametroInvalido("ativo deve ser 0 ou 1.")
+        clientes = clientes.filter(ativo=ativo == '1')
+    return clientes
+
+
+def _padrao_json(valor):
+    if isinstance(valor, (datetime.date, datetime.time)):
+        return valor.isoformat()
+    raise TypeError(f'{type(valor).__name__} não é serializável em JSON')
+
+
+def serializar(dados):
+    """bytes JSON; orjson e json produzem a mesma saída (datas em ISO 8601)"""
+    if orjson is not None:
+        return orjson.dumps(dados)
+    return json.dumps(dados, default=_padrao_json, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+# Versões usadas no ETag/Last-Modified de cada recurso
+
+def versao_protocolos():
+    return versao_grupo(cache_busca, GRUPO_BUSCA)
+
+
+def versao_clientes():
+    return versao_grupo(cache_autocomplete, GRUPO_AUTOCOMPLETE)
+
+
+def versoes_atualizacoes(protocolo_id):
+    # O histórico e também o protocolo (número, status), que decide onde o histórico está
+    return [versao_historico(protocolo_id), versao_protocolos()]
+
+
+def etag(versoes, request):
+    """As versões dos dados e a consulta (caminho + querystring)"""
+    resumo = hashlib.sha1(request.get_full_path().encode()).hexdigest()[:16]
+    return f'"{".".join(map(str, versoes))}-{resumo}"'
+
+
+def ultima_alteracao(versoes):
+    """Instante da versão mais recente (as versões são time.time_ns())"""
+    return datetime.datetime.fromtimestamp(max(versoes) / 1e9, tz=datetime.timezone.utc)
@@ -0,0 +1,59 @@
+"""
+Arquivamento de protocolos antigos (separação entre dados quentes e frios).
+
+Protocolos finalizados há mais de PROTOCOLOS_HORIZONTE_ARQUIVO_DIAS são
+marcados como arquivados, em lotes. Dashboard, busca global, admin e
+exportação consultam apenas os não arquivados (Protocolo.objects.quentes()),
+a menos que o usuário peça o arquivo. Os índices parciais WHERE NOT arquivado
+têm só a parte ativa da base, então essas consultas não crescem com o
+histórico.
+
+Reabrir um protocolo (Protocolo.save ou transições em lote) o tira do arquivo.
+"""
+import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .busca import invalidar_cache_busca
+from .contadores import invalidar_ultimos_protocolos
+from .models import Protocolo
+
+
+def limite_arquivamento(horizonte_dias=None):
+    """Finalizados antes deste instante podem ser arquivados"""
+    if horizonte_dias is None:
+        horizonte_dias = settings.PROTOCOLOS_HORIZONTE_ARQUIVO_DIAS
+    return timezone.now() - datetime.timedelta(days=horizonte_dias)
+
+
+def candidatos_arquivamento(horizonte_dias=None):
+    return Protocolo.objects.quentes().filter(
+        status='finalizado', data_finalizacao__lt=limite_arquivamento(horizonte_dias)
+    )
+
+
+def arquivar_finalizados(horizonte_dias=None, lote=5_000, progresso=None):
+    """
+    Arquiva os finalizados além do horizonte, `lote` protocolos por transação,
+    e retorna quantos foram arquivados. `progresso`, se informado, é chamado
+    com o total arquivado até o momento.
+    """
+    candidatos = candidatos_arquivamento(horizonte_dias)
+    arquivados, ultimo = 0, 0
+    while True:
+        ids = list(candidatos.filter(pk__gt=ultimo).order_by('pk').values_list('pk', flat=True)[:lote])
+        if not ids:
+            break
+        with transaction.atomic():
+            # status repetido no UPDATE: um protocolo reaberto no meio do lote fica de fora
+            arquivados += Protocolo.objects.filter(pk__in=ids, status='finalizado').update(arquivado=True)
+        ultimo = ids[-1]
+        if progresso:
+            progresso(arquivados)
+
+    if arquivados:
+        invalidar_cache_busca()
+        invalidar_ultimos_protocolos()
+    return arquivados
@@ -0,0 +1,209 @@
+"""
+Busca global de protocolos e clientes.
+
+No PostgreSQL cada protocolo mantém um `search_vector` (BUIC, descrição,
+clientes e histórico de atualizações) indexado com GIN, e os campos buscados
+por trecho (BUIC, descrição, nome e email do cliente) têm índices de
+trigramas, que atendem ao `icontains` sem varrer a tabela. O vetor só casa
+inícios de palavras; o `icontains` mantém os trechos no meio de uma palavra
+(ex.: "empresa" em "fulano@empresa.com.br"), como nos outros bancos. O vetor é atualizado de forma
+incremental pelos sinais em signals.py; o texto dos históricos compactados
+entra pelo vetor guardado junto de cada um (ver compactacao.py). Em outros bancos (ex.: SQLite nos
+testes) a busca cai para `icontains`, ainda sem o JOIN + DISTINCT antigo, e
+não alcança os históricos compactados.
+
+As páginas de resultados e do autocomplete ficam nos caches "busca" e
+"autocomplete", com chaves versionadas: qualquer alteração em dados buscáveis
+troca a versão após o commit e invalida todos os resultados de uma vez.
+"""
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connections, router, transaction
+from django.db.models import F, Q
+
+from .cache import cache_nomeado, chave_versionada, invalidar_grupo
+from .models import Atualizacao, Cliente, HistoricoCompactado, Protocolo
+
+CONFIGURACAO_BUSCA = 'portuguese'
+MAIOR_NUMERO = 2 ** 31 - 1
+LOTE_INDICE = 1000  # protocolos por UPDATE em reindexar_protocolos
+
+cache_busca = cache_nomeado('busca')
+cache_autocomplete = cache_nomeado('autocomplete')
+GRUPO_BUSCA = 'protocolos:busca'
+GRUPO_AUTOCOMPLETE = 'protocolos:autocomplete'
+
+
+def chave_busca(*partes):
+    return chave_versionada(cache_busca, GRUPO_BUSCA, *partes)
+
+
+def chave_autocomplete(*partes):
+    return chave_versionada(cache_autocomplete, GRUPO_AUTOCOMPLETE, *partes)
+
+
+def invalidar_cache_busca():
+    invalidar_grupo(cache_busca, GRUPO_BUSCA)
+
+
+def invalidar_cache_clientes():
+    invalidar_grupo(cache_autocomplete, GRUPO_AUTOCOMPLETE)
+    invalidar_cache_busca()
+
+
+def _usa_postgres(model):
+    return connections[router.db_for_read(model)].vendor == 'postgresql'
+
+
+def _filtro_numero(termo):
+    # isascii: isdigit() também aceita '²' e outros dígitos que int() rejeita
+    if termo.isascii() and termo.isdigit() and int(termo) <= MAIOR_NUMERO:
+        return Q(numero=int(termo))
+    return Q()
+
+
+def filtro_clientes(termo):
+    termo = termo.strip()
+    return Q(nome__icontains=termo) | Q(email__icontains=termo)
+
+
+def buscar_clientes(termo):
+    return Cliente.objects.filter(filtro_clientes(termo))
+
+
+def _consulta_prefixos(termo):
+    """Casa o início de cada palavra (ex.: "empr" encontra "Empresa")"""
+    palavras = re.findall(r'[^\W_]+', termo)
+    if not palavras:
+        return None
+    return SearchQuery(
+        ' & '.join(f'{palavra}:*' for palavra in palavras),
+        config=CONFIGURACAO_BUSCA,
+        search_type='raw',
+    )
+
+
+def filtro_protocolos(termo):
+    """
+    Condição de busca de protocolos, para aplicar sobre qualquer queryset de
+    Protocolo (ex.: o do admin) sem JOIN e, portanto, sem linhas duplicadas.
+    """
+    termo = termo.strip()
+    Vinculo = Protocolo.clientes.through
+    por_cliente = Q(pk__in=Vinculo.objects.filter(cliente__in=buscar_clientes(termo)).values('protocolo_id'))
+    filtro = (
+        _filtro_numero(termo) | Q(buic_dispositivo__icontains=termo)
+        | Q(descricao_problema__icontains=termo) | por_cliente
+    )
+
+    if _usa_postgres(Protocolo):
+        # Todos os ramos do OR têm índice próprio (btree, GIN do vetor e
+        # trigramas), o que permite um BitmapOr em vez de varrer a tabela.
+        # O histórico (inclusive o compactado) só entra pelo vetor.
+        consulta = _consulta_prefixos(termo)
+        return filtro if consulta is None else filtro | Q(search_vector=consulta)
+
+    por_atualizacao = Q(pk__in=Atualizacao.objects.filter(descricao__icontains=termo).values('protocolo_id'))
+    return filtro | por_atualizacao
+
+
+def buscar_protocolos(termo, relevancia=True):
+    """
+    Protocolos que casam com `termo`. No PostgreSQL, com `relevancia`, vêm
+    anotados com `rank` e ordenados por ele; sem, a ordenação fica a cargo de
+    quem chama (ex.: paginação por data de criação).
+    """
+    protocolos = Protocolo.objects.filter(filtro_protocolos(termo))
+    consulta = _consulta_prefixos(termo.strip()) if relevancia and _usa_postgres(Protocolo) else None
+    if consulta is None:
+        return protocolos
+    return (
+        protocolos.annotate(rank=SearchRank(F('search_vector'), consulta))
+        .order_by('-rank', '-data_criacao')
+    )
+
+
+def atualizar_indice_busca(protocolo_ids=None):
+    """
+    Recalcula o `search_vector` dos protocolos informados (todos se None).
+    Fora do PostgreSQL apenas invalida os resultados em cache.
+    """
+    if protocolo_ids is not None:
+        protocolo_ids = list(protocolo_ids)
+        if not protocolo_ids:
+            return
+    transaction.on_commit(invalidar_cache_busca, using=router.db_for_write(Protocolo))
+    if not _usa_postgres(Protocolo):
+        return
+
+    connection = connections[router.db_for_write(Protocolo)]
+    nome = connection.ops.quote_name
+    protocolo = nome(Protocolo._meta.db_table)
+    vinculo = nome(Protocolo.clientes.through._meta.db_table)
+    cliente = nome(Cliente._meta.db_table)
+    atualizacao = nome(Atualizacao._meta.db_table)
+    compactado = nome(HistoricoCompactado._meta.db_table)
+
+    sql = f"""
+        UPDATE {protocolo} AS p SET search_vector =
+            setweight(to_tsvector(%(config)s::regconfig, p.buic_dispositivo), 'A') ||
+            setweight(to_tsvector(%(config)s::regconfig, p.descricao_problema), 'B') ||
+            setweight(to_tsvector(%(config)s::regconfig, coalesce((
+                SELECT string_agg(c.nome || ' ' || c.email, ' ')
+                FROM {vinculo} pc JOIN {cliente} c ON c.id = pc.cliente_id
+                WHERE pc.protocolo_id = p.id
+            ), '')), 'B') ||
+            setweight(to_tsvector(%(config)s::regconfig, coalesce((
+                SELECT string_agg(a.descricao, ' ')
+                FROM {atualizacao} a WHERE a.protocolo_id = p.id
+            ), '')), 'C') ||
+            setweight(coalesce((
+                SELECT h.search_vector FROM {compactado} h WHERE h.protocolo_id = p.id
+            ), ''::tsvector), 'C')
+    """
+    parametros = {'config': CONFIGURACAO_BUSCA}
+    if protocolo_ids is not None:
+        sql += " WHERE p.id = ANY(%(ids)s)"
+        parametros['ids'] = protocolo_ids
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, parametros)
+
+
+def reindexar_protocolos(protocolos, lote=LOTE_INDICE):
+    """
+    atualizar_indice_busca para os protocolos de um queryset, em lotes de
+    `lote` ids por faixa de pk, sem carregar todos os ids nem montar um único
+    UPDATE para todos (ex.: cliente com muitos protocolos).
+    """
+    if not _usa_postgres(Protocolo):
+        transaction.on_commit(invalidar_cache_busca, using=router.db_for_write(Protocolo))
+        return
+    ultimo = 0
+    while True:
+        ids = list(protocolos.filter(pk__gt=ultimo).order_by('pk').values_list('pk', flat=True)[:lote])
+        if not ids:
+            break
+        atualizar_indice_busca(ids)
+        ultimo = ids[-1]
+
+
+def indexar_historicos_compactados(protocolo_ids):
+    """
+    Acrescenta ao vetor de cada histórico compactado o texto das atualizações
+    que ainda estão na tabela; chamar antes de removê-las. Só no PostgreSQL.
+    """
+    if not _usa_postgres(HistoricoCompactado):
+        return
+    connection = connections[router.db_for_write(HistoricoCompactado)]
+    nome = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            UPDATE {nome(HistoricoCompactado._meta.db_table)} AS h SET search_vector =
+                coalesce(h.search_vector, ''::tsvector) || to_tsvector(%(config)s::regconfig, coalesce((
+                    SELECT string_agg(a.descricao, ' ')
+                    FROM {nome(Atualizacao._meta.db_table)} a WHERE a.protocolo_id = h.protocolo_id
+                ), ''))
+            WHERE h.protocolo_id = ANY(%(ids)s)
+        """, {'config': CONFIGURACAO_BUSCA, 'ids': list(protocolo_ids)})
@@ -0,0 +1,286 @@
+"""
+Camada de cache do projeto.
+
+Os caches nomeados (contadores, busca, autocomplete e o default) são
+configurados em settings.CACHES; o backend é escolhido por
+PROTOCOLOS_CACHE_BACKEND e pode ser o SQLiteCache abaixo, que é compartilhado
+entre os workers da mesma máquina sem depender de nenhum serviço externo.
+
+cache_nomeado() devolve o cache com contagem de acertos e faltas por alias,
+exposta na view estatisticas_instrumentacao.
+"""
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+# Um acesso só é regravado se o anterior tiver mais que isto (segundos):
+# a ordem LRU fica aproximada, mas leituras seguidas não viram escritas
+RESOLUCAO_LRU = 1.0
+MAIOR_INTEIRO = 2 ** 63 - 1
+
+
+class SQLiteCache(BaseCache):
+    """
+    Cache em um arquivo SQLite (WAL e mmap), compartilhado pelos processos da máquina.
+
+    Cada entrada guarda a expiração e o último acesso; ao passar de MAX_ENTRIES
+    as expiradas são removidas e, se ainda preciso, 1/CULL_FREQUENCY das
+    entradas menos acessadas recentemente (LRU). Inteiros são gravados como
+    INTEGER para que incr() seja um único UPDATE atômico entre processos.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._arquivo = Path(location)
+        self._mmap = int(params.get('OPTIONS', {}).get('MMAP_SIZE', 64 * 1024 * 1024))
+        self._local = threading.local()
+
+    def _conexao(self):
+        conexao = getattr(self._local, 'conexao', None)
+        # Depois de um fork (gunicorn --preload) a conexão herdada não pode ser reutilizada
+        if conexao is None or self._local.pid != os.getpid():
+            self._arquivo.parent.mkdir(parents=True, exist_ok=True)
+            conexao = sqlite3.connect(self._arquivo, timeout=5, isolation_level=None, check_same_thread=False)
+            conexao.execute('PRAGMA journal_mode=WAL')
+            conexao.execute('PRAGMA synchronous=NORMAL')
+            conexao.execute(f'PRAGMA mmap_size={self._mmap}')
+            conexao.execute(
+                'CREATE TABLE IF NOT EXISTS cache ('
+                'chave TEXT PRIMARY KEY, valor BLOB NOT NULL, expira REAL, acesso REAL NOT NULL'
+                ') WITHOUT ROWID'
+            )
+            conexao.execute('CREATE INDEX IF NOT EXISTS cache_acesso ON cache (acesso)')
+            self._local.conexao, self._local.pid = conexao, os.getpid()
+        return conexao
+
+    @staticmethod
+    def _codificar(valor):
+        if type(valor) is int and -MAIOR_INTEIRO <= valor <= MAIOR_INTEIRO:
+            return valor
+        return pickle.dumps(valor, pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def _decodificar(valor):
+        return valor if isinstance(valor, int) else pickle.loads(valor)
+
+    def _gravar(self, chave, valor, timeout, apenas_se_ausente=False):
+        agora = time.time()
+        sql = (
+            'INSERT INTO cache (chave, valor, expira, acesso) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT (chave) DO UPDATE SET valor = excluded.valor, expira = excluded.expira, '
+            'acesso = excluded.acesso'
+        )
+        if apenas_se_ausente:
+            sql += ' WHERE cache.expira IS NOT NULL AND cache.expira <= ?'
+            parametros = (chave, self._codificar(valor), self.get_backend_timeout(timeout), agora, agora)
+        else:
+            parametros = (chave, self._codificar(valor), self.get_backend_timeout(timeout), agora)
+        gravou = self._conexao().execute(sql, parametros).rowcount > 0
+        if gravou:
+            self._cull()
+        return gravou
+
+    def _cull(self):
+        if not self._max_entries:
+            return
+        conexao = self._conexao()
+        if conexao.execute('SELECT COUNT(*) FROM cache').fetchone()[0] <= self._max_entries:
+            return
+        conexao.execute('DELETE FROM cache WHERE expira IS NOT NULL AND expira <= ?', (time.time(),))
+        total = conexao.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if total <= self._max_entries:
+            return
+        if self._cull_frequency == 0:
+            conexao.execute('DELETE FROM cache')
+            return
+        conexao.execute(
+            'DELETE FROM cache WHERE chave IN (SELECT chave FROM cache ORDER BY acesso LIMIT ?)',
+            (max(total // self._cull_frequency, total - self._max_entries),),
+        )
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        chave = self.make_and_validate_key(key, version=version)
+        return self._gravar(chave, value, timeout, apenas_se_ausente=True)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        chave = self.make_and_validate_key(key, version=version)
+        self._gravar(chave, value, timeout)
+
+    def get(self, key, default=None, version=None):
+        return self.get_many([key], version=version).get(key, default)
+
+    def get_many(self, keys, version=None):
+        chaves = {self.make_and_validate_key(key, version=version): key for key in keys}
+        if not chaves:
+            return {}
+        agora = time.time()
+        conexao = self._conexao()
+        linhas = conexao.execute(
+            f"SELECT chave, valor, acesso FROM cache WHERE chave IN ({', '.join('?' * len(chaves))}) "
+            f"AND (expira IS NULL OR expira > ?)",
+            (*chaves, agora),
+        ).fetchall()
+        antigas = [chave for chave, _, acesso in linhas if agora - acesso > RESOLUCAO_LRU]
+        if antigas:
+            conexao.execute(
+                f"UPDATE cache SET acesso = ? WHERE chave IN ({', '.join('?' * len(antigas))})",
+                (agora, *antigas),
+            )
+        return {chaves[chave]: self._decodificar(valor) for chave, valor, _ in linhas}
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        chave = self.make_and_validate_key(key, version=version)
+        return self._conexao().execute(
+            'UPDATE cache SET expira = ? WHERE chave = ? AND (expira IS NULL OR expira > ?)',
+            (self.get_backend_timeout(timeout), chave, time.time()),
+        ).rowcount > 0
+
+    def delete(self, key, version=None):
+        chave = self.make_and_validate_key(key, version=version)
+        return self._conexao().execute('DELETE FROM cache WHERE chave = ?', (chave,)).rowcount > 0
+
+    def has_key(self, key, version=None):
+        chave = self.make_and_validate_key(key, version=version)
+        return self._conexao().execute(
+            'SELECT 1 FROM cache WHERE chave = ? AND (expira IS NULL OR expira > ?)', (chave, time.time())
+        ).fetchone() is not None
+
+    def incr(self, key, delta=1, version=None):
+        chave = self.make_and_validate_key(key, version=version)
+        # fetchall() conclui o comando e libera a trava de escrita do arquivo
+        linhas = self._conexao().execute(
+            "UPDATE cache SET valor = valor + ? WHERE chave = ? AND typeof(valor) = 'integer' "
+            "AND (expira IS NULL OR expira > ?) RETURNING valor",
+            (delta, chave, time.time()),
+        ).fetchall()
+        if not linhas:
+            raise ValueError(f"Key '{key}' not found.")
+        return linhas[0][0]
+
+    def clear(self):
+        self._conexao().execute('DELETE FROM cache')
+
+    def __len__(self):
+        return self._conexao().execute(
+            'SELECT COUNT(*) FROM cache WHERE expira IS NULL OR expira > ?', (time.time(),)
+        ).fetchone()[0]
+
+
+_AUSENTE = object()
+_trava = threading.Lock()
+_contagem = defaultdict(Counter)
+
+
+class CacheInstrumentado:
+    """Repassa tudo para caches[alias], contando acertos e faltas das leituras"""
+
+    def __init__(self, alias):
+        self.alias = alias
+
+    @property
+    def _cache(self):
+        # caches[...] é por thread; sem o alias configurado, usa o default
+        return caches[self.alias if self.alias in settings.CACHES else DEFAULT_CACHE_ALIAS]
+
+    def __getattr__(self, nome):
+        return getattr(self._cache, nome)
+
+    def _registrar(self, acertos, faltas):
+        with _trava:
+            _contagem[self.alias].update(acertos=acertos, faltas=faltas)
+
+    def get(self, key, default=None, version=None):
+        valor = self._cache.get(key, _AUSENTE, version=version)
+        if valor is _AUSENTE:
+            self._registrar(0, 1)
+            return default
+        self._registrar(1, 0)
+        return valor
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        encontrados = self._cache.get_many(keys, version=version)
+        self._registrar(len(encontrados), len(keys) - len(encontrados))
+        return encontrados
+
+    async def aget(self, key, default=None, version=None):
+        valor = await self._cache.aget(key, _AUSENTE, version=version)
+        if valor is _AUSENTE:
+            self._registrar(0, 1)
+            return default
+        self._registrar(1, 0)
+        return valor
+
+    def get_or_set(self, key, default, timeout=DEFAULT_TIMEOUT, version=None):
+        valor = self.get(key, _AUSENTE, version=version)
+        if valor is _AUSENTE:
+            valor = default() if callable(default) else default
+            self._cache.set(key, valor, timeout, version=version)
+        return valor
+
+
+_instancias = {}
+
+
+def cache_nomeado(alias):
+    if alias not in _instancias:
+        _instancias[alias] = CacheInstrumentado(alias)
+    return _instancias[alias]
+
+
+def versao_grupo(cache, grupo):
+    """Versão atual de um grupo de chaves; incluída nas chaves, invalida todas de uma vez"""
+    versao = cache.get(f'{grupo}:versao')
+    if versao is None:
+        versao = invalidar_grupo(cache, grupo)
+    return versao
+
+
+def invalidar_grupo(cache, grupo):
+    """Troca a versão do grupo; um valor novo nunca coincide com um anterior"""
+    versao = time.time_ns()
+    cache.set(f'{grupo}:versao', versao, None)
+    return versao
+
+
+def invalidar_grupos(cache, grupos):
+    """Como invalidar_grupo para vários grupos, com uma única operação no cache"""
+    # Sem a chave, versao_grupo gera uma versão nova na próxima leitura
+    cache.delete_many([f'{grupo}:versao' for grupo in grupos])
+
+
+def chave_versionada(cache, grupo, *partes):
+    """Chave do grupo para os valores em `partes` (qualquer dado serializável em JSON)"""
+    resumo = hashlib.sha1(json.dumps(partes, sort_keys=True, default=str).encode()).hexdigest()
+    return f'{grupo}:{versao_grupo(cache, grupo)}:{resumo}'
+
+
+def resumo_caches():
+    with _trava:
+        contagem = {alias: dict(valores) for alias, valores in _contagem.items()}
+    resumo = {}
+    for alias in settings.CACHES:
+        acertos = contagem.get(alias, {}).get('acertos', 0)
+        faltas = contagem.get(alias, {}).get('faltas', 0)
+        resumo[alias] = {
+            'backend': settings.CACHES[alias]['BACKEND'].rsplit('.', 1)[-1],
+            'acertos': acertos,
+            'faltas': faltas,
+            'taxa_acerto': round(acertos / (acertos + faltas), 3) if acertos + faltas else None,
+        }
+    return resumo
+
+
+def zerar_contagem():
+    with _trava:
+        _contagem.clear()
@@ -0,0 +1,155 @@
+"""
+Compactação do histórico de protocolos finalizados.
+
+Depois de finalizado, o histórico de um protocolo não muda mais, mas cada
+atualização continua ocupando uma linha, com entradas nos índices e chave
+estrangeira para User. compactar_historicos junta as atualizações de cada
+protocolo finalizado há mais de PROTOCOLOS_COMPACTAR_APOS_DIAS em um
+HistoricoCompactado (JSON comprimido com zlib ou zstd) e remove as linhas.
+Atualizações feitas depois disso voltam a ser linhas comuns e entram no
+mesmo HistoricoCompactado na próxima compactação.
+
+A leitura passa por historico.py, que junta as duas origens. Reabrir o
+protocolo (Protocolo.save ou a transição "reabrir") chama reidratar_historicos,
+que recria as linhas com os ids originais.
+"""
+import datetime
+from collections import defaultdict
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from .busca import atualizar_indice_busca, indexar_historicos_compactados
+from .historico import invalidar_historicos
+from .models import Atualizacao, HistoricoCompactado, Protocolo
+
+CAMPOS_REGISTRO = ('pk', 'protocolo_id', 'usuario_id', 'usuario__username', 'data_hora', 'descricao')
+
+
+@dataclass
+class ResultadoCompactacao:
+    protocolos: int = 0
+    atualizacoes: int = 0
+    bytes_json: int = 0
+    bytes_comprimidos: int = 0
+
+    @property
+    def proporcao(self):
+        return self.bytes_comprimidos / self.bytes_json if self.bytes_json else 0
+
+
+def candidatos_compactacao(dias=None):
+    """Protocolos finalizados há mais de `dias` com atualizações ainda em linhas"""
+    if dias is None:
+        dias = settings.PROTOCOLOS_COMPACTAR_APOS_DIAS
+    limite = timezone.now() - datetime.timedelta(days=dias)
+    return Protocolo.objects.filter(
+        status='finalizado',
+        data_finalizacao__lt=limite,
+        pk__in=Atualizacao.objects.values('protocolo_id'),
+    )
+
+
+def _compactar_lote(ids, formato, using, resultado):
+    with transaction.atomic(using=using):
+        # Trava os protocolos: uma reabertura concorrente espera o lote terminar
+        ids = list(
+            Protocolo.objects.using(using)
+            .filter(pk__in=ids, status='finalizado')
+            .order_by('pk')
+            .select_for_update()
+            .values_list('pk', flat=True)
+        )
+        if not ids:
+            return
+
+        registros = defaultdict(list)
+        for historico in HistoricoCompactado.objects.using(using).filter(protocolo_id__in=ids):
+            registros[historico.protocolo_id] = historico.registros()
+        novas = (
+            Atualizacao.objects.using(using)
+            .filter(protocolo_id__in=ids)
+            .order_by('protocolo_id', 'data_hora', 'pk')
+            .values_list(*CAMPOS_REGISTRO)
+        )
+        for pk, protocolo_id, usuario_id, username, data_hora, descricao in novas:
+            registros[protocolo_id].append([pk, usuario_id, username, data_hora.isoformat(), descricao])
+            resultado.atualizacoes += 1
+
+        historicos = []
+        for protocolo_id, itens in registros.items():
+            dados, tamanho = HistoricoCompactado.comprimir(itens, formato)
+            historicos.append(HistoricoCompactado(
+                protocolo_id=protocolo_id, formato=formato, dados=dados,
+                quantidade=len(itens), tamanho_original=tamanho,
+            ))
+            resultado.bytes_json += tamanho
+            resultado.bytes_comprimidos += len(dados)
+        HistoricoCompactado.objects.using(using).bulk_create(
+            historicos,
+            update_conflicts=True,
+            unique_fields=['protocolo'],
+            update_fields=['formato', 'dados', 'quantidade', 'tamanho_original', 'data_compactacao'],
+        )
+        indexar_historicos_compactados(ids)
+        # DELETE direto: o delete() comum carregaria cada linha para disparar
+        # os sinais de Atualizacao, e o índice de busca já tem esse texto
+        nome = connections[using].ops.quote_name
+        tabela = nome(Atualizacao._meta.db_table)
+        coluna = nome(Atualizacao._meta.get_field('protocolo').column)
+        with connections[using].cursor() as cursor:
+            cursor.execute(f'DELETE FROM {tabela} WHERE {coluna} IN ({", ".join(["%s"] * len(ids))})', ids)
+        resultado.protocolos += len(ids)
+        transaction.on_commit(lambda: invalidar_historicos(ids), using=using)
+
+
+def compactar_historicos(dias=None, lote=500, formato=None, progresso=None):
+    """
+    Compacta o histórico dos candidatos (ver candidatos_compactacao), `lote`
+    protocolos por transação, e retorna um ResultadoCompactacao.
+    `progresso`, se informado, é chamado com o resultado parcial.
+    """
+    formato = formato or settings.PROTOCOLOS_HISTORICO_COMPRESSAO
+    using = router.db_for_write(Protocolo)
+    candidatos = candidatos_compactacao(dias)
+    resultado = ResultadoCompactacao()
+    ultimo = 0
+    while True:
+        ids = list(candidatos.filter(pk__gt=ultimo).order_by('pk').values_list('pk', flat=True)[:lote])
+        if not ids:
+            break
+        _compactar_lote(ids, formato, using, resultado)
+        ultimo = ids[-1]
+        if progresso:
+            progresso(resultado)
+    return resultado
+
+
+def reidratar_historicos(protocolo_ids, using=None):
+    """
+    Devolve à tabela de atualizações, com os ids originais, o histórico
+    compactado dos protocolos informados. Retorna quantas foram recriadas.
+    """
+    using = using or router.db_for_write(HistoricoCompactado)
+    historicos = list(HistoricoCompactado.objects.using(using).filter(protocolo_id__in=protocolo_ids))
+    if not historicos:
+        return 0
+
+    atualizacoes = [atualizacao for historico in historicos for atualizacao in historico.atualizacoes()]
+    # Atualizações de usuários removidos teriam saído junto com eles (CASCADE)
+    usuarios = set(
+        User.objects.using(using)
+        .filter(pk__in={atualizacao.usuario_id for atualizacao in atualizacoes})
+        .values_list('pk', flat=True)
+    )
+    atualizacoes = [atualizacao for atualizacao in atualizacoes if atualizacao.usuario_id in usuarios]
+    ids = [historico.protocolo_id for historico in historicos]
+    with transaction.atomic(using=using):
+        Atualizacao.objects.using(using).bulk_create(atualizacoes)
+        HistoricoCompactado.objects.using(using).filter(protocolo_id__in=ids).delete()
+        atualizar_indice_busca(ids)
+        transaction.on_commit(lambda: invalidar_historicos(ids), using=using)
+    return len(atualizacoes)
@@ -0,0 +1,83 @@
+"""
+Cache dos dados exibidos no dashboard.
+
+Os contadores por status ficam em chaves separadas no cache e são ajustados
+com incr/decr pelos sinais de Protocolo (ver signals.py), então em regime
+normal o dashboard não consulta o banco. Se alguma chave se perder, todos os
+contadores são recalculados com uma única consulta agregada.
+"""
+from django.db.models import Count, Q
+
+from .cache import cache_nomeado
+from .models import Protocolo
+from .roteamento import no_principal
+
+cache = cache_nomeado('contadores')
+
+TEMPO_CACHE = 300  # limita a defasagem caso algum ajuste se perca
+CHAVE_ULTIMOS = 'protocolos:ultimos'
+QUANTIDADE_ULTIMOS = 5
+
+STATUS = [status for status, _ in Protocolo.STATUS_CHOICES]
+CHAVES = {nome: f'protocolos:contador:{nome}' for nome in ['total', *STATUS]}
+
+
+def calcular_contadores():
+    """Conta o total e cada status em uma única consulta com agregação condicional"""
+    return Protocolo.objects.aggregate(
+        total=Count('pk'),
+        **{status: Count('pk', filter=Q(status=status)) for status in STATUS},
+    )
+
+
+def obter_contadores():
+    """Retorna {'total': ..., 'aberto': ..., ...}, do cache sempre que possível"""
+    em_cache = cache.get_many(CHAVES.values())
+    if len(em_cache) == len(CHAVES):
+        return {nome: em_cache[chave] for nome, chave in CHAVES.items()}
+
+    # Do principal: os sinais ajustam estes valores a partir daqui
+    with no_principal():
+        contadores = calcular_contadores()
+    cache.set_many({CHAVES[nome]: valor for nome, valor in contadores.items()}, TEMPO_CACHE)
+    return contadores
+
+
+def ajustar_contadores(variacoes):
+    """
+    Aplica variações por status, ex.: {'aberto': -1, 'em_andamento': 1}.
+    O total é ajustado pela soma das variações.
+    """
+    variacoes = {status: delta for status, delta in variacoes.items() if delta}
+    total = sum(variacoes.values())
+    if total:
+        variacoes['total'] = total
+
+    for nome, delta in variacoes.items():
+        try:
+            cache.incr(CHAVES[nome], delta)
+        except ValueError:
+            # Chave expirada ou ausente: recalcula tudo na próxima leitura
+            invalidar_contadores()
+            return
+
+
+def invalidar_contadores():
+    cache.delete_many(CHAVES.values())
+
+
+def obter_ultimos_protocolos():
+    """Últimos protocolos criados, já com o usuário criador carregado"""
+    ultimos = cache.get(CHAVE_ULTIMOS)
+    if ultimos is None:
+        with no_principal():
+            ultimos = list(
+                Protocolo.objects.quentes().select_related('usuario_criador')
+                .order_by('-data_criacao')[:QUANTIDADE_ULTIMOS]
+            )
+        cache.set(CHAVE_ULTIMOS, ultimos, TEMPO_CACHE)
+    return ultimos
+
+
+def invalidar_ultimos_protocolos():
+    cache.delete(CHAVE_ULTIMOS)
@@ -0,0 +1,215 @@
+"""
+Arquivos estáticos servidos pela própria aplicação.
+
+- ArmazenamentoComprimido: ManifestStaticFilesStorage (nomes com o hash do
+  conteúdo) que, no collectstatic, grava ao lado de cada arquivo uma versão
+  .gz e, se o pacote brotli estiver instalado, uma .br.
+- EstaticosMiddleware: serve STATIC_ROOT antes das sessões e da autenticação,
+  escolhendo a versão comprimida pelo Accept-Encoding. Arquivos com hash no
+  nome recebem cache de um ano (immutable); os demais, cache curto.
+- VENDOR: bibliotecas de terceiros usadas pelos templates. jQuery e select2
+  vêm do próprio admin do Django; as demais são baixadas uma vez para
+  protocolos/static/protocolos/vendor pelo comando baixar_estaticos. Enquanto
+  um arquivo não estiver lá, a tag {% vendor %} aponta para o CDN.
+"""
+import functools
+import gzip
+import mimetypes
+import os
+import posixpath
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+CDN = 'https://cdn.jsdelivr.net/npm'
+
+# nome -> (caminho em static, URL de origem)
+VENDOR = {
+    'jquery.js': ('admin/js/vendor/jquery/jquery.min.js', f'{CDN}/jquery@3.7.1/dist/jquery.min.js'),
+    'select2.js': ('admin/js/vendor/select2/select2.full.min.js', f'{CDN}/select2@4.0.13/dist/js/select2.full.min.js'),
+    'select2.css': ('admin/css/vendor/select2/select2.min.css', f'{CDN}/select2@4.0.13/dist/css/select2.min.css'),
+    'bootstrap.css': (
+        'protocolos/vendor/bootstrap/bootstrap.min.css', f'{CDN}/bootstrap@5.3.3/dist/css/bootstrap.min.css',
+    ),
+    'bootstrap.js': (
+        'protocolos/vendor/bootstrap/bootstrap.bundle.min.js', f'{CDN}/bootstrap@5.3.3/dist/js/bootstrap.bundle.min.js',
+    ),
+    'bootstrap-icons.css': (
+        'protocolos/vendor/bootstrap-icons/bootstrap-icons.min.css',
+        f'{CDN}/bootstrap-icons@1.11.0/font/bootstrap-icons.min.css',
+    ),
+    'bootstrap-icons.woff2': (
+        'protocolos/vendor/bootstrap-icons/fonts/bootstrap-icons.woff2',
+        f'{CDN}/bootstrap-icons@1.11.0/font/fonts/bootstrap-icons.woff2',
+    ),
+    'bootstrap-icons.woff': (
+        'protocolos/vendor/bootstrap-icons/fonts/bootstrap-icons.woff',
+        f'{CDN}/bootstrap-icons@1.11.0/font/fonts/bootstrap-icons.woff',
+    ),
+    'chart.js': ('protocolos/vendor/chart.js/chart.umd.min.js', f'{CDN}/chart.js@4.4.4/dist/chart.umd.min.js'),
+}
+
+# Formatos que já são comprimidos
+SEM_COMPRESSAO = {'.gz', '.br', '.zip', '.png', '.jpg', '.jpeg', '.gif', '.webp', '.ico', '.woff', '.woff2'}
+TAMANHO_MINIMO = 200  # bytes; abaixo disso os cabeçalhos custam mais que a economia
+CACHE_IMUTAVEL = 'public, max-age=31536000, immutable'
+CACHE_CURTO = 'public, max-age=60'
+
+
+@functools.lru_cache(maxsize=None)
+def url_vendor(nome):
+    """URL local da biblioteca, se ela estiver em static; senão, a do CDN"""
+    caminho, origem = VENDOR[nome]
+    if finders.find(caminho):
+        return staticfiles_storage.url(caminho)
+    return origem
+
+
+def comprimir_arquivo(caminho):
+    """Grava caminho.gz (e caminho.br) quando a compressão compensa; retorna as extensões gravadas"""
+    if os.path.splitext(caminho)[1].lower() in SEM_COMPRESSAO:
+        return []
+    with open(caminho, 'rb') as arquivo:
+        conteudo = arquivo.read()
+    if len(conteudo) < TAMANHO_MINIMO:
+        return []
+
+    versoes = {'.gz': gzip.compress(conteudo, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        versoes['.br'] = brotli.compress(conteudo)
+    gravadas = []
+    for extensao, comprimido in versoes.items():
+        if len(comprimido) < len(conteudo) * 0.95:
+            with open(caminho + extensao, 'wb') as arquivo:
+                arquivo.write(comprimido)
+            gravadas.append(extensao)
+    return gravadas
+
+
+class ArmazenamentoComprimido(ManifestStaticFilesStorage):
+    def post_process(self, paths, dry_run=False, **options):
+        gerados = set()
+        for nome, nome_com_hash, processado in super().post_process(paths, dry_run, **options):
+            if nome_com_hash and not isinstance(processado, Exception):
+                gerados.update((nome, nome_com_hash))
+            yield nome, nome_com_hash, processado
+        if dry_run:
+            return
+        for nome in sorted(gerados):
+            comprimir_arquivo(self.path(nome))
+
+
+@dataclass(frozen=True)
+class ArquivoEstatico:
+    caminho: str
+    tipo: str
+    tamanho: int
+    modificado: float
+    imutavel: bool
+    comprimidos: tuple  # (codificação, caminho), na ordem de preferência
+
+
+@functools.lru_cache(maxsize=1)
+def _nomes_com_hash():
+    # O manifesto só existe depois do collectstatic com ArmazenamentoComprimido
+    if not isinstance(staticfiles_storage, ManifestStaticFilesStorage):
+        return frozenset()
+    return frozenset(staticfiles_storage.hashed_files.values())
+
+
+@functools.lru_cache(maxsize=4096)
+def localizar(relativo):
+    """ArquivoEstatico em STATIC_ROOT (ou None), consultado uma vez por caminho e processo"""
+    if not settings.STATIC_ROOT or relativo.endswith(('.gz', '.br')):
+        return None
+    try:
+        caminho = safe_join(settings.STATIC_ROOT, relativo)
+    except SuspiciousFileOperation:
+        return None
+    if not os.path.isfile(caminho):
+        return None
+    estado = os.stat(caminho)
+    tipo, _ = mimetypes.guess_type(caminho)
+    comprimidos = tuple(
+        (codificacao, caminho + extensao)
+        for codificacao, extensao in (('br', '.br'), ('gzip', '.gz'))
+        if os.path.isfile(caminho + extensao)
+    )
+    return ArquivoEstatico(
+        caminho=caminho,
+        tipo=tipo or 'application/octet-stream',
+        tamanho=estado.st_size,
+        modificado=estado.st_mtime,
+        imutavel=relativo in _nomes_com_hash(),
+        comprimidos=comprimidos,
+    )
+
+
+@receiver(setting_changed)
+def _limpar_caches(*, setting, **kwargs):
+    # override_settings nos testes e o collectstatic para outro STATIC_ROOT
+    if setting in ('STATIC_ROOT', 'STATIC_URL', 'STORAGES'):
+        url_vendor.cache_clear()
+        _nomes_com_hash.cache_clear()
+        localizar.cache_clear()
+
+
+def _aceita(request, codificacao):
+    aceitas = request.META.get('HTTP_ACCEPT_ENCODING', '')
+    return any(parte.split(';')[0].strip() == codificacao for parte in aceitas.split(','))
+
+
+class EstaticosMiddleware:
+    """
+    Serve os arquivos do collectstatic, no estilo do WhiteNoise. Deve ficar
+    logo depois do SecurityMiddleware, para que os estáticos não carreguem
+    sessão nem usuário.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.prefixo = '/' + settings.STATIC_URL.lstrip('/') if settings.STATIC_URL else None
+
+    def __call__(self, request):
+        if (
+            self.prefixo
+            and request.method in ('GET', 'HEAD')
+            and request.path_info.startswith(self.prefixo)
+        ):
+            arquivo = localizar(posixpath.normpath(request.path_info[len(self.prefixo):]).lstrip('/'))
+            if arquivo is not None:
+                return self.servir(request, arquivo)
+        return self.get_response(request)
+
+    def servir(self, request, arquivo):
+        cabecalhos = {
+            'Cache-Control': CACHE_IMUTAVEL if arquivo.imutavel else CACHE_CURTO,
+            'Last-Modified': http_date(arquivo.modificado),
+        }
+        if arquivo.comprimidos:
+            cabecalhos['Vary'] = 'Accept-Encoding'
+        if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'), arquivo.modificado):
+            return HttpResponseNotModified(headers=cabecalhos)
+
+        caminho, codificacao = arquivo.caminho, None
+        for opcao, comprimido in arquivo.comprimidos:
+            if _aceita(request, opcao):
+                caminho, codificacao = comprimido, opcao
+                break
+        if codificacao:
+            cabecalhos['Content-Encoding'] = codificacao
+        return FileResponse(open(caminho, 'rb'), content_type=arquivo.tipo, headers=cabecalhos)
@@ -0,0 +1,219 @@
+"""
+Feed de eventos em tempo real, enviado ao dashboard por Server-Sent Events.
+
+Os sinais publicam, depois do commit, a criação, a remoção e as mudanças de
+status dos protocolos e as novas atualizações (ver signals.py). Em cada
+processo, um Difusor repassa os eventos às conexões SSE abertas nele. Cada
+conexão tem uma fila limitada (PROTOCOLOS_EVENTOS_FILA). Se o navegador não
+consome a fila a tempo, os eventos pendentes são descartados e a conexão
+recebe "ressincronizar"; a view responde a ele reenviando os contadores
+atuais. A memória por conexão fica, assim, limitada.
+
+Com o PostgreSQL os eventos passam por NOTIFY no canal CANAL_NOTIFY. Cada
+processo escuta o canal (LISTEN) em uma thread com conexão própria, de modo
+que um evento publicado por um worker chega às conexões de todos os outros.
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+from django.utils.text import Truncator
+
+from .models import Atualizacao
+
+logger = logging.getLogger(__name__)
+
+CANAL_NOTIFY = 'protocolos_eventos'
+RESSINCRONIZAR = 'ressincronizar'
+LIMITE_NOTIFY = 8000  # bytes; o PostgreSQL recusa payloads maiores no NOTIFY
+ESPERA_RECONEXAO = 5  # segundos entre tentativas do ouvinte
+
+
+class LimiteConexoes(Exception):
+    pass
+
+
+class Assinatura:
+    """Fila de uma conexão SSE; os eventos são entregues no event loop dela"""
+
+    def __init__(self, tamanho):
+        self.loop = asyncio.get_running_loop()
+        self.fila = asyncio.Queue(maxsize=tamanho)
+
+    def entregar(self, evento):
+        # Executado no loop da assinatura (call_soon_threadsafe)
+        try:
+            self.fila.put_nowait(evento)
+        except asyncio.QueueFull:
+            while not self.fila.empty():
+                self.fila.get_nowait()
+            self.fila.put_nowait({'tipo': RESSINCRONIZAR})
+
+    async def proximo(self, timeout=None):
+        return await asyncio.wait_for(self.fila.get(), timeout)
+
+
+class Difusor:
+    """Repassa cada evento publicado a todas as assinaturas do processo"""
+
+    def __init__(self):
+        self._assinaturas = set()
+        self._trava = threading.Lock()
+
+    def __len__(self):
+        return len(self._assinaturas)
+
+    def lotado(self):
+        return len(self) >= settings.PROTOCOLOS_EVENTOS_MAX_CONEXOES
+
+    def assinar(self):
+        """Cria a assinatura da conexão atual; chamar de dentro do event loop"""
+        with self._trava:
+            if self.lotado():
+                raise LimiteConexoes()
+            assinatura = Assinatura(settings.PROTOCOLOS_EVENTOS_FILA)
+            self._assinaturas.add(assinatura)
+        iniciar_ouvinte()
+        return assinatura
+
+    def cancelar(self, assinatura):
+        with self._trava:
+            self._assinaturas.discard(assinatura)
+
+    def distribuir(self, evento):
+        """Pode ser chamado de qualquer thread"""
+        with self._trava:
+            assinaturas = list(self._assinaturas)
+        for assinatura in assinaturas:
+            try:
+                assinatura.loop.call_soon_threadsafe(assinatura.entregar, evento)
+            except RuntimeError:
+                # Loop já encerrado sem passar pelo cancelar()
+                self.cancelar(assinatura)
+
+
+difusor = Difusor()
+
+
+def _usa_notify():
+    return settings.PROTOCOLOS_EVENTOS_NOTIFY and connections['default'].vendor == 'postgresql'
+
+
+def publicar(tipo, **dados):
+    """
+    Publica um evento para as conexões SSE de todos os processos. Os `dados`
+    devem ser serializáveis em JSON. Chamar depois do commit
+    (transaction.on_commit), para não anunciar o que ainda pode ser desfeito.
+    """
+    evento = {'tipo': tipo, **dados}
+    if _usa_notify():
+        try:
+            with connections['default'].cursor() as cursor:
+                for payload in _payloads_notify(evento):
+                    cursor.execute('SELECT pg_notify(%s, %s)', [CANAL_NOTIFY, payload])
+            return
+        except DatabaseError:
+            logger.exception('Falha no NOTIFY do evento %s; entregue apenas neste processo', tipo)
+    difusor.distribuir(evento)
+
+
+def _payloads_notify(evento):
+    """
+    O evento em um ou mais payloads abaixo de LIMITE_NOTIFY. Uma lista de
+    `ids` grande (ex.: transição em lote) é dividida em vários eventos; as
+    `variacoes` vão só no primeiro, para serem aplicadas uma vez. Sem como
+    dividir, as conexões recebem "ressincronizar".
+    """
+    payload = json.dumps(evento)
+    if len(payload.encode()) < LIMITE_NOTIFY:
+        return [payload]
+    ids = evento.get('ids') or []
+    if len(ids) < 2:
+        return [json.dumps({'tipo': RESSINCRONIZAR})]
+    meio = len(ids) // 2
+    resto = {**evento, 'ids': ids[meio:]}
+    if 'variacoes' in evento:
+        resto['variacoes'] = {}
+    return _payloads_notify({**evento, 'ids': ids[:meio]}) + _payloads_notify(resto)
+
+
+def publicar_atualizacoes(atualizacoes, using=None):
+    """
+    Publica 'atualizacao_criada' para cada atualização, depois do commit.
+    Usado pelo sinal de post_save e por quem cria atualizações com
+    bulk_create, que não o dispara. O número do protocolo e o username vêm
+    das relações já carregadas; para as demais atualizações, de uma única
+    consulta no callback.
+    """
+    carregadas, pendentes = [], []
+    for atualizacao in atualizacoes:
+        if Atualizacao.protocolo.is_cached(atualizacao) and Atualizacao.usuario.is_cached(atualizacao):
+            carregadas.append((atualizacao.protocolo.numero, atualizacao.usuario.username, atualizacao.descricao))
+        elif atualizacao.pk is not None:
+            pendentes.append(atualizacao.pk)
+
+    def publicar_todas():
+        linhas = carregadas
+        if pendentes:
+            linhas = linhas + list(
+                Atualizacao.objects.using(using).filter(pk__in=pendentes)
+                .values_list('protocolo__numero', 'usuario__username', 'descricao')
+            )
+        for numero, usuario, descricao in linhas:
+            publicar('atualizacao_criada', numero=numero, usuario=usuario, descricao=Truncator(descricao).chars(80))
+
+    if carregadas or pendentes:
+        transaction.on_commit(publicar_todas, using=using)
+
+
+_ouvinte = None
+_pid_ouvinte = None
+_trava_ouvinte = threading.Lock()
+
+
+def iniciar_ouvinte():
+    """Inicia, uma vez por processo, a thread que repassa os NOTIFY ao difusor"""
+    global _ouvinte, _pid_ouvinte
+    if not _usa_notify():
+        return
+    with _trava_ouvinte:
+        if _ouvinte is not None and _ouvinte.is_alive() and _pid_ouvinte == os.getpid():
+            return
+        _ouvinte = threading.Thread(target=_escutar, name='protocolos-eventos', daemon=True)
+        _pid_ouvinte = os.getpid()
+        _ouvinte.start()
+
+
+def _parametros_listen():
+    banco = connections['default'].settings_dict
+    return {
+        'host': banco['HOST'],
+        # LISTEN precisa de uma conexão de sessão; o pooler em modo transação não a mantém
+        'port': settings.PROTOCOLOS_EVENTOS_PORTA_LISTEN or banco['PORT'],
+        'dbname': banco['NAME'],
+        'user': banco['USER'],
+        'password': banco['PASSWORD'],
+        'connect_timeout': banco['OPTIONS'].get('connect_timeout', 10),
+        'autocommit': True,
+    }
+
+
+def _escutar():
+    import psycopg
+
+    while True:
+        try:
+            with psycopg.connect(**_parametros_listen()) as conexao:
+                conexao.execute(f'LISTEN {CANAL_NOTIFY}')
+                # Eventos publicados enquanto o ouvinte estava desconectado se perderam
+                difusor.distribuir({'tipo': RESSINCRONIZAR})
+                for notificacao in conexao.notifies():
+                    difusor.distribuir(json.loads(notificacao.payload))
+        except Exception:
+            logger.exception('Ouvinte de eventos desconectado; nova tentativa em %ss', ESPERA_RECONEXAO)
+        time.sleep(ESPERA_RECONEXAO)
@@ -0,0 +1,158 @@
+"""
+Exportação de protocolos.
+
+As linhas são lidas com values_list() em lotes paginados por número (keyset),
+sem instanciar modelos e sem cursor no servidor, que não funciona atrás do
+pooler em modo transação; os nomes dos clientes e o total de atualizações vêm de
+subconsultas agregadas no próprio SELECT. É uma consulta por lote de
+TAMANHO_LOTE protocolos (sem consultas por linha), e a memória fica limitada
+ao tamanho do lote.
+"""
+import csv
+import datetime
+
+from django.db.models import Aggregate, Count, IntegerField, OuterRef, Subquery, TextField, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Atualizacao, HistoricoCompactado, Protocolo
+
+TAMANHO_LOTE = 2000
+FORMATO_DATA = "%d/%m/%Y %H:%M"
+STATUS_DISPLAY = dict(Protocolo.STATUS_CHOICES)
+
+CABECALHO = [
+    "Número", "Status", "BUIC Dispositivo", "Descrição do Problema",
+    "Usuário Criador", "Data de Criação", "Data de Finalização",
+]
+CAMPOS = [
+    "numero", "status", "buic_dispositivo", "descricao_problema",
+    "usuario_criador__username", "data_criacao", "data_finalizacao",
+]
+
+
+class ConcatenarTexto(Aggregate):
+    """Concatena textos do grupo separados por vírgula (STRING_AGG / GROUP_CONCAT)"""
+    function = "GROUP_CONCAT"
+    template = "%(function)s(%(expressions)s, ', ')"
+    output_field = TextField()
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return super().as_sql(compiler, connection, function="STRING_AGG", **extra_context)
+
+
+def _inicio_do_dia(data):
+    return timezone.make_aware(datetime.datetime.combine(data, datetime.time.min))
+
+
+def filtrar_protocolos(filtros):
+    """Aplica os filtros validados por FiltroExportacaoForm (cleaned_data)"""
+    protocolos = Protocolo.objects.all() if filtros.get("incluir_arquivados") else Protocolo.objects.quentes()
+    if filtros.get("status"):
+        protocolos = protocolos.filter(status__in=filtros["status"])
+    # Intervalos em data_criacao (em vez de __date) para aproveitar índices
+    if filtros.get("data_inicio"):
+        protocolos = protocolos.filter(data_criacao__gte=_inicio_do_dia(filtros["data_inicio"]))
+    if filtros.get("data_fim"):
+        fim = filtros["data_fim"] + datetime.timedelta(days=1)
+        protocolos = protocolos.filter(data_criacao__lt=_inicio_do_dia(fim))
+    if filtros.get("usuario"):
+        protocolos = protocolos.filter(usuario_criador__username=filtros["usuario"])
+    return protocolos
+
+
+def colunas_exportacao(incluir_clientes=False, incluir_atualizacoes=False):
+    cabecalho, campos = list(CABECALHO), list(CAMPOS)
+    if incluir_clientes:
+        cabecalho.append("Clientes")
+        campos.append("nomes_clientes")
+    if incluir_atualizacoes:
+        cabecalho.append("Atualizações")
+        campos.append("total_atualizacoes")
+    return cabecalho, campos
+
+
+def anotar_agregados(protocolos, incluir_clientes=False, incluir_atualizacoes=False):
+    """Subconsultas correlacionadas evitam o produto cartesiano de dois JOINs"""
+    if incluir_clientes:
+        Vinculo = Protocolo.clientes.through
+        nomes = (
+            Vinculo.objects.filter(protocolo_id=OuterRef("pk"))
+            .values("protocolo_id")
+            .annotate(nomes=ConcatenarTexto("cliente__nome"))
+            .values("nomes")
+        )
+        protocolos = protocolos.annotate(
+            nomes_clientes=Coalesce(Subquery(nomes), Value(""), output_field=TextField())
+        )
+    if incluir_atualizacoes:
+        total = (
+            Atualizacao.objects.filter(protocolo_id=OuterRef("pk"))
+            .order_by()
+            .values("protocolo_id")
+            .annotate(total=Count("pk"))
+            .values("total")
+        )
+        # Mais as atualizações guardadas no histórico compactado (ver compactacao.py)
+        compactadas = HistoricoCompactado.objects.filter(protocolo_id=OuterRef("pk")).values("quantidade")
+        protocolos = protocolos.annotate(
+            total_atualizacoes=Coalesce(Subquery(total, output_field=IntegerField()), 0)
+            + Coalesce(Subquery(compactadas, output_field=IntegerField()), 0)
+        )
+    return protocolos
+
+
+def _formatar_data(valor):
+    return timezone.localtime(valor).strftime(FORMATO_DATA) if valor else ""
+
+
+def linhas_exportacao(protocolos, incluir_clientes=False, incluir_atualizacoes=False, tamanho_lote=TAMANHO_LOTE):
+    """Gera as linhas (já formatadas) da exportação, começando pelo cabeçalho"""
+    cabecalho, campos = colunas_exportacao(incluir_clientes, incluir_atualizacoes)
+    yield cabecalho
+
+    protocolos = anotar_agregados(protocolos, incluir_clientes, incluir_atualizacoes)
+    linhas = _em_lotes(protocolos, campos, tamanho_lote)
+    for numero, status, buic, descricao, usuario, criacao, finalizacao, *extras in linhas:
+        yield [
+            numero,
+            STATUS_DISPLAY.get(status, status),
+            buic,
+            descricao,
+            usuario,
+            _formatar_data(criacao),
+            _formatar_data(finalizacao),
+            *extras,
+        ]
+
+
+def _em_lotes(protocolos, campos, tamanho_lote):
+    """Percorre a consulta em lotes de `tamanho_lote`, continuando do último número lido"""
+    ultimo = None
+    while True:
+        lote = protocolos if ultimo is None else protocolos.filter(numero__gt=ultimo)
+        linhas = list(lote.order_by("numero").values_list(*campos)[:tamanho_lote])
+        yield from linhas
+        if len(linhas) < tamanho_lote:
+            return
+        ultimo = linhas[-1][0]
+
+
+class _Eco:
+    """Objeto "arquivo" que devolve o que recebe, para usar csv.writer em streaming"""
+
+    def write(self, valor):
+        return valor
+
+
+def gerar_csv(linhas, linhas_por_bloco=500):
+    """Converte as linhas em blocos de texto CSV prontos para StreamingHttpResponse"""
+    writer = csv.writer(_Eco())
+    bloco = []
+    for linha in linhas:
+        bloco.append(writer.writerow(linha))
+        if len(bloco) >= linhas_por_bloco:
+            yield "".join(bloco)
+            bloco = []
+    if bloco:
+        yield "".join(bloco)
@@ -1,13 +1,33 @@
 from django import forms
+from django.urls import reverse_lazy
 from .models import Protocolo, Cliente
 
+
+class ClientesAutocompleteWidget(forms.SelectMultiple):
+    """
+    Renderiza apenas os clientes já selecionados; as demais opções são
+    carregadas sob demanda pelo select2 a partir de autocomplete_clientes.
+    """
+
+    def optgroups(self, name, value, attrs=None):
+        selecionados = [v for v in value if str(v).isascii() and str(v).isdigit()]
+        opcoes = []
+        if selecionados:
+            clientes = self.choices.queryset.filter(pk__in=selecionados)
+            for indice, cliente in enumerate(clientes):
+                opcoes.append(self.create_option(name, cliente.pk, str(cliente), True, indice))
+        return [(None, opcoes, 0)]
+
+
 class ProtocoloForm(forms.ModelForm):
+    # A validação faz uma única consulta "pk IN (...)" com os ids enviados
     clientes = forms.ModelMultipleChoiceField(
-        queryset=Cliente.objects.filter(ativo=True).order_by('nome'),
-        widget=forms.SelectMultiple(attrs={
+        queryset=Cliente.objects.filter(ativo=True),
+        widget=ClientesAutocompleteWidget(attrs={
             'class': 'form-control select2-clientes',
             'data-placeholder': 'Digite o nome do cliente para buscar...',
             'data-allow-clear': 'true',
+            'data-autocomplete-url': reverse_lazy('autocomplete_clientes'),
             'multiple': 'multiple'
         }),
         required=True,
@@ -43,4 +63,25 @@ class AtualizacaoForm(forms.ModelForm):
         }
         labels = {
             "descricao_problema": "Primeira Atualização (Opcional)"
-        }
\ No newline at end of file
+        }
+
+class FiltroExportacaoForm(forms.Form):
+    status = forms.MultipleChoiceField(choices=Protocolo.STATUS_CHOICES, required=False)
+    data_inicio = forms.DateField(required=False)
+    data_fim = forms.DateField(required=False)
+    usuario = forms.CharField(required=False, help_text="Username do criador")
+    incluir_clientes = forms.BooleanField(required=False)
+    incluir_atualizacoes = forms.BooleanField(required=False)
+    incluir_arquivados = forms.BooleanField(required=False, help_text="Inclui os protocolos do arquivo")
+
+    def clean(self):
+        cleaned_data = super().clean()
+        data_inicio, data_fim = cleaned_data.get("data_inicio"), cleaned_data.get("data_fim")
+        if data_inicio and data_fim and data_inicio > data_fim:
+            raise forms.ValidationError("A data inicial deve ser anterior à data final.")
+        return cleaned_data
+
+
+class FiltroProtocolosApiForm(FiltroExportacaoForm):
+    """Filtros da API de protocolos: os da exportação mais o cliente"""
+    cliente = forms.IntegerField(required=False, min_value=1, help_text="Id do cliente")
@@ -0,0 +1,86 @@
+"""
+Linha do tempo de um protocolo.
+
+O histórico é paginado por cursor em (data_hora, id) e cada página renderizada
+fica no cache. A chave inclui uma versão por protocolo, trocada sempre que uma
+atualização é salva ou removida (ver signals.py): as páginas antigas deixam de
+ser lidas e expiram sozinhas, sem precisar apagar cada cursor.
+
+Protocolos finalizados podem ter o histórico compactado (ver compactacao.py).
+atualizacoes_do_protocolo e pagina_historico juntam as duas origens, de modo
+que quem lê o histórico não precisa saber onde ele está guardado.
+"""
+from django.core.cache import DEFAULT_CACHE_ALIAS
+from django.template.loader import render_to_string
+
+from .cache import cache_nomeado, chave_versionada, invalidar_grupo, invalidar_grupos, versao_grupo
+from .models import Atualizacao, HistoricoCompactado
+from .paginacao import paginar_keyset, paginar_lista
+
+TEMPO_CACHE = 300
+LIMITE_HISTORICO = 20
+ORDENACAO_HISTORICO = ['-data_hora', '-id']
+
+cache = cache_nomeado(DEFAULT_CACHE_ALIAS)
+
+
+def _grupo(protocolo_id):
+    return f'protocolos:historico:{protocolo_id}'
+
+
+def versao_historico(protocolo_id):
+    return versao_grupo(cache, _grupo(protocolo_id))
+
+
+def invalidar_historico(protocolo_id):
+    return invalidar_grupo(cache, _grupo(protocolo_id))
+
+
+def invalidar_historicos(protocolo_ids):
+    invalidar_grupos(cache, [_grupo(protocolo_id) for protocolo_id in protocolo_ids])
+
+
+def _historico_compactado(protocolo):
+    # Só protocolos finalizados são compactados: os demais dispensam a consulta
+    if protocolo.status != 'finalizado':
+        return None
+    return HistoricoCompactado.objects.filter(protocolo_id=protocolo.pk).first()
+
+
+def _atualizacoes_em_tabela(protocolo):
+    return Atualizacao.objects.filter(protocolo_id=protocolo.pk).select_related('usuario')
+
+
+def atualizacoes_do_protocolo(protocolo):
+    """Todas as atualizações de `protocolo`, da mais recente para a mais antiga"""
+    compactado = _historico_compactado(protocolo)
+    if compactado is None:
+        return list(_atualizacoes_em_tabela(protocolo).order_by(*ORDENACAO_HISTORICO))
+    atualizacoes = compactado.atualizacoes() + list(_atualizacoes_em_tabela(protocolo))
+    return paginar_lista(atualizacoes, Atualizacao, ORDENACAO_HISTORICO, limite=len(atualizacoes)).itens
+
+
+def pagina_historico(protocolo, cursor=None, limite=LIMITE_HISTORICO):
+    """Atualizações de `protocolo` a partir de `cursor`, com o usuário já carregado"""
+    compactado = _historico_compactado(protocolo)
+    if compactado is None:
+        return paginar_keyset(_atualizacoes_em_tabela(protocolo), ORDENACAO_HISTORICO, cursor=cursor, limite=limite)
+    # Atualizações feitas depois da compactação continuam na tabela
+    atualizacoes = compactado.atualizacoes() + list(_atualizacoes_em_tabela(protocolo))
+    return paginar_lista(atualizacoes, Atualizacao, ORDENACAO_HISTORICO, cursor=cursor, limite=limite)
+
+
+def renderizar_historico(protocolo, cursor=None):
+    """HTML do fragmento da linha do tempo, do cache quando possível"""
+    # O cursor vem do cliente: entra na chave só pelo hash
+    chave = chave_versionada(cache, _grupo(protocolo.pk), cursor or '')
+    html = cache.get(chave)
+    if html is None:
+        pagina = pagina_historico(protocolo, cursor)
+        html = render_to_string('protocolos/_historico.html', {
+            'protocolo': protocolo,
+            'atualizacoes': pagina.itens,
+            'proximo_cursor': pagina.proximo_cursor,
+        })
+        cache.set(chave, html, TEMPO_CACHE)
+    return html
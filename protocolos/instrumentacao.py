@@ -0,0 +1,182 @@
+"""
+Instrumentação de consultas e tempo de resposta por view.
+
+Ativada por settings.PROTOCOLOS_INSTRUMENTACAO. Desativada, o middleware
+levanta MiddlewareNotUsed na inicialização e sai da cadeia de middlewares,
+sem custo algum por requisição. Ativada, cada requisição roda com um
+connection.execute_wrapper que registra as consultas; os totais por URL ficam
+em memória no processo e são expostos em cabeçalhos Server-Timing e na view
+estatisticas_instrumentacao (somente staff).
+
+As conexões são por thread. Threads auxiliares de uma requisição (as seções
+da busca consultadas em paralelo) entram em coletar_nesta_thread(), que
+encontra o coletor da requisição por uma ContextVar (o sync_to_async copia o
+contexto para a thread).
+"""
+import contextvars
+import logging
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack, contextmanager, nullcontext
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# Mesma consulta repetida ao menos isto numa requisição é tratada como N+1
+LIMITE_REPETICOES = 3
+CONSULTAS_NO_LOG = 5
+
+_IN_LISTA = re.compile(r'\(\s*%s(?:\s*,\s*%s)+\s*\)')
+_LITERAIS = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+
+
+def assinatura(sql):
+    """Normaliza a consulta: listas IN de tamanhos diferentes e literais viram marcadores"""
+    sql = _IN_LISTA.sub('(...)', sql)
+    return _LITERAIS.sub('?', sql)
+
+
+class ColetorConsultas:
+    def __init__(self):
+        self.consultas = []
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.consultas.append((sql, params, time.perf_counter() - inicio))
+
+    @property
+    def tempo_total(self):
+        return sum(duracao for _, _, duracao in self.consultas)
+
+    def repetidas(self):
+        """Assinaturas executadas LIMITE_REPETICOES vezes ou mais"""
+        contagem = Counter(assinatura(sql) for sql, _, _ in self.consultas)
+        return {sql: vezes for sql, vezes in contagem.items() if vezes >= LIMITE_REPETICOES}
+
+    def duplicadas(self):
+        """Consultas idênticas (mesmo SQL e parâmetros) repetidas"""
+        contagem = Counter((sql, repr(params)) for sql, params, _ in self.consultas)
+        return sum(vezes - 1 for vezes in contagem.values() if vezes > 1)
+
+    def mais_lentas(self, quantidade=CONSULTAS_NO_LOG):
+        return sorted(self.consultas, key=lambda consulta: consulta[2], reverse=True)[:quantidade]
+
+
+_coletor_atual = contextvars.ContextVar('coletor_consultas', default=None)
+
+
+@contextmanager
+def _envolver_conexoes(coletor):
+    with ExitStack() as pilha:
+        for alias in connections:
+            pilha.enter_context(connections[alias].execute_wrapper(coletor))
+        yield coletor
+
+
+@contextmanager
+def coletar_consultas(coletor=None):
+    """Registra em `coletor` as consultas desta thread e das que usarem coletar_nesta_thread"""
+    coletor = coletor or ColetorConsultas()
+    token = _coletor_atual.set(coletor)
+    try:
+        with _envolver_conexoes(coletor):
+            yield coletor
+    finally:
+        _coletor_atual.reset(token)
+
+
+def coletar_nesta_thread():
+    """Em uma thread auxiliar, registra as consultas no coletor de quem a iniciou (se houver)"""
+    coletor = _coletor_atual.get()
+    return _envolver_conexoes(coletor) if coletor is not None else nullcontext()
+
+
+class Estatisticas:
+    """Agregados por nome de URL, compartilhados entre as threads do processo"""
+
+    def __init__(self):
+        self._trava = threading.Lock()
+        self.zerar()
+
+    def zerar(self):
+        with self._trava:
+            self._dados = defaultdict(lambda: {
+                'requisicoes': 0,
+                'consultas': 0,
+                'consultas_duplicadas': 0,
+                'tempo_banco_ms': 0.0,
+                'tempo_total_ms': 0.0,
+                'tempo_maximo_ms': 0.0,
+                'n_mais_1': Counter(),
+            })
+
+    def registrar(self, nome, coletor, duracao):
+        with self._trava:
+            dados = self._dados[nome]
+            dados['requisicoes'] += 1
+            dados['consultas'] += len(coletor.consultas)
+            dados['consultas_duplicadas'] += coletor.duplicadas()
+            dados['tempo_banco_ms'] += coletor.tempo_total * 1000
+            dados['tempo_total_ms'] += duracao * 1000
+            dados['tempo_maximo_ms'] = max(dados['tempo_maximo_ms'], duracao * 1000)
+            dados['n_mais_1'].update(coletor.repetidas())
+
+    def resumo(self):
+        with self._trava:
+            resumo = {}
+            for nome, dados in self._dados.items():
+                requisicoes = dados['requisicoes']
+                resumo[nome] = {
+                    'requisicoes': requisicoes,
+                    'consultas_por_requisicao': round(dados['consultas'] / requisicoes, 2),
+                    'consultas_duplicadas': dados['consultas_duplicadas'],
+                    'tempo_banco_medio_ms': round(dados['tempo_banco_ms'] / requisicoes, 2),
+                    'tempo_medio_ms': round(dados['tempo_total_ms'] / requisicoes, 2),
+                    'tempo_maximo_ms': round(dados['tempo_maximo_ms'], 2),
+                    'n_mais_1': [
+                        {'sql': sql, 'ocorrencias': vezes} for sql, vezes in dados['n_mais_1'].most_common(5)
+                    ],
+                }
+            return resumo
+
+
+estatisticas = Estatisticas()
+
+
+class InstrumentacaoMiddleware:
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROTOCOLOS_INSTRUMENTACAO', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.limite_lento = getattr(settings, 'PROTOCOLOS_INSTRUMENTACAO_LENTO_MS', 500) / 1000
+
+    def __call__(self, request):
+        inicio = time.perf_counter()
+        with coletar_consultas() as coletor:
+            response = self.get_response(request)
+        duracao = time.perf_counter() - inicio
+
+        correspondencia = getattr(request, 'resolver_match', None)
+        nome = correspondencia.view_name if correspondencia else 'sem_rota'
+        estatisticas.registrar(nome, coletor, duracao)
+
+        response['Server-Timing'] = (
+            f'db;dur={coletor.tempo_total * 1000:.1f};desc="{len(coletor.consultas)} consultas", '
+            f'total;dur={duracao * 1000:.1f}'
+        )
+        if duracao >= self.limite_lento:
+            logger.warning(
+                'Requisição lenta: %s %s (%s) em %.0f ms, %d consultas (%.0f ms no banco). Mais lentas:\n%s',
+                request.method, request.path, nome, duracao * 1000,
+                len(coletor.consultas), coletor.tempo_total * 1000,
+                '\n'.join(f'  {d * 1000:.1f} ms: {sql}' for sql, _, d in coletor.mais_lentas()),
+            )
+        return response
@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from protocolos.arquivo import arquivar_finalizados, candidatos_arquivamento, limite_arquivamento
+
+
+class Command(BaseCommand):
+    help = (
+        'Arquiva os protocolos finalizados há mais de PROTOCOLOS_HORIZONTE_ARQUIVO_DIAS, '
+        'tirando-os do dashboard, da busca padrão, do admin e da exportação. '
+        'Pensado para rodar diariamente (cron).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--horizonte-dias', type=int, help='Substitui PROTOCOLOS_HORIZONTE_ARQUIVO_DIAS.')
+        parser.add_argument('--lote', type=int, default=5_000, help='Protocolos por transação.')
+        parser.add_argument('--simular', action='store_true', help='Só informa quantos seriam arquivados.')
+
+    def handle(self, *args, **options):
+        horizonte = options['horizonte_dias']
+        if horizonte is not None and horizonte < 0:
+            raise CommandError('--horizonte-dias não pode ser negativo.')
+        if options['lote'] < 1:
+            raise CommandError('--lote deve ser positivo.')
+
+        limite = limite_arquivamento(horizonte)
+        if options['simular']:
+            total = candidatos_arquivamento(horizonte).count()
+            self.stdout.write(f'{total} protocolo(s) finalizado(s) antes de {limite:%d/%m/%Y} seriam arquivados.')
+            return
+
+        inicio = time.perf_counter()
+        total = arquivar_finalizados(
+            horizonte, lote=options['lote'],
+            progresso=lambda feitos: self.stdout.write(f'{feitos} protocolo(s) arquivado(s)...'),
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'{total} protocolo(s) finalizado(s) antes de {limite:%d/%m/%Y} arquivado(s) '
+            f'em {time.perf_counter() - inicio:.1f}s.'
+        ))
@@ -0,0 +1,45 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from protocolos.metricas import processar_pendentes, recalcular_dias, recalcular_tudo
+
+
+class Command(BaseCommand):
+    help = (
+        'Recalcula as tabelas de métricas diárias dos dias marcados como pendentes. '
+        'Use --completo para reconstruir todo o histórico (ex.: na primeira execução).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--completo', action='store_true', help='Recalcula desde o primeiro protocolo.')
+        parser.add_argument('--desde', help='Recalcula de AAAA-MM-DD até hoje.')
+        parser.add_argument(
+            '--intervalo', type=float,
+            help='Continua em execução, processando os pendentes a cada N segundos.',
+        )
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        if options['completo']:
+            dias = recalcular_tudo()
+        elif options['desde']:
+            try:
+                desde = datetime.date.fromisoformat(options['desde'])
+            except ValueError:
+                raise CommandError('--desde deve estar no formato AAAA-MM-DD.')
+            hoje = timezone.localdate()
+            dias = recalcular_dias(desde + datetime.timedelta(days=i) for i in range((hoje - desde).days + 1))
+        else:
+            dias = processar_pendentes()
+        self.stdout.write(self.style.SUCCESS(
+            f'{dias} dia(s) recalculado(s) em {time.perf_counter() - inicio:.1f}s.'
+        ))
+
+        while options['intervalo']:
+            time.sleep(options['intervalo'])
+            dias = processar_pendentes()
+            if dias:
+                self.stdout.write(f'{dias} dia(s) recalculado(s).')
@@ -0,0 +1,42 @@
+import urllib.request
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from protocolos.estaticos import VENDOR
+
+DESTINO = Path(__file__).resolve().parents[2] / 'static'
+
+
+class Command(BaseCommand):
+    help = (
+        'Baixa as bibliotecas de terceiros listadas em protocolos/estaticos.py (VENDOR) '
+        'para protocolos/static, para que as páginas não dependam do CDN. Rodar uma vez, '
+        'com acesso à internet, e versionar os arquivos; depois, collectstatic.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--substituir', action='store_true', help='Baixa de novo os arquivos já presentes.')
+
+    def handle(self, *args, **options):
+        falhas = 0
+        for nome, (caminho, origem) in VENDOR.items():
+            if not caminho.startswith('protocolos/'):
+                continue  # distribuído com o admin do Django
+            destino = DESTINO / caminho
+            if destino.exists() and not options['substituir']:
+                self.stdout.write(f'{nome}: já presente')
+                continue
+            try:
+                with urllib.request.urlopen(origem, timeout=30) as resposta:
+                    conteudo = resposta.read()
+            except OSError as e:
+                falhas += 1
+                self.stderr.write(f'{nome}: falha ao baixar {origem} ({e})')
+                continue
+            destino.parent.mkdir(parents=True, exist_ok=True)
+            destino.write_bytes(conteudo)
+            self.stdout.write(f'{nome}: {len(conteudo) / 1024:.0f} KiB')
+        if falhas:
+            raise CommandError(f'{falhas} arquivo(s) não baixado(s).')
+        self.stdout.write(self.style.SUCCESS('Bibliotecas em protocolos/static. Rode python manage.py collectstatic.'))
@@ -0,0 +1,72 @@
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.urls import reverse
+from django.utils import timezone
+
+from protocolos.arquivo import arquivar_finalizados
+from protocolos.models import Protocolo
+from protocolos.sinteticos import gerar_dados_sinteticos
+
+from .benchmark_views import CENARIOS as CENARIOS_VIEWS
+from .benchmark_views import Command as BenchmarkViews
+from .benchmark_views import cliente_de_medicao
+
+# Views que só consultam os protocolos não arquivados
+CENARIOS = [
+    cenario for cenario in CENARIOS_VIEWS
+    if cenario[0] in ('dashboard', 'busca_texto', 'busca_ampla', 'busca_json', 'admin_protocolos', 'admin_protocolos_busca')
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Mede dashboard, busca e admin com o histórico multiplicado: gera protocolos '
+        'finalizados antigos (além do horizonte de arquivo) até o total chegar a --fator '
+        'vezes o atual, mede com eles ainda ativos e de novo depois de arquivá-los.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fator', type=int, default=10, help='Tamanho final do histórico em relação ao atual.')
+        parser.add_argument('--repeticoes', type=int, default=20)
+        parser.add_argument('--saida', default='benchmark_arquivo.json', help='Arquivo do relatório JSON.')
+        parser.add_argument('--seed', type=int, default=7)
+
+    def handle(self, *args, **options):
+        if options['fator'] < 2:
+            raise CommandError('--fator deve ser pelo menos 2.')
+
+        medidor = BenchmarkViews(stdout=self.stdout, stderr=self.stderr)
+        relatorio = {'gerado_em': timezone.now().isoformat(), 'banco': connection.vendor, 'etapas': {}}
+        with cliente_de_medicao() as cliente:
+            atuais = Protocolo.objects.count()
+            relatorio['etapas']['base_atual'] = self.etapa(medidor, cliente, options)
+
+            gerar_dados_sinteticos(
+                clientes=0, protocolos=atuais * (options['fator'] - 1), seed=options['seed'],
+                status='finalizado', deslocamento_dias=settings.PROTOCOLOS_HORIZONTE_ARQUIVO_DIAS + 1,
+                dias=365 * (options['fator'] - 1),
+                progresso=lambda feitos, total: self.stdout.write(f'{feitos}/{total} protocolos antigos gerados'),
+            )
+            relatorio['etapas']['historico_ativo'] = self.etapa(medidor, cliente, options)
+
+            arquivar_finalizados()
+            relatorio['etapas']['historico_arquivado'] = self.etapa(medidor, cliente, options)
+
+        Path(options['saida']).write_text(json.dumps(relatorio, indent=2, ensure_ascii=False))
+        self.stdout.write(self.style.SUCCESS(f"Relatório gravado em {options['saida']}"))
+
+    def etapa(self, medidor, cliente, options):
+        total = Protocolo.objects.count()
+        ativos = Protocolo.objects.quentes().count()
+        self.stdout.write(f'\n{total} protocolos, {ativos} fora do arquivo')
+        resultados = {}
+        for nome, url, parametros in CENARIOS:
+            r = resultados[nome] = medidor.medir(cliente, reverse(url), parametros, options['repeticoes'])
+            self.stdout.write(
+                f"{nome:<26} p50 {r['p50_ms']:>8.1f} ms  p95 {r['p95_ms']:>8.1f} ms  {r['consultas']:>4} consultas"
+            )
+        return {'protocolos': total, 'ativos': ativos, 'cenarios': resultados}
@@ -0,0 +1,73 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Q
+
+from protocolos.busca import buscar_clientes, buscar_protocolos
+from protocolos.models import Cliente, Protocolo
+from protocolos.sinteticos import gerar_dados_sinteticos
+
+
+def busca_legada(termo):
+    """Implementação anterior de busca_global, mantida apenas para comparação"""
+    return Protocolo.objects.filter(
+        Q(numero__icontains=termo) |
+        Q(buic_dispositivo__icontains=termo) |
+        Q(descricao_problema__icontains=termo) |
+        Q(clientes__nome__icontains=termo) |
+        Q(clientes__email__icontains=termo)
+    ).distinct()
+
+
+class Command(BaseCommand):
+    help = 'Compara a busca global antiga (icontains + JOIN) com a busca indexada em uma base sintética.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--protocolos', type=int, default=1_000_000, help='Tamanho da base sintética')
+        parser.add_argument('--clientes', type=int, default=20_000)
+        parser.add_argument('--repeticoes', type=int, default=5)
+        parser.add_argument('--limite', type=int, default=50, help='Resultados lidos por busca')
+        parser.add_argument('--lote', type=int, default=10_000)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument(
+            '--termos', nargs='+',
+            default=['BUIC-0004', 'conexão', 'Comércio 17', '1000500', 'impressora servidor'],
+        )
+
+    def handle(self, *args, **options):
+        faltantes = options['protocolos'] - Protocolo.objects.count()
+        if faltantes > 0:
+            self.stdout.write(f'Gerando {faltantes} protocolos sintéticos...')
+            gerar_dados_sinteticos(
+                clientes=max(options['clientes'] - Cliente.objects.count(), 0),
+                protocolos=faltantes,
+                atualizacoes_por_protocolo=2,
+                seed=options['seed'],
+                lote=options['lote'],
+                progresso=lambda feitos, total: self.stdout.write(f'  {feitos}/{total}'),
+            )
+
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+        else:
+            self.stdout.write(self.style.WARNING(
+                f'Banco {connection.vendor}: a busca indexada só é usada no PostgreSQL.'
+            ))
+
+        self.stdout.write(f"{'termo':<22}{'legada (ms)':>14}{'indexada (ms)':>16}{'clientes (ms)':>16}")
+        for termo in options['termos']:
+            legada = self.medir(busca_legada, termo, options)
+            indexada = self.medir(buscar_protocolos, termo, options)
+            clientes = self.medir(buscar_clientes, termo, options)
+            self.stdout.write(f'{termo:<22}{legada:>14.1f}{indexada:>16.1f}{clientes:>16.1f}')
+
+    def medir(self, busca, termo, options):
+        tempos = []
+        for _ in range(options['repeticoes']):
+            inicio = time.perf_counter()
+            list(busca(termo).values_list('pk', flat=True)[:options['limite']])
+            tempos.append((time.perf_counter() - inicio) * 1000)
+        return statistics.median(tempos)
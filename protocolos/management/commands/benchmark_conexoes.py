@@ -0,0 +1,93 @@
+import copy
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from .benchmark_views import percentil
+
+MODOS = ['sem_persistencia', 'persistente', 'pool']
+
+
+class Command(BaseCommand):
+    help = (
+        'Mede a latência por requisição ao PostgreSQL abrindo uma conexão a cada '
+        'requisição, com conexões persistentes (CONN_MAX_AGE) e com o pool do psycopg. '
+        'Para rodar localmente: docker run -d -p 5432:5432 -e POSTGRES_PASSWORD=postgres postgres:16 '
+        'e DB_HOST=localhost DB_PORT=5432 DB_USER=postgres DB_PASSWORD=postgres python manage.py benchmark_conexoes'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requisicoes', type=int, default=200, help='Requisições por thread.')
+        parser.add_argument('--threads', type=int, default=4)
+        parser.add_argument('--consultas', type=int, default=3, help='Consultas por requisição.')
+        parser.add_argument('--modos', nargs='+', choices=MODOS, default=MODOS)
+
+    def handle(self, *args, **options):
+        base = connections['default'].settings_dict
+        if base['ENGINE'] != 'django.db.backends.postgresql':
+            raise CommandError('benchmark_conexoes só faz sentido com o PostgreSQL.')
+
+        self.stdout.write(
+            f"{options['threads']} threads x {options['requisicoes']} requisições, "
+            f"{options['consultas']} consultas cada"
+        )
+        for modo in options['modos']:
+            configuracao = self.configuracao(base, modo)
+            if configuracao is None:
+                self.stdout.write(self.style.WARNING(f'{modo:<18} psycopg_pool não instalado; ignorado'))
+                continue
+            tempos = self.medir(modo, configuracao, options)
+            self.stdout.write(
+                f"{modo:<18} p50 {percentil(tempos, 50):>7.2f} ms  p95 {percentil(tempos, 95):>7.2f} ms  "
+                f"média {sum(tempos) / len(tempos):>7.2f} ms"
+            )
+
+    def configuracao(self, base, modo):
+        configuracao = copy.deepcopy(base)
+        opcoes = configuracao['OPTIONS']
+        pool = opcoes.pop('pool', None)
+        configuracao['CONN_MAX_AGE'] = 600 if modo == 'persistente' else 0
+        configuracao['CONN_HEALTH_CHECKS'] = modo == 'persistente'
+        if modo == 'pool':
+            try:
+                import psycopg_pool  # noqa: F401
+            except ImportError:
+                return None
+            opcoes['pool'] = pool or True
+        return configuracao
+
+    def medir(self, modo, configuracao, options):
+        # Cada thread usa o seu DatabaseWrapper; com o mesmo alias, compartilham o pool
+        wrapper_class = type(connections['default'])
+        alias = f'benchmark_{modo}'
+        tempos, trava = [], threading.Lock()
+
+        def trabalhar():
+            conexao = wrapper_class(copy.deepcopy(configuracao), alias)
+            locais = []
+            try:
+                for _ in range(options['requisicoes']):
+                    inicio = time.perf_counter()
+                    with conexao.cursor() as cursor:
+                        for _ in range(options['consultas']):
+                            cursor.execute('SELECT 1')
+                            cursor.fetchone()
+                    # O mesmo que o sinal request_finished faz ao fim de cada requisição
+                    conexao.close_if_unusable_or_obsolete()
+                    locais.append((time.perf_counter() - inicio) * 1000)
+            finally:
+                conexao.close()
+            with trava:
+                tempos.extend(locais)
+
+        threads = [threading.Thread(target=trabalhar) for _ in range(options['threads'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if modo == 'pool':
+            wrapper_class(configuracao, alias).close_pool()
+        return tempos
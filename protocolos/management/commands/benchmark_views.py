@@ -0,0 +1,175 @@
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from django.utils import timezone
+
+from protocolos.instrumentacao import coletar_consultas
+from protocolos.models import Atualizacao, Cliente, Protocolo
+from protocolos.sinteticos import gerar_dados_sinteticos
+
+# (nome, url, parâmetros GET)
+CENARIOS = [
+    ('dashboard', 'dashboard', {}),
+    ('novo_protocolo', 'novo_protocolo', {}),
+    ('busca_buic', 'busca_global', {'q': 'BUIC-0001'}),
+    ('busca_texto', 'busca_global', {'q': 'impressora'}),
+    ('busca_ampla', 'busca_global', {'q': 'a'}),
+    ('busca_json', 'busca_global_json', {'q': 'servidor'}),
+    ('autocomplete_clientes', 'autocomplete_clientes', {'q': 'com'}),
+    ('exportar_csv', 'exportar_protocolos_csv', {'status': 'aberto'}),
+    ('admin_protocolos', 'admin:protocolos_protocolo_changelist', {}),
+    ('admin_protocolos_busca', 'admin:protocolos_protocolo_changelist', {'q': 'rede'}),
+    ('admin_clientes', 'admin:protocolos_cliente_changelist', {}),
+]
+
+
+def percentil(valores, p):
+    """Percentil por posição mais próxima (valores não vazios)"""
+    ordenados = sorted(valores)
+    posicao = max(0, min(len(ordenados) - 1, round(p / 100 * len(ordenados) + 0.5) - 1))
+    return ordenados[posicao]
+
+
+@contextmanager
+def cliente_de_medicao():
+    """
+    Cliente de testes autenticado como um superusuário "benchmark". A sessão
+    e o usuário, se criado aqui, são removidos ao final.
+    """
+    # Libera o host "testserver" e ativa a instrumentação de templates
+    try:
+        setup_test_environment()
+        preparado = True
+    except RuntimeError:
+        preparado = False  # já preparado (ex.: dentro da suíte de testes)
+    usuario, criado = User.objects.get_or_create(
+        username='benchmark', defaults={'is_staff': True, 'is_superuser': True}
+    )
+    cliente = Client()
+    cliente.force_login(usuario)
+    try:
+        yield cliente
+    finally:
+        cliente.logout()
+        if criado:
+            usuario.delete()
+        if preparado:
+            teardown_test_environment()
+
+
+class Command(BaseCommand):
+    help = (
+        'Mede latência (p50/p95), número de consultas e pico de memória das views '
+        'principais pelo cliente de testes do Django e grava um relatório JSON.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticoes', type=int, default=20)
+        parser.add_argument('--saida', default='benchmark_views.json', help='Arquivo do relatório JSON.')
+        parser.add_argument('--comparar', help='Relatório anterior para exibir a variação.')
+        parser.add_argument('--cenarios', nargs='+', help='Executa apenas os cenários informados.')
+        parser.add_argument('--gerar-protocolos', type=int, default=0, help='Gera N protocolos sintéticos antes.')
+        parser.add_argument('--gerar-clientes', type=int, default=0)
+        parser.add_argument('--atualizacoes', type=int, default=3)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        if options['gerar_protocolos'] or options['gerar_clientes']:
+            gerar_dados_sinteticos(
+                clientes=options['gerar_clientes'],
+                protocolos=options['gerar_protocolos'],
+                atualizacoes_por_protocolo=options['atualizacoes'],
+                seed=options['seed'],
+                progresso=lambda feitos, total: self.stdout.write(f'{feitos}/{total} protocolos gerados'),
+            )
+
+        cenarios = CENARIOS
+        if options['cenarios']:
+            desconhecidos = set(options['cenarios']) - {nome for nome, _, _ in CENARIOS}
+            if desconhecidos:
+                raise CommandError(f"Cenários desconhecidos: {', '.join(sorted(desconhecidos))}")
+            cenarios = [cenario for cenario in CENARIOS if cenario[0] in options['cenarios']]
+
+        resultados = {}
+        with cliente_de_medicao() as cliente:
+            for nome, url, parametros in cenarios:
+                resultados[nome] = self.medir(cliente, reverse(url), parametros, options['repeticoes'])
+                r = resultados[nome]
+                self.stdout.write(
+                    f"{nome:<26} p50 {r['p50_ms']:>8.1f} ms  p95 {r['p95_ms']:>8.1f} ms  "
+                    f"{r['consultas']:>4} consultas  pico {r['pico_memoria_kb']:>9.0f} KiB"
+                )
+
+        relatorio = {
+            'gerado_em': timezone.now().isoformat(),
+            'banco': connection.vendor,
+            'repeticoes': options['repeticoes'],
+            'volumes': {
+                'protocolos': Protocolo.objects.count(),
+                'clientes': Cliente.objects.count(),
+                'atualizacoes': Atualizacao.objects.count(),
+            },
+            'cenarios': resultados,
+        }
+        Path(options['saida']).write_text(json.dumps(relatorio, indent=2, ensure_ascii=False))
+        self.stdout.write(self.style.SUCCESS(f"Relatório gravado em {options['saida']}"))
+
+        if options['comparar']:
+            self.comparar(json.loads(Path(options['comparar']).read_text()), relatorio)
+
+    def requisitar(self, cliente, url, parametros):
+        resposta = cliente.get(url, parametros)
+        if resposta.streaming:
+            for _ in resposta.streaming_content:
+                pass
+        resposta.close()
+        return resposta.status_code
+
+    def medir(self, cliente, url, parametros, repeticoes):
+        # Aquecimento (caches, templates compilados, conexão)
+        self.requisitar(cliente, url, parametros)
+
+        tempos = []
+        for _ in range(repeticoes):
+            inicio = time.perf_counter()
+            status = self.requisitar(cliente, url, parametros)
+            tempos.append((time.perf_counter() - inicio) * 1000)
+
+        # Consultas e memória em uma passada separada, para não distorcer a latência.
+        # coletar_consultas também conta as das threads da busca paralela.
+        with coletar_consultas() as coletor:
+            tracemalloc.start()
+            self.requisitar(cliente, url, parametros)
+            _, pico = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+        return {
+            'status': status,
+            'p50_ms': round(percentil(tempos, 50), 2),
+            'p95_ms': round(percentil(tempos, 95), 2),
+            'media_ms': round(sum(tempos) / len(tempos), 2),
+            'consultas': len(coletor.consultas),
+            'pico_memoria_kb': round(pico / 1024, 1),
+        }
+
+    def comparar(self, anterior, atual):
+        self.stdout.write(f"\nVariação em relação a {anterior.get('gerado_em', 'relatório anterior')}:")
+        for nome, r in atual['cenarios'].items():
+            antes = anterior.get('cenarios', {}).get(nome)
+            if not antes:
+                continue
+            variacao = (r['p95_ms'] - antes['p95_ms']) / antes['p95_ms'] * 100 if antes['p95_ms'] else 0
+            estilo = self.style.ERROR if variacao > 20 else self.style.SUCCESS
+            self.stdout.write(estilo(
+                f"{nome:<26} p95 {antes['p95_ms']:.1f} -> {r['p95_ms']:.1f} ms ({variacao:+.0f}%)  "
+                f"consultas {antes['consultas']} -> {r['consultas']}"
+            ))
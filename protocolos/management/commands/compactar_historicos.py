@@ -0,0 +1,98 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from protocolos.compactacao import candidatos_compactacao, compactar_historicos
+from protocolos.historico import pagina_historico
+from protocolos.models import Atualizacao, HistoricoCompactado, Protocolo
+
+from .benchmark_views import percentil
+
+
+def _tamanho_tabelas():
+    """Bytes ocupados (dados, índices e TOAST) pelas tabelas do histórico; só no PostgreSQL"""
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT pg_total_relation_size(%s::regclass) + pg_total_relation_size(%s::regclass)',
+            [Atualizacao._meta.db_table, HistoricoCompactado._meta.db_table],
+        )
+        return cursor.fetchone()[0]
+
+
+def _kib(valor):
+    return f'{valor / 1024:,.0f} KiB'
+
+
+class Command(BaseCommand):
+    help = (
+        'Compacta o histórico de atualizações dos protocolos finalizados há mais de '
+        'PROTOCOLOS_COMPACTAR_APOS_DIAS e informa a economia de espaço. Com --medir, '
+        'mede também a leitura do histórico antes e depois.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, help='Substitui PROTOCOLOS_COMPACTAR_APOS_DIAS.')
+        parser.add_argument('--lote', type=int, default=500, help='Protocolos por transação.')
+        parser.add_argument('--formato', choices=[f for f, _ in HistoricoCompactado.FORMATO_CHOICES])
+        parser.add_argument('--simular', action='store_true', help='Só informa quantos seriam compactados.')
+        parser.add_argument(
+            '--medir', type=int, default=0, metavar='N',
+            help='Mede a primeira página do histórico de N protocolos compactados, antes e depois.',
+        )
+
+    def handle(self, *args, **options):
+        if options['lote'] < 1:
+            raise CommandError('--lote deve ser positivo.')
+        candidatos = candidatos_compactacao(options['dias'])
+        if options['simular']:
+            self.stdout.write(f'{candidatos.count()} protocolo(s) teriam o histórico compactado.')
+            return
+
+        amostra = []
+        if options['medir']:
+            ids = list(candidatos.values_list('pk', flat=True))
+            amostra = list(Protocolo.objects.filter(
+                pk__in=random.Random(42).sample(ids, min(options['medir'], len(ids)))
+            ))
+        antes_leitura = self.medir(amostra)
+        antes_tabelas = _tamanho_tabelas()
+
+        inicio = time.perf_counter()
+        resultado = compactar_historicos(
+            options['dias'], lote=options['lote'], formato=options['formato'],
+            progresso=lambda parcial: self.stdout.write(f'{parcial.protocolos} protocolo(s) compactado(s)...'),
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'{resultado.protocolos} protocolo(s) e {resultado.atualizacoes} atualização(ões) '
+            f'compactados em {time.perf_counter() - inicio:.1f}s.'
+        ))
+        if resultado.bytes_json:
+            self.stdout.write(
+                f'JSON {_kib(resultado.bytes_json)} -> comprimido {_kib(resultado.bytes_comprimidos)} '
+                f'({resultado.proporcao:.0%})'
+            )
+        if antes_tabelas is not None:
+            # O espaço das linhas removidas volta a ser usado após o VACUUM
+            self.stdout.write(
+                f'Tabelas de histórico: {_kib(antes_tabelas)} -> {_kib(_tamanho_tabelas())} (antes do VACUUM)'
+            )
+
+        if amostra:
+            depois_leitura = self.medir(amostra)
+            for rotulo, tempos in (('antes', antes_leitura), ('depois', depois_leitura)):
+                self.stdout.write(
+                    f'Leitura do histórico {rotulo:<7} p50 {percentil(tempos, 50):>7.2f} ms  '
+                    f'p95 {percentil(tempos, 95):>7.2f} ms  ({len(tempos)} protocolos)'
+                )
+
+    def medir(self, protocolos):
+        tempos = []
+        for protocolo in protocolos:
+            inicio = time.perf_counter()
+            pagina_historico(protocolo)
+            tempos.append((time.perf_counter() - inicio) * 1000)
+        return tempos
@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from protocolos.sinteticos import gerar_dados_sinteticos
+
+
+class Command(BaseCommand):
+    help = 'Gera clientes, protocolos e atualizações sintéticos (semente fixa, bulk inserts) para testes de carga.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clientes', type=int, default=1_000)
+        parser.add_argument('--protocolos', type=int, default=10_000)
+        parser.add_argument('--atualizacoes', type=int, default=3, help='Atualizações por protocolo.')
+        parser.add_argument('--usuarios', type=int, default=10)
+        parser.add_argument('--dias', type=int, default=365, help='Período coberto pelas datas de criação.')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--lote', type=int, default=5_000)
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        gerar_dados_sinteticos(
+            clientes=options['clientes'],
+            protocolos=options['protocolos'],
+            atualizacoes_por_protocolo=options['atualizacoes'],
+            usuarios=options['usuarios'],
+            dias=options['dias'],
+            seed=options['seed'],
+            lote=options['lote'],
+            progresso=lambda feitos, total: self.stdout.write(f'{feitos}/{total} protocolos'),
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Dados sintéticos gerados em {time.perf_counter() - inicio:.1f}s."
+        ))
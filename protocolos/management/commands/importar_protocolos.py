@@ -0,0 +1,318 @@
+import csv
+import json
+import time
+from itertools import islice
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.core.validators import validate_email
+from django.db import transaction
+from django.db.models.functions import Lower
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from protocolos import eventos
+from protocolos.busca import atualizar_indice_busca
+from protocolos.metricas import marcar_dias_pendentes
+from protocolos.contadores import invalidar_contadores, invalidar_ultimos_protocolos
+from protocolos.models import Atualizacao, Cliente, Protocolo
+
+STATUS_VALIDOS = {status for status, _ in Protocolo.STATUS_CHOICES}
+
+
+def ler_registros(caminho, formato):
+    """Lê o arquivo em streaming, devolvendo dicionários em ordem"""
+    with open(caminho, encoding='utf-8', newline='') as arquivo:
+        if formato == 'csv':
+            yield from csv.DictReader(arquivo)
+        else:
+            for linha in arquivo:
+                if linha.strip():
+                    yield json.loads(linha)
+
+
+def normalizar_clientes(valor):
+    """
+    Aceita uma lista de {"nome", "email"} (JSONL) ou o texto
+    "Nome <email>; Outro <email>" (CSV), onde uma entrada sem <> é o próprio
+    email. Retorna [(email, nome), ...]; ValidationError se algum email for inválido.
+    """
+    if not valor:
+        return []
+    if isinstance(valor, str):
+        itens = []
+        for parte in valor.split(';'):
+            parte = parte.strip()
+            if not parte:
+                continue
+            if '<' in parte and parte.endswith('>'):
+                nome, email = parte[:-1].split('<', 1)
+                itens.append({'nome': nome.strip(), 'email': email.strip()})
+            else:
+                itens.append({'nome': parte, 'email': parte})
+        valor = itens
+    clientes = [(item['email'].strip().lower(), (item.get('nome') or item['email']).strip()) for item in valor]
+    for email, nome in clientes:
+        try:
+            validate_email(email)
+        except ValidationError:
+            raise ValidationError(f'cliente "{nome}" sem email válido')
+    return clientes
+
+
+def ler_data(valor):
+    """Data e hora ISO 8601 (sem fuso: o horário local); None se vazio, ValueError se inválido"""
+    if not valor:
+        return None
+    data = parse_datetime(valor)
+    if data is None:
+        raise ValueError
+    return timezone.make_aware(data) if timezone.is_naive(data) else data
+
+
+def gravar_checkpoint(checkpoint, caminho, processados, pendente=None):
+    dados = {'arquivo': str(caminho), 'registros_processados': processados}
+    if pendente:
+        dados['lote_pendente'] = pendente
+    checkpoint.write_text(json.dumps(dados))
+
+
+def ler_checkpoint(checkpoint):
+    """
+    Registros já importados segundo o checkpoint. Um lote pendente (gravado
+    antes do commit) conta como importado se o primeiro número reservado
+    para ele existe no banco, ou seja, se o commit aconteceu.
+    """
+    dados = json.loads(checkpoint.read_text())
+    pendente = dados.get('lote_pendente')
+    if pendente and Protocolo.objects.filter(numero=pendente['primeiro_numero']).exists():
+        return pendente['registros_processados']
+    return dados['registros_processados']
+
+
+class Command(BaseCommand):
+    help = (
+        'Importa protocolos e clientes de um arquivo CSV ou JSONL em lotes '
+        '(bulk insert, números reservados em bloco, transação por lote).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('arquivo')
+        parser.add_argument('--formato', choices=['csv', 'jsonl'], help='Padrão: pela extensão do arquivo.')
+        parser.add_argument('--lote', type=int, default=1000, help='Registros por transação.')
+        parser.add_argument('--usuario', help='Username usado quando o registro não informa o criador.')
+        parser.add_argument('--dry-run', action='store_true', help='Valida e executa tudo, mas desfaz cada lote.')
+        parser.add_argument('--checkpoint', help='Arquivo onde o progresso é salvo após cada lote confirmado.')
+        parser.add_argument('--retomar', action='store_true', help='Continua a partir do --checkpoint.')
+
+    def handle(self, *args, **options):
+        caminho = Path(options['arquivo'])
+        if not caminho.is_file():
+            raise CommandError(f'Arquivo não encontrado: {caminho}')
+        formato = options['formato'] or ('jsonl' if caminho.suffix in ('.jsonl', '.ndjson') else 'csv')
+        if options['lote'] < 1:
+            raise CommandError('--lote deve ser positivo.')
+        if options['retomar'] and not options['checkpoint']:
+            raise CommandError('--retomar requer --checkpoint.')
+
+        self.usuario_padrao = options['usuario']
+        self.usuarios = {}
+        self.dry_run = options['dry_run']
+        checkpoint = Path(options['checkpoint']) if options['checkpoint'] else None
+
+        inicio_registros = 0
+        if options['retomar'] and checkpoint.exists():
+            inicio_registros = ler_checkpoint(checkpoint)
+            self.stdout.write(f'Retomando após {inicio_registros} registros.')
+
+        registros = enumerate(ler_registros(caminho, formato))
+        registros = islice(registros, inicio_registros, None)
+
+        importados = invalidos = 0
+        processados = inicio_registros
+        inicio = time.perf_counter()
+        while True:
+            lote = list(islice(registros, options['lote']))
+            if not lote:
+                break
+            validos, erros = self.validar(lote)
+            for indice, erro in erros:
+                self.stderr.write(f'Registro {indice + 1}: {erro}')
+            fim_lote = lote[-1][0] + 1
+            gravar = checkpoint and not self.dry_run
+            if validos:
+                antes_do_commit = None
+                if gravar:
+                    # O lote fica registrado como pendente até o commit (ver ler_checkpoint)
+                    def antes_do_commit(primeiro, anterior=processados, fim=fim_lote):
+                        gravar_checkpoint(
+                            checkpoint, caminho, anterior,
+                            pendente={'registros_processados': fim, 'primeiro_numero': primeiro},
+                        )
+                self.importar_lote(validos, antes_do_commit)
+            importados += len(validos)
+            invalidos += len(erros)
+            processados = fim_lote
+
+            if gravar:
+                gravar_checkpoint(checkpoint, caminho, processados)
+            decorrido = time.perf_counter() - inicio
+            self.stdout.write(
+                f'{processados} registros lidos, {importados} importados '
+                f'({importados / decorrido if decorrido else 0:.0f} registros/s)'
+            )
+
+        if not self.dry_run:
+            invalidar_contadores()
+            invalidar_ultimos_protocolos()
+
+        decorrido = time.perf_counter() - inicio
+        mensagem = (
+            f'{importados} protocolos importados, {invalidos} registros inválidos, '
+            f'{decorrido:.1f}s ({importados / decorrido if decorrido else 0:.0f} registros/s)'
+        )
+        if self.dry_run:
+            mensagem += ' [dry-run: nada foi gravado]'
+        self.stdout.write(self.style.SUCCESS(mensagem))
+
+    def obter_usuarios(self, usernames):
+        faltantes = set(usernames) - set(self.usuarios)
+        if faltantes:
+            self.usuarios.update(User.objects.filter(username__in=faltantes).values_list('username', 'pk'))
+        return self.usuarios
+
+    def validar(self, lote):
+        usuarios = self.obter_usuarios({
+            registro.get('usuario') or self.usuario_padrao
+            for _, registro in lote
+            if registro.get('usuario') or self.usuario_padrao
+        })
+        validos, erros = [], []
+        for indice, registro in lote:
+            username = registro.get('usuario') or self.usuario_padrao
+            status = registro.get('status') or 'aberto'
+            try:
+                clientes = normalizar_clientes(registro.get('clientes'))
+            except ValidationError as erro:
+                erros.append((indice, erro.message))
+                continue
+            except (KeyError, TypeError, ValueError, AttributeError):
+                erros.append((indice, 'clientes em formato inválido'))
+                continue
+            try:
+                data_criacao = ler_data(registro.get('data_criacao'))
+                data_finalizacao = ler_data(registro.get('data_finalizacao'))
+            except (TypeError, ValueError):
+                erros.append((indice, 'data_criacao/data_finalizacao devem estar em ISO 8601'))
+                continue
+            if not registro.get('buic_dispositivo') or not registro.get('descricao_problema'):
+                erros.append((indice, 'buic_dispositivo e descricao_problema são obrigatórios'))
+            elif username not in usuarios:
+                erros.append((indice, f'usuário "{username}" não encontrado'))
+            elif status not in STATUS_VALIDOS:
+                erros.append((indice, f'status "{status}" inválido'))
+            else:
+                validos.append({
+                    'buic_dispositivo': registro['buic_dispositivo'],
+                    'descricao_problema': registro['descricao_problema'],
+                    'status': status,
+                    'usuario_id': usuarios[username],
+                    'usuario': username,
+                    'clientes': clientes,
+                    'atualizacao': registro.get('atualizacao') or '',
+                    'data_criacao': data_criacao,
+                    'data_finalizacao': data_finalizacao,
+                })
+        return validos, erros
+
+    def importar_lote(self, registros, antes_do_commit=None):
+        agora = timezone.now()
+        # Números reservados em bloco, em uma transação curta: a linha do
+        # contador não fica travada durante o lote. Se o lote falhar, o bloco
+        # vira um intervalo sem protocolos. No dry-run a reserva é desfeita com o lote.
+        primeiro = None if self.dry_run else Protocolo.reservar_numeros(len(registros))
+        with transaction.atomic():
+            if primeiro is None:
+                primeiro = Protocolo.reservar_numeros(len(registros))
+            # Clientes: o email chega em minúsculas, mas os já cadastrados podem
+            # ter maiúsculas; esses são encontrados por LOWER(email) e só têm o
+            # nome atualizado. Os demais entram com um upsert por email.
+            clientes = {}
+            for registro in registros:
+                clientes.update(registro['clientes'])
+            cliente_ids = dict(
+                Cliente.objects.annotate(email_normalizado=Lower('email'))
+                .filter(email_normalizado__in=clientes)
+                .values_list('email_normalizado', 'pk')
+            )
+            if cliente_ids:
+                Cliente.objects.bulk_update(
+                    [Cliente(pk=pk, nome=clientes[email]) for email, pk in cliente_ids.items()], ['nome']
+                )
+            novos = {email: nome for email, nome in clientes.items() if email not in cliente_ids}
+            if novos:
+                Cliente.objects.bulk_create(
+                    [Cliente(nome=nome, email=email, senha='') for email, nome in novos.items()],
+                    update_conflicts=True,
+                    unique_fields=['email'],
+                    update_fields=['nome'],
+                )
+                cliente_ids.update(Cliente.objects.filter(email__in=novos).values_list('email', 'pk'))
+
+            # Protocolos: datas de origem, quando informadas; senão, o momento da importação
+            protocolos = [
+                Protocolo(
+                    numero=primeiro + i,
+                    buic_dispositivo=registro['buic_dispositivo'],
+                    descricao_problema=registro['descricao_problema'],
+                    status=registro['status'],
+                    usuario_criador_id=registro['usuario_id'],
+                    data_criacao=registro['data_criacao'] or agora,
+                    data_finalizacao=(
+                        registro['data_finalizacao'] or agora if registro['status'] == 'finalizado' else None
+                    ),
+                )
+                for i, registro in enumerate(registros)
+            ]
+            Protocolo.objects.bulk_create(protocolos)
+            protocolo_ids = dict(
+                Protocolo.objects.filter(numero__gte=primeiro, numero__lt=primeiro + len(registros))
+                .values_list('numero', 'pk')
+            )
+
+            Vinculo = Protocolo.clientes.through
+            Vinculo.objects.bulk_create(
+                [
+                    Vinculo(protocolo_id=protocolo_ids[primeiro + i], cliente_id=cliente_ids[email])
+                    for i, registro in enumerate(registros)
+                    for email, _ in registro['clientes']
+                ],
+                ignore_conflicts=True,
+            )
+            # Protocolo e usuário já preenchidos: o evento não precisa consultá-los
+            atualizacoes = Atualizacao.objects.bulk_create([
+                Atualizacao(
+                    protocolo=Protocolo(pk=protocolo_ids[primeiro + i], numero=primeiro + i),
+                    descricao=registro['atualizacao'],
+                    usuario=User(pk=registro['usuario_id'], username=registro['usuario']),
+                )
+                for i, registro in enumerate(registros)
+                if registro['atualizacao']
+            ])
+            eventos.publicar_atualizacoes(atualizacoes)
+            # Como em Atualizacao.save(): a primeira atualização inicia o atendimento
+            Protocolo.iniciar_atendimento(
+                protocolo_ids[primeiro + i] for i, registro in enumerate(registros) if registro['atualizacao']
+            )
+            atualizar_indice_busca(protocolo_ids.values())
+            datas = [agora]
+            for protocolo in protocolos:
+                datas += [protocolo.data_criacao, protocolo.data_finalizacao]
+            marcar_dias_pendentes(datas)
+
+            if antes_do_commit:
+                antes_do_commit(primeiro)
+            if self.dry_run:
+                transaction.set_rollback(True)
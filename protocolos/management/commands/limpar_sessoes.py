@@ -0,0 +1,38 @@
+import time
+from importlib import import_module
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = (
+        'Remove do banco as sessões expiradas, como o clearsessions do Django. '
+        'Pensado para rodar diariamente (cron) ou com --intervalo.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--intervalo', type=float,
+            help='Continua em execução, limpando as sessões expiradas a cada N segundos.',
+        )
+
+    def handle(self, *args, **options):
+        engine = import_module(settings.SESSION_ENGINE)
+        if not hasattr(engine.SessionStore, 'get_model_class'):
+            # Cookies assinados: a expiração é conferida na leitura
+            self.stdout.write(f'{settings.SESSION_ENGINE} não guarda sessões no banco; nada a limpar.')
+            return
+        Sessao = engine.SessionStore.get_model_class()
+
+        while True:
+            inicio = time.perf_counter()
+            expiradas = Sessao.objects.filter(expire_date__lt=timezone.now()).count()
+            engine.SessionStore.clear_expired()
+            self.stdout.write(self.style.SUCCESS(
+                f'{expiradas} sessão(ões) expirada(s) removida(s) em {time.perf_counter() - inicio:.1f}s.'
+            ))
+            if not options['intervalo']:
+                break
+            time.sleep(options['intervalo'])
@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from protocolos.models import Exportacao
+from protocolos.tarefas import executar_exportacao, recuperar_interrompidas
+
+
+class Command(BaseCommand):
+    help = 'Processa as exportações pendentes (worker local, sem broker externo).'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--uma-vez', action='store_true',
+            help='Processa as exportações pendentes e encerra, em vez de aguardar novas.',
+        )
+        parser.add_argument('--intervalo', type=float, default=5.0, help='Segundos entre verificações.')
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('Worker de exportações iniciado.'))
+        while True:
+            reenfileirados, com_erro = recuperar_interrompidas()
+            if reenfileirados or com_erro:
+                self.stdout.write(self.style.WARNING(
+                    f'Interrompidas: {reenfileirados} de volta à fila, {com_erro} com erro.'
+                ))
+            pendentes = list(
+                Exportacao.objects.filter(status='pendente').order_by('data_criacao').values_list('pk', flat=True)
+            )
+            for exportacao_id in pendentes:
+                executar_exportacao(exportacao_id)
+                exportacao = Exportacao.objects.get(pk=exportacao_id)
+                estilo = self.style.SUCCESS if exportacao.status == 'concluida' else self.style.WARNING
+                self.stdout.write(estilo(f'{exportacao}: {exportacao.get_status_display()}'))
+
+            if options['uma_vez']:
+                break
+            time.sleep(options['intervalo'])
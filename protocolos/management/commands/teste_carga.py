@@ -0,0 +1,121 @@
+import http.client
+import threading
+import time
+from importlib import import_module
+from urllib.parse import urlencode, urlsplit
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from .benchmark_views import percentil
+
+# (nome, url, parâmetros GET): os endpoints de leitura servidos por views assíncronas
+CENARIOS = [
+    ('busca_json', 'busca_global_json', {'q': 'servidor'}),
+    ('busca_html', 'busca_global', {'q': 'BUIC'}),
+    ('autocomplete_clientes', 'autocomplete_clientes', {'q': 'com'}),
+    ('metricas_diarias', 'metricas_diarias', {'dias': 30}),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Teste de carga HTTP dos endpoints de busca, autocomplete e métricas contra '
+        'servidores já em execução, para comparar o modo WSGI com o ASGI. Exemplo: '
+        'gunicorn sistema_protocolos.wsgi -w 4 -b :8001 & '
+        'gunicorn sistema_protocolos.asgi:application -w 4 -k uvicorn.workers.UvicornWorker -b :8002 & '
+        'python manage.py teste_carga --alvos wsgi=http://localhost:8001 asgi=http://localhost:8002'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--alvos', nargs='+', required=True, metavar='NOME=URL',
+            help='Servidores a comparar; todos devem usar este banco (a sessão de login é criada aqui).',
+        )
+        parser.add_argument('--usuario', help='Usuário autenticado nas requisições (padrão: o primeiro superusuário).')
+        parser.add_argument('--conexoes', type=int, default=16, help='Clientes simultâneos, cada um com keep-alive.')
+        parser.add_argument('--duracao', type=float, default=10.0, help='Segundos de carga por cenário e alvo.')
+        parser.add_argument('--cenarios', nargs='+', choices=[c[0] for c in CENARIOS], default=[c[0] for c in CENARIOS])
+
+    def handle(self, *args, **options):
+        alvos = []
+        for alvo in options['alvos']:
+            nome, separador, url = alvo.partition('=')
+            if not separador or urlsplit(url).scheme not in ('http', 'https'):
+                raise CommandError(f'Alvo inválido: {alvo!r} (use NOME=http://host:porta).')
+            alvos.append((nome, url.rstrip('/')))
+
+        cookie = f'{settings.SESSION_COOKIE_NAME}={self.sessao(options["usuario"])}'
+        self.stdout.write(f"{options['conexoes']} conexões, {options['duracao']:.0f}s por cenário")
+        self.stdout.write(
+            f"{'cenário':<24}{'alvo':<10}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'erros':>7}"
+        )
+        for nome_cenario, nome_url, parametros in CENARIOS:
+            if nome_cenario not in options['cenarios']:
+                continue
+            caminho = f'{reverse(nome_url)}?{urlencode(parametros)}'
+            for nome_alvo, url in alvos:
+                tempos, erros, decorrido = self.medir(url + caminho, cookie, options)
+                if not tempos:
+                    self.stdout.write(self.style.ERROR(f'{nome_cenario:<24}{nome_alvo:<10} nenhuma resposta válida'))
+                    continue
+                self.stdout.write(
+                    f'{nome_cenario:<24}{nome_alvo:<10}{len(tempos) / decorrido:>9.1f}'
+                    f'{percentil(tempos, 50):>9.1f}{percentil(tempos, 95):>9.1f}{percentil(tempos, 99):>9.1f}'
+                    f'{erros:>7}'
+                )
+
+    def sessao(self, username):
+        usuarios = User.objects.filter(username=username) if username else User.objects.filter(is_superuser=True)
+        usuario = usuarios.order_by('pk').first()
+        if usuario is None:
+            raise CommandError('Usuário não encontrado; informe --usuario.')
+        # O mesmo que django.contrib.auth.login grava na sessão
+        sessao = import_module(settings.SESSION_ENGINE).SessionStore()
+        sessao[SESSION_KEY] = str(usuario.pk)
+        sessao[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        sessao[HASH_SESSION_KEY] = usuario.get_session_auth_hash()
+        sessao.save()
+        return sessao.session_key
+
+    def medir(self, url, cookie, options):
+        partes = urlsplit(url)
+        classe = http.client.HTTPSConnection if partes.scheme == 'https' else http.client.HTTPConnection
+        alvo = f'{partes.path}?{partes.query}'
+        tempos, erros, trava = [], [0], threading.Lock()
+        limite = time.perf_counter() + options['duracao']
+
+        def trabalhar():
+            conexao = classe(partes.netloc, timeout=30)
+            locais, falhas = [], 0
+            try:
+                while time.perf_counter() < limite:
+                    inicio = time.perf_counter()
+                    try:
+                        conexao.request('GET', alvo, headers={'Cookie': cookie})
+                        resposta = conexao.getresponse()
+                        resposta.read()
+                    except (OSError, http.client.HTTPException):
+                        falhas += 1
+                        conexao.close()
+                        continue
+                    if resposta.status == 200:
+                        locais.append((time.perf_counter() - inicio) * 1000)
+                    else:
+                        falhas += 1
+            finally:
+                conexao.close()
+            with trava:
+                tempos.extend(locais)
+                erros[0] += falhas
+
+        inicio = time.perf_counter()
+        threads = [threading.Thread(target=trabalhar) for _ in range(options['conexoes'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return tempos, erros[0], time.perf_counter() - inicio
@@ -0,0 +1,224 @@
+"""
+Métricas diárias de SLA e vazão.
+
+Os sinais marcam em DiaMetricaPendente os dias afetados por cada alteração
+(dias de criação e de finalização do protocolo); o comando atualizar_metricas
+recalcula esses dias com algumas consultas agregadas por janela e regrava as
+linhas de MetricaDiaria, MetricaDiariaUsuario e MetricaDiariaCliente. As views
+de métricas leem apenas essas tabelas, então o custo não depende do histórico.
+
+O backlog não é gravado: backlog(d) = backlog atual - Σ(criados - finalizados)
+dos dias posteriores a d. Assim um protocolo importado com data antiga só
+invalida o próprio dia, e não todos os dias seguintes.
+"""
+import datetime
+import statistics
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .contadores import obter_contadores
+from .models import (
+    DiaMetricaPendente, MetricaDiaria, MetricaDiariaCliente, MetricaDiariaUsuario, Protocolo,
+)
+
+# Maior intervalo de dias recalculado com as mesmas consultas
+JANELA_DIAS = 31
+
+
+def _dia(valor):
+    return timezone.localdate(valor) if isinstance(valor, datetime.datetime) else valor
+
+
+def _inicio_do_dia(dia):
+    return timezone.make_aware(datetime.datetime.combine(dia, datetime.time.min))
+
+
+def marcar_dias_pendentes(datas):
+    """Agenda o recálculo dos dias das datas informadas (datetimes ou dates; None é ignorado)"""
+    dias = {_dia(data) for data in datas if data}
+    if dias:
+        DiaMetricaPendente.objects.bulk_create(
+            [DiaMetricaPendente(dia=dia) for dia in dias], ignore_conflicts=True
+        )
+
+
+def marcar_protocolos_pendentes(protocolos):
+    """Como marcar_dias_pendentes, para os dias de criação e finalização de `protocolos`"""
+    datas = []
+    for criacao, finalizacao in protocolos.values_list('data_criacao', 'data_finalizacao'):
+        datas += [criacao, finalizacao]
+    marcar_dias_pendentes(datas)
+
+
+def _janelas(dias):
+    janela = []
+    for dia in sorted(set(dias)):
+        if janela and (dia - janela[0]).days >= JANELA_DIAS:
+            yield janela
+            janela = []
+        janela.append(dia)
+    if janela:
+        yield janela
+
+
+def _resolucao(duracoes):
+    if not duracoes:
+        return None, None, None
+    if len(duracoes) == 1:
+        return duracoes[0], duracoes[0], duracoes[0]
+    decis = statistics.quantiles(duracoes, n=10, method='inclusive')
+    return statistics.fmean(duracoes), statistics.median(duracoes), decis[8]
+
+
+def recalcular_dias(dias):
+    """Reconstrói as métricas dos dias informados e retorna quantos foram recalculados"""
+    total = 0
+    for janela in _janelas(dias):
+        _recalcular_janela(janela)
+        total += len(janela)
+    return total
+
+
+def _recalcular_janela(dias):
+    inicio, fim = _inicio_do_dia(dias[0]), _inicio_do_dia(dias[-1] + datetime.timedelta(days=1))
+    selecionados = set(dias)
+    Vinculo = Protocolo.clientes.through
+
+    criados = Counter()
+    finalizados = Counter()
+    duracoes = defaultdict(list)
+    por_usuario = defaultdict(Counter)
+    por_cliente = defaultdict(Counter)
+
+    criacoes = (
+        Protocolo.objects.filter(data_criacao__gte=inicio, data_criacao__lt=fim)
+        .annotate(dia=TruncDate('data_criacao'))
+        .values('dia', 'usuario_criador_id')
+        .annotate(total=Count('id'))
+        .values_list('dia', 'usuario_criador_id', 'total')
+    )
+    for dia, usuario_id, quantidade in criacoes:
+        criados[dia] += quantidade
+        por_usuario[dia, usuario_id]['criados'] += quantidade
+
+    finalizacoes = (
+        Protocolo.objects.filter(status='finalizado', data_finalizacao__gte=inicio, data_finalizacao__lt=fim)
+        .annotate(dia=TruncDate('data_finalizacao'))
+        .values_list('dia', 'usuario_criador_id', 'data_criacao', 'data_finalizacao')
+    )
+    for dia, usuario_id, criacao, finalizacao in finalizacoes:
+        finalizados[dia] += 1
+        duracoes[dia].append(max((finalizacao - criacao).total_seconds(), 0))
+        por_usuario[dia, usuario_id]['finalizados'] += 1
+
+    for campo, chave in (('data_criacao', 'criados'), ('data_finalizacao', 'finalizados')):
+        filtro = {f'protocolo__{campo}__gte': inicio, f'protocolo__{campo}__lt': fim}
+        if chave == 'finalizados':
+            filtro['protocolo__status'] = 'finalizado'
+        vinculos = (
+            Vinculo.objects.filter(**filtro)
+            .annotate(dia=TruncDate(f'protocolo__{campo}'))
+            .values('dia', 'cliente_id')
+            .annotate(total=Count('id'))
+            .values_list('dia', 'cliente_id', 'total')
+        )
+        for dia, cliente_id, quantidade in vinculos:
+            por_cliente[dia, cliente_id][chave] += quantidade
+
+    metricas = []
+    for dia in dias:
+        media, p50, p90 = _resolucao(duracoes[dia])
+        metricas.append(MetricaDiaria(
+            dia=dia, criados=criados[dia], finalizados=finalizados[dia],
+            resolucao_media=media, resolucao_p50=p50, resolucao_p90=p90,
+        ))
+
+    with transaction.atomic():
+        MetricaDiaria.objects.filter(dia__in=dias).delete()
+        MetricaDiariaUsuario.objects.filter(dia__in=dias).delete()
+        MetricaDiariaCliente.objects.filter(dia__in=dias).delete()
+        MetricaDiaria.objects.bulk_create(metricas)
+        MetricaDiariaUsuario.objects.bulk_create([
+            MetricaDiariaUsuario(dia=dia, usuario_id=usuario_id, **valores)
+            for (dia, usuario_id), valores in por_usuario.items() if dia in selecionados
+        ])
+        MetricaDiariaCliente.objects.bulk_create([
+            MetricaDiariaCliente(dia=dia, cliente_id=cliente_id, **valores)
+            for (dia, cliente_id), valores in por_cliente.items() if dia in selecionados
+        ])
+
+
+def processar_pendentes():
+    """Recalcula os dias marcados como pendentes; retorna quantos foram recalculados"""
+    # A marcação é removida antes do recálculo: alterações feitas durante ele marcam o dia de novo
+    dias = list(DiaMetricaPendente.objects.values_list('dia', flat=True))
+    if not dias:
+        return 0
+    DiaMetricaPendente.objects.filter(dia__in=dias).delete()
+    try:
+        return recalcular_dias(dias)
+    except Exception:
+        marcar_dias_pendentes(dias)
+        raise
+
+
+def recalcular_tudo():
+    primeiro = Protocolo.objects.order_by('data_criacao').values_list('data_criacao', flat=True).first()
+    if primeiro is None:
+        return 0
+    hoje = timezone.localdate()
+    inicio = timezone.localdate(primeiro)
+    return recalcular_dias(inicio + datetime.timedelta(days=i) for i in range((hoje - inicio).days + 1))
+
+
+def _horas(segundos):
+    return round(segundos / 3600, 2) if segundos is not None else None
+
+
+def serie_diaria(dias=30):
+    """Criados, finalizados, backlog e tempo de resolução (horas) dos últimos `dias` dias"""
+    hoje = timezone.localdate()
+    inicio = hoje - datetime.timedelta(days=dias - 1)
+    linhas = {metrica.dia: metrica for metrica in MetricaDiaria.objects.filter(dia__gte=inicio, dia__lte=hoje)}
+
+    contadores = obter_contadores()
+    backlog = contadores['aberto'] + contadores['em_andamento']
+    serie = []
+    for i in range(dias):
+        dia = hoje - datetime.timedelta(days=i)
+        metrica = linhas.get(dia) or MetricaDiaria(dia=dia)
+        serie.append({
+            'dia': dia.isoformat(),
+            'criados': metrica.criados,
+            'finalizados': metrica.finalizados,
+            'backlog': backlog,
+            'resolucao_media_h': _horas(metrica.resolucao_media),
+            'resolucao_p50_h': _horas(metrica.resolucao_p50),
+            'resolucao_p90_h': _horas(metrica.resolucao_p90),
+        })
+        # Backlog ao fim do dia anterior
+        backlog -= metrica.criados - metrica.finalizados
+    serie.reverse()
+    return serie
+
+
+def _totais(queryset, campo_nome, dias, limite):
+    inicio = timezone.localdate() - datetime.timedelta(days=dias - 1)
+    return list(
+        queryset.filter(dia__gte=inicio)
+        .values(nome=F(campo_nome))
+        .annotate(criados=Sum('criados'), finalizados=Sum('finalizados'))
+        .order_by('-finalizados', '-criados', 'nome')[:limite]
+    )
+
+
+def vazao_por_usuario(dias=30, limite=10):
+    return _totais(MetricaDiariaUsuario.objects.all(), 'usuario__username', dias, limite)
+
+
+def clientes_mais_ativos(dias=30, limite=10):
+    return _totais(MetricaDiariaCliente.objects.all(), 'cliente__nome', dias, limite)
@@ -0,0 +1,66 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:06
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Cliente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nome', models.CharField(max_length=255)),
+                ('email', models.EmailField(max_length=254, unique=True)),
+                ('senha', models.CharField(max_length=255)),
+                ('data_cadastro', models.DateTimeField(auto_now_add=True)),
+                ('ativo', models.BooleanField(default=True)),
+            ],
+            options={
+                'verbose_name': 'Cliente',
+                'verbose_name_plural': 'Clientes',
+            },
+        ),
+        migrations.CreateModel(
+            name='Protocolo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('numero', models.IntegerField(blank=True, null=True, unique=True)),
+                ('buic_dispositivo', models.CharField(max_length=255)),
+                ('descricao_problema', models.TextField()),
+                ('status', models.CharField(choices=[('aberto', 'Aberto'), ('em_andamento', 'Em Andamento'), ('finalizado', 'Finalizado')], default='aberto', max_length=20)),
+                ('data_criacao', models.DateTimeField(auto_now_add=True)),
+                ('data_finalizacao', models.DateTimeField(blank=True, null=True)),
+                ('clientes', models.ManyToManyField(related_name='protocolos', to='protocolos.cliente')),
+                ('usuario_criador', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='protocolos_criados', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Protocolo',
+                'verbose_name_plural': 'Protocolos',
+                'ordering': ['-data_criacao'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Atualizacao',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('descricao', models.TextField()),
+                ('data_hora', models.DateTimeField(auto_now_add=True)),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('protocolo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='atualizacoes', to='protocolos.protocolo')),
+            ],
+            options={
+                'verbose_name': 'Atualização',
+                'verbose_name_plural': 'Atualizações',
+                'ordering': ['-data_hora'],
+            },
+        ),
+    ]
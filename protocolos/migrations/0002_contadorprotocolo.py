@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('protocolos', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContadorProtocolo',
+            fields=[
+                ('nome', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('proximo_numero', models.IntegerField()),
+            ],
+            options={
+                'verbose_name': 'Contador de Protocolos',
+                'verbose_name_plural': 'Contadores de Protocolos',
+            },
+        ),
+    ]
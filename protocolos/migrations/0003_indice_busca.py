@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:08
+
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+# Índices específicos do PostgreSQL; em outros bancos a busca usa icontains
+INDICES = [
+    ('protocolo_busca_gin', 'protocolos_protocolo', 'USING gin (search_vector)'),
+    ('protocolo_buic_trgm', 'protocolos_protocolo', 'USING gin (UPPER(buic_dispositivo::text) gin_trgm_ops)'),
+    ('cliente_nome_trgm', 'protocolos_cliente', 'USING gin (UPPER(nome::text) gin_trgm_ops)'),
+    ('cliente_email_trgm', 'protocolos_cliente', 'USING gin (UPPER(email::text) gin_trgm_ops)'),
+]
+
+PREENCHER_VETORES = """
+    UPDATE protocolos_protocolo AS p SET search_vector =
+        setweight(to_tsvector('portuguese', p.buic_dispositivo), 'A') ||
+        setweight(to_tsvector('portuguese', p.descricao_problema), 'B') ||
+        setweight(to_tsvector('portuguese', coalesce((
+            SELECT string_agg(c.nome || ' ' || c.email, ' ')
+            FROM protocolos_protocolo_clientes pc JOIN protocolos_cliente c ON c.id = pc.cliente_id
+            WHERE pc.protocolo_id = p.id
+        ), '')), 'B') ||
+        setweight(to_tsvector('portuguese', coalesce((
+            SELECT string_agg(a.descricao, ' ')
+            FROM protocolos_atualizacao a WHERE a.protocolo_id = p.id
+        ), '')), 'C')
+"""
+
+
+def criar_indices(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for nome, tabela, definicao in INDICES:
+        schema_editor.execute(f'CREATE INDEX IF NOT EXISTS {nome} ON {tabela} {definicao}')
+    schema_editor.execute(PREENCHER_VETORES)
+
+
+def remover_indices(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for nome, _, _ in INDICES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {nome}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('protocolos', '0002_contadorprotocolo'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='protocolo',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(criar_indices, remover_indices),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:14
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('protocolos', '0005_cliente_nome_id_idx'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='atualizacao',
+            name='data_hora',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='protocolo',
+            name='data_criacao',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:17
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('protocolos', '0006_datas_com_default'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='protocolo',
+            name='status_ordem',
+            field=models.GeneratedField(db_persist=True, expression=models.Case(models.When(status='aberto', then=models.Value(0)), models.When(status='em_andamento', then=models.Value(1)), models.When(status='finalizado', then=models.Value(2)), default=models.Value(99)), output_field=models.SmallIntegerField()),
+        ),
+        migrations.AlterField(
+            model_name='atualizacao',
+            name='protocolo',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='atualizacoes', to='protocolos.protocolo'),
+        ),
+        migrations.AlterField(
+            model_name='protocolo',
+            name='usuario_criador',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='protocolos_criados', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='atualizacao',
+            index=models.Index(fields=['protocolo', 'data_hora'], name='atualizacao_protocolo_hora_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='protocolo',
+            index=models.Index(fields=['data_criacao', 'id'], name='protocolo_criacao_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='protocolo',
+            index=models.Index(fields=['status', 'data_criacao'], name='protocolo_status_criacao_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='protocolo',
+            index=models.Index(fields=['usuario_criador', 'data_criacao'], name='protocolo_criador_criacao_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='protocolo',
+            index=models.Index(condition=models.Q(('status__in', ['aberto', 'em_andamento'])), fields=['data_criacao'], name='protocolo_ativos_criacao_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='protocolo',
+            index=models.Index(fields=['status_ordem', '-data_criacao', '-id'], name='protocolo_ordem_admin_idx'),
+        ),
+    ]
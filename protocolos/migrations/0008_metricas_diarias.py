@@ -0,0 +1,70 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:27
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('protocolos', '0007_indices_caminhos_de_acesso'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DiaMetricaPendente',
+            fields=[
+                ('dia', models.DateField(primary_key=True, serialize=False)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='MetricaDiaria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField(unique=True)),
+                ('criados', models.PositiveIntegerField(default=0)),
+                ('finalizados', models.PositiveIntegerField(default=0)),
+                ('resolucao_media', models.FloatField(blank=True, null=True)),
+                ('resolucao_p50', models.FloatField(blank=True, null=True)),
+                ('resolucao_p90', models.FloatField(blank=True, null=True)),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Métrica Diária',
+                'verbose_name_plural': 'Métricas Diárias',
+                'ordering': ['-dia'],
+            },
+        ),
+        migrations.CreateModel(
+            name='MetricaDiariaCliente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField()),
+                ('criados', models.PositiveIntegerField(default=0)),
+                ('finalizados', models.PositiveIntegerField(default=0)),
+                ('cliente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='protocolos.cliente')),
+            ],
+            options={
+                'verbose_name': 'Métrica Diária por Cliente',
+                'verbose_name_plural': 'Métricas Diárias por Cliente',
+                'constraints': [models.UniqueConstraint(fields=('dia', 'cliente'), name='metrica_cliente_dia_unica')],
+            },
+        ),
+        migrations.CreateModel(
+            name='MetricaDiariaUsuario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField()),
+                ('criados', models.PositiveIntegerField(default=0)),
+                ('finalizados', models.PositiveIntegerField(default=0)),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Métrica Diária por Usuário',
+                'verbose_name_plural': 'Métricas Diárias por Usuário',
+                'constraints': [models.UniqueConstraint(fields=('dia', 'usuario'), name='metrica_usuario_dia_unica')],
+            },
+        ),
+    ]
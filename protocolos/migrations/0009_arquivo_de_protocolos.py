@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:42
+
+from django.conf import settings
+from django.db import migrations, models
+
+# Índices da busca (ver 0003) restritos aos não arquivados; os completos
+# continuam atendendo a busca que inclui o arquivo
+INDICES = [
+    ('protocolo_busca_quentes_gin', 'USING gin (search_vector) WHERE NOT arquivado'),
+    ('protocolo_buic_quentes_trgm', 'USING gin (UPPER(buic_dispositivo::text) gin_trgm_ops) WHERE NOT arquivado'),
+]
+
+
+def criar_indices(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for nome, definicao in INDICES:
+        schema_editor.execute(f'CREATE INDEX IF NOT EXISTS {nome} ON protocolos_protocolo {definicao}')
+
+
+def remover_indices(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for nome, _ in INDICES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {nome}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('protocolos', '0008_metricas_diarias'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='protocolo',
+            name='arquivado',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='protocolo',
+            index=models.Index(condition=models.Q(('arquivado', False)), fields=['-data_criacao', '-id'], name='protocolo_quentes_criacao_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='protocolo',
+            index=models.Index(condition=models.Q(('arquivado', False)), fields=['status_ordem', '-data_criacao', '-id'], name='protocolo_quentes_admin_idx'),
+        ),
+        migrations.RunPython(criar_indices, remover_indices),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:48
+
+import django.contrib.postgres.search
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('protocolos', '0009_arquivo_de_protocolos'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HistoricoCompactado',
+            fields=[
+                ('protocolo', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='historico_compactado', serialize=False, to='protocolos.protocolo')),
+                ('formato', models.CharField(choices=[('zlib', 'zlib'), ('zstd', 'Zstandard')], default='zlib', max_length=10)),
+                ('dados', models.BinaryField()),
+                ('quantidade', models.PositiveIntegerField()),
+                ('tamanho_original', models.PositiveIntegerField()),
+                ('search_vector', django.contrib.postgres.search.SearchVectorField(editable=False, null=True)),
+                ('data_compactacao', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Histórico Compactado',
+                'verbose_name_plural': 'Históricos Compactados',
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('protocolos', '0010_historico_compactado'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exportacao',
+            name='tentativas',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+    ]
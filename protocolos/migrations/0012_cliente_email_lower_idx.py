@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:12
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('protocolos', '0011_exportacao_tentativas'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cliente',
+            index=models.Index(django.db.models.functions.text.Lower('email'), name='cliente_email_lower_idx'),
+        ),
+    ]
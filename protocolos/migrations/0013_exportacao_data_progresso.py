@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('protocolos', '0012_cliente_email_lower_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exportacao',
+            name='data_progresso',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:20
+
+from django.db import migrations
+
+# Só no PostgreSQL: atende ao icontains da descrição na busca global (ver busca.py)
+INDICE = 'protocolo_descricao_trgm'
+
+
+def criar_indice(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {INDICE} ON protocolos_protocolo '
+        'USING gin (UPPER(descricao_problema::text) gin_trgm_ops)'
+    )
+
+
+def remover_indice(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP INDEX IF EXISTS {INDICE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('protocolos', '0013_exportacao_data_progresso'),
+    ]
+
+    operations = [
+        migrations.RunPython(criar_indice, remover_indice),
+    ]
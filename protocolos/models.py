@@ -1,7 +1,18 @@
-from django.db import models
+import datetime
+import json
+import zlib
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import IntegrityError, connections, models, router, transaction
+from django.db.models import Case, Max, Q, Value, When
+from django.db.models.functions import Lower
 from django.contrib.auth.models import User
+from django.contrib.postgres.search import SearchVectorField
+from django.urls import reverse
 from django.utils import timezone
 
+NUMERO_INICIAL_PROTOCOLO = 1000
+
 class Cliente(models.Model):
     nome = models.CharField(max_length=255)
     email = models.EmailField(unique=True)
@@ -9,12 +20,116 @@ class Cliente(models.Model):
     data_cadastro = models.DateTimeField(auto_now_add=True)
     ativo = models.BooleanField(default=True)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        # Campos que entram no índice de busca dos protocolos, como carregados
+        instancia._busca_original = (instancia.__dict__.get('nome'), instancia.__dict__.get('email'))
+        return instancia
+
     def __str__(self):
         return self.nome
 
     class Meta:
         verbose_name = "Cliente"
         verbose_name_plural = "Clientes"
+        indexes = [
+            # Ordenação/paginação por (nome, id) do autocomplete e da busca
+            models.Index(fields=['nome', 'id'], name='cliente_nome_id_idx'),
+            # Busca por email sem diferenciar maiúsculas (importar_protocolos)
+            models.Index(Lower('email'), name='cliente_email_lower_idx'),
+        ]
+
+
+class ContadorProtocolo(models.Model):
+    """Contador persistido usado para numerar protocolos de forma atômica"""
+    nome = models.CharField(max_length=50, primary_key=True)
+    proximo_numero = models.IntegerField()
+
+    CONTADOR_PADRAO = 'protocolo'
+
+    @classmethod
+    def incrementar(cls, quantidade=1, nome=CONTADOR_PADRAO):
+        """
+        Avança o contador em `quantidade` e retorna o primeiro número do bloco.
+
+        O incremento é um único UPDATE ... RETURNING, que bloqueia a linha do
+        contador até o fim da transação corrente: duas transações nunca recebem
+        o mesmo número e, se a transação for desfeita, o bloco volta a ficar livre.
+        Se algum protocolo recebeu à mão um número além do contador, a reserva
+        parte do maior número existente, como fazia o antigo MAX + 1.
+        """
+        if quantidade < 1:
+            raise ValueError("A quantidade de números reservados deve ser positiva.")
+
+        using = router.db_for_write(cls)
+        connection = connections[using]
+        with transaction.atomic(using=using):
+            if connection.features.can_return_columns_from_insert:
+                tabela = connection.ops.quote_name(cls._meta.db_table)
+                protocolos = connection.ops.quote_name(Protocolo._meta.db_table)
+                # max() com dois argumentos é o GREATEST do SQLite
+                maior = 'MAX' if connection.vendor == 'sqlite' else 'GREATEST'
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        f"UPDATE {tabela} SET proximo_numero = {maior}("
+                        f"proximo_numero, COALESCE((SELECT MAX(numero) FROM {protocolos}), 0) + 1"
+                        f") + %s WHERE nome = %s RETURNING proximo_numero",
+                        [quantidade, nome],
+                    )
+                    linha = cursor.fetchone()
+                if linha:
+                    return linha[0] - quantidade
+            else:
+                contador = cls.objects.using(using).select_for_update().filter(nome=nome).first()
+                if contador:
+                    inicio = max(contador.proximo_numero, cls._numero_inicial(using))
+                    cls.objects.using(using).filter(nome=nome).update(proximo_numero=inicio + quantidade)
+                    return inicio
+
+            # Primeira reserva: o contador parte do maior número já existente
+            inicial = cls._numero_inicial(using)
+            try:
+                with transaction.atomic(using=using):
+                    cls.objects.using(using).create(nome=nome, proximo_numero=inicial + quantidade)
+            except IntegrityError:
+                # Outro processo criou o contador ao mesmo tempo; basta incrementar
+                return cls.incrementar(quantidade, nome)
+            return inicial
+
+    @classmethod
+    def consultar(cls, nome=CONTADOR_PADRAO):
+        """Retorna o próximo número sem reservá-lo (apenas para exibição)"""
+        using = router.db_for_read(cls)
+        proximo = cls.objects.using(using).filter(nome=nome).values_list('proximo_numero', flat=True).first()
+        if proximo is None:
+            return cls._numero_inicial(using)
+        return proximo
+
+    @staticmethod
+    def _numero_inicial(using):
+        ultimo = Protocolo.objects.using(using).aggregate(ultimo=Max('numero'))['ultimo']
+        return ultimo + 1 if ultimo else NUMERO_INICIAL_PROTOCOLO
+
+    def __str__(self):
+        return f"{self.nome}: {self.proximo_numero}"
+
+    class Meta:
+        verbose_name = "Contador de Protocolos"
+        verbose_name_plural = "Contadores de Protocolos"
+
+
+class ProtocoloQuerySet(models.QuerySet):
+    def quentes(self):
+        """
+        Apenas os protocolos fora do arquivo. As listagens do dia a dia partem
+        daqui; a condição casa com a dos índices parciais, que ficam do
+        tamanho da parte ativa da base e não crescem com o histórico.
+        """
+        return self.filter(arquivado=False)
+
+    def arquivados(self):
+        return self.filter(arquivado=True)
 
 
 class Protocolo(models.Model):
@@ -29,29 +144,126 @@ class Protocolo(models.Model):
     buic_dispositivo = models.CharField(max_length=255)
     descricao_problema = models.TextField()
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='aberto')
-    usuario_criador = models.ForeignKey(User, on_delete=models.CASCADE, related_name='protocolos_criados')
-    data_criacao = models.DateTimeField(auto_now_add=True)
+    # Sem índice próprio: coberto pelo índice composto (usuario_criador, data_criacao)
+    usuario_criador = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='protocolos_criados', db_index=False
+    )
+    # default (e não auto_now_add) para que importações e dados sintéticos
+    # possam preservar a data original
+    data_criacao = models.DateTimeField(default=timezone.now, editable=False)
     data_finalizacao = models.DateTimeField(null=True, blank=True)
+    # Finalizado há mais que o horizonte de arquivamento (comando arquivar_protocolos).
+    # Volta a False ao reabrir
+    arquivado = models.BooleanField(default=False, editable=False)
+    # Índice da busca global (PostgreSQL); mantido por protocolos.busca
+    search_vector = SearchVectorField(null=True, editable=False)
+    # Posição do status na ordenação do admin, calculada pelo banco e indexada
+    status_ordem = models.GeneratedField(
+        expression=Case(
+            When(status='aberto', then=Value(0)),
+            When(status='em_andamento', then=Value(1)),
+            When(status='finalizado', then=Value(2)),
+            default=Value(99),
+        ),
+        output_field=models.SmallIntegerField(),
+        db_persist=True,
+    )
+
+    objects = ProtocoloQuerySet.as_manager()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        # Guarda o status carregado para que os sinais detectem transições
+        instancia._status_original = instancia.__dict__.get('status')
+        return instancia
 
     @classmethod
     def get_proximo_numero(cls):
-        """Retorna o próximo número de protocolo disponível"""
-        ultimo_protocolo = cls.objects.order_by('-numero').first()
-        if ultimo_protocolo and ultimo_protocolo.numero:
-            return ultimo_protocolo.numero + 1
-        else:
-            return 1000
+        """Retorna o próximo número de protocolo disponível (sem reservá-lo)"""
+        return ContadorProtocolo.consultar()
+
+    @classmethod
+    def reservar_numeros(cls, quantidade):
+        """Reserva um bloco de números consecutivos (ex.: importações) e retorna o primeiro"""
+        return ContadorProtocolo.incrementar(quantidade)
+
+    @classmethod
+    def iniciar_atendimento(cls, protocolo_ids, using=None):
+        """
+        Passa para "em_andamento" os protocolos ainda abertos, com um UPDATE
+        condicional (WHERE status = 'aberto'), e retorna quantos mudaram.
+
+        Sem carregar nem regravar o protocolo: a numeração não é executada de
+        novo e uma mudança de status concorrente não é sobrescrita.
+        """
+        from . import contadores, eventos
+        from .busca import invalidar_cache_busca
+
+        using = using or router.db_for_write(cls)
+        protocolo_ids = set(protocolo_ids)
+        alterados = cls.objects.using(using).filter(pk__in=protocolo_ids, status='aberto').update(
+            status='em_andamento'
+        )
+        if alterados:
+            # Os ids alterados só são conhecidos quando todos os informados mudaram
+            ids = sorted(protocolo_ids) if alterados == len(protocolo_ids) else []
+
+            def ajustar():
+                variacoes = {'aberto': -alterados, 'em_andamento': alterados}
+                contadores.ajustar_contadores(variacoes)
+                contadores.invalidar_ultimos_protocolos()
+                invalidar_cache_busca()
+                eventos.publicar(
+                    'status_alterado', ids=ids, anterior='aberto', status='em_andamento', variacoes=variacoes
+                )
+
+            transaction.on_commit(ajustar, using=using)
+        return alterados
 
     def save(self, *args, **kwargs):
-        if not self.numero:
-            # Gerar próximo número automaticamente
-            self.numero = self.get_proximo_numero()
-        
         # Se o status foi alterado para finalizado, definir data_finalizacao
         if self.status == 'finalizado' and not self.data_finalizacao:
             self.data_finalizacao = timezone.now()
-        
-        super().save(*args, **kwargs)
+        elif self.status != 'finalizado':
+            self.arquivado = False
+
+        if self.numero:
+            reaberto = (
+                not self._state.adding
+                and getattr(self, '_status_original', None) == 'finalizado'
+                and self.status != 'finalizado'
+            )
+            if not reaberto:
+                super().save(*args, **kwargs)
+                return
+            # Reabrir devolve o histórico compactado às atualizações comuns
+            from .compactacao import reidratar_historicos
+
+            using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+            with transaction.atomic(using=using):
+                super().save(*args, **kwargs)
+                reidratar_historicos([self.pk], using=using)
+            return
+
+        # Gerar próximo número automaticamente; a reserva e o INSERT ficam na
+        # mesma transação, então um INSERT desfeito não deixa buraco na numeração
+        with transaction.atomic(using=kwargs.get('using') or router.db_for_write(type(self), instance=self)):
+            self.numero = ContadorProtocolo.incrementar()
+            try:
+                super().save(*args, **kwargs)
+            except Exception:
+                self.numero = None
+                raise
+
+    def get_absolute_url(self):
+        return reverse('detalhe_protocolo', args=[self.numero])
+
+    def listar_atualizacoes(self):
+        """Todas as atualizações, inclusive as do histórico compactado (ver historico.py)"""
+        from .historico import atualizacoes_do_protocolo
+
+        return atualizacoes_do_protocolo(self)
 
     def __str__(self):
         return f"Protocolo #{self.numero}"
@@ -60,20 +272,55 @@ class Protocolo(models.Model):
         verbose_name = "Protocolo"
         verbose_name_plural = "Protocolos"
         ordering = ['-data_criacao']
+        indexes = [
+            # Listagens por data (dashboard, paginação por cursor, MAX(data_criacao))
+            models.Index(fields=['data_criacao', 'id'], name='protocolo_criacao_id_idx'),
+            models.Index(fields=['status', 'data_criacao'], name='protocolo_status_criacao_idx'),
+            models.Index(fields=['usuario_criador', 'data_criacao'], name='protocolo_criador_criacao_idx'),
+            # Fila de trabalho: apenas protocolos abertos ou em andamento
+            models.Index(
+                fields=['data_criacao'],
+                name='protocolo_ativos_criacao_idx',
+                condition=Q(status__in=['aberto', 'em_andamento']),
+            ),
+            # Ordenação padrão do changelist do admin
+            models.Index(fields=['status_ordem', '-data_criacao', '-id'], name='protocolo_ordem_admin_idx'),
+            # Mesmos caminhos restritos aos não arquivados (ProtocoloQuerySet.quentes)
+            models.Index(
+                fields=['-data_criacao', '-id'], name='protocolo_quentes_criacao_idx', condition=Q(arquivado=False),
+            ),
+            models.Index(
+                fields=['status_ordem', '-data_criacao', '-id'],
+                name='protocolo_quentes_admin_idx',
+                condition=Q(arquivado=False),
+            ),
+        ]
 
 
 class Atualizacao(models.Model):
-    protocolo = models.ForeignKey(Protocolo, on_delete=models.CASCADE, related_name='atualizacoes')
+    # Sem índice próprio: coberto pelo índice composto (protocolo, data_hora)
+    protocolo = models.ForeignKey(
+        Protocolo, on_delete=models.CASCADE, related_name='atualizacoes', db_index=False
+    )
     descricao = models.TextField()
     usuario = models.ForeignKey(User, on_delete=models.CASCADE)
-    data_hora = models.DateTimeField(auto_now_add=True)
+    data_hora = models.DateTimeField(default=timezone.now, editable=False)
 
     def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
-        # Atualizar status do protocolo para "em_andamento" se for a primeira atualização
-        if self.protocolo.status == 'aberto':
+        nova = self._state.adding
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using):
+            super().save(*args, **kwargs)
+            # Atualizar status do protocolo para "em_andamento" se for a primeira atualização
+            if nova and Protocolo.iniciar_atendimento([self.protocolo_id], using=using):
+                self._sincronizar_protocolo()
+
+    def _sincronizar_protocolo(self):
+        """Reflete a transição no protocolo já carregado, se houver"""
+        campo = type(self)._meta.get_field('protocolo')
+        if campo.is_cached(self):
             self.protocolo.status = 'em_andamento'
-            self.protocolo.save()
+            self.protocolo._status_original = 'em_andamento'
 
     def __str__(self):
         return f"Atualização - {self.protocolo} - {self.data_hora.strftime('%d/%m/%Y %H:%M')}"
@@ -81,4 +328,173 @@ class Atualizacao(models.Model):
     class Meta:
         verbose_name = "Atualização"
         verbose_name_plural = "Atualizações"
-        ordering = ['-data_hora']
\ No newline at end of file
+        ordering = ['-data_hora']
+        indexes = [
+            models.Index(fields=['protocolo', 'data_hora'], name='atualizacao_protocolo_hora_idx'),
+        ]
+
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImproperlyConfigured("O histórico compactado com zstd requer o pacote zstandard.")
+    return zstandard
+
+
+class HistoricoCompactado(models.Model):
+    """
+    Atualizações de um protocolo finalizado guardadas em uma única linha: uma
+    lista JSON comprimida, no lugar das linhas de Atualizacao (ver compactacao.py).
+    """
+    FORMATO_CHOICES = [
+        ('zlib', 'zlib'),
+        ('zstd', 'Zstandard'),
+    ]
+
+    protocolo = models.OneToOneField(
+        Protocolo, on_delete=models.CASCADE, primary_key=True, related_name='historico_compactado'
+    )
+    formato = models.CharField(max_length=10, choices=FORMATO_CHOICES, default='zlib')
+    # [[id, usuario_id, username, data_hora, descricao], ...] comprimido; o
+    # username é o do momento da compactação, para exibir sem consultar User
+    dados = models.BinaryField()
+    quantidade = models.PositiveIntegerField()
+    tamanho_original = models.PositiveIntegerField()  # bytes do JSON antes da compressão
+    # Texto das atualizações para a busca global (PostgreSQL), já que o JSON
+    # comprimido não pode ser lido pelo banco
+    search_vector = SearchVectorField(null=True, editable=False)
+    data_compactacao = models.DateTimeField(auto_now=True)
+
+    @classmethod
+    def comprimir(cls, registros, formato='zlib'):
+        """Retorna (dados, tamanho_original) dos registros no `formato` pedido"""
+        texto = json.dumps(registros, ensure_ascii=False, separators=(',', ':')).encode()
+        if formato == 'zstd':
+            return _zstd().ZstdCompressor(level=9).compress(texto), len(texto)
+        return zlib.compress(texto, 9), len(texto)
+
+    def registros(self):
+        dados = bytes(self.dados)
+        if self.formato == 'zstd':
+            texto = _zstd().ZstdDecompressor().decompress(dados)
+        else:
+            texto = zlib.decompress(dados)
+        return json.loads(texto)
+
+    def atualizacoes(self):
+        """As atualizações como instâncias de Atualizacao, com o usuário já preenchido"""
+        atualizacoes = []
+        for pk, usuario_id, username, data_hora, descricao in self.registros():
+            atualizacao = Atualizacao(
+                pk=pk, protocolo_id=self.protocolo_id, usuario_id=usuario_id,
+                descricao=descricao, data_hora=datetime.datetime.fromisoformat(data_hora),
+            )
+            atualizacao.usuario = User(pk=usuario_id, username=username)
+            atualizacao._state.adding = False
+            atualizacoes.append(atualizacao)
+        return atualizacoes
+
+    def __str__(self):
+        return f"Histórico compactado - {self.protocolo_id}"
+
+    class Meta:
+        verbose_name = "Histórico Compactado"
+        verbose_name_plural = "Históricos Compactados"
+
+
+class Exportacao(models.Model):
+    FORMATO_CHOICES = [
+        ('csv', 'CSV'),
+        ('parquet', 'Parquet'),
+        ('xlsx', 'Excel (XLSX)'),
+    ]
+    STATUS_CHOICES = [
+        ('pendente', 'Pendente'),
+        ('processando', 'Processando'),
+        ('concluida', 'Concluída'),
+        ('erro', 'Erro'),
+    ]
+
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE, related_name='exportacoes')
+    formato = models.CharField(max_length=10, choices=FORMATO_CHOICES, default='csv')
+    filtros = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pendente')
+    linhas_processadas = models.PositiveIntegerField(default=0)
+    total_linhas = models.PositiveIntegerField(null=True, blank=True)
+    arquivo = models.CharField(max_length=255, blank=True)  # relativo a settings.EXPORTACOES_DIR
+    erro = models.TextField(blank=True)
+    data_criacao = models.DateTimeField(auto_now_add=True)
+    data_inicio = models.DateTimeField(null=True, blank=True)
+    data_progresso = models.DateTimeField(null=True, blank=True)  # último progresso gravado pelo worker
+    data_conclusao = models.DateTimeField(null=True, blank=True)
+    tentativas = models.PositiveSmallIntegerField(default=0)
+
+    @property
+    def progresso(self):
+        if not self.total_linhas:
+            return 100 if self.status == 'concluida' else 0
+        return min(100, round(100 * self.linhas_processadas / self.total_linhas))
+
+    def __str__(self):
+        return f"Exportação #{self.pk} ({self.get_formato_display()})"
+
+    class Meta:
+        verbose_name = "Exportação"
+        verbose_name_plural = "Exportações"
+        ordering = ['-data_criacao']
+
+
+# Tabelas de métricas diárias (ver protocolos/metricas.py). Cada linha resume
+# um dia no fuso local e é reconstruída por inteiro quando o dia é recalculado.
+
+class MetricaDiaria(models.Model):
+    dia = models.DateField(unique=True)
+    criados = models.PositiveIntegerField(default=0)
+    finalizados = models.PositiveIntegerField(default=0)
+    # Tempo de resolução (data_finalizacao - data_criacao), em segundos, dos finalizados no dia
+    resolucao_media = models.FloatField(null=True, blank=True)
+    resolucao_p50 = models.FloatField(null=True, blank=True)
+    resolucao_p90 = models.FloatField(null=True, blank=True)
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Métricas de {self.dia:%d/%m/%Y}"
+
+    class Meta:
+        verbose_name = "Métrica Diária"
+        verbose_name_plural = "Métricas Diárias"
+        ordering = ['-dia']
+
+
+class MetricaDiariaUsuario(models.Model):
+    dia = models.DateField()
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    criados = models.PositiveIntegerField(default=0)
+    finalizados = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Métrica Diária por Usuário"
+        verbose_name_plural = "Métricas Diárias por Usuário"
+        constraints = [
+            models.UniqueConstraint(fields=['dia', 'usuario'], name='metrica_usuario_dia_unica'),
+        ]
+
+
+class MetricaDiariaCliente(models.Model):
+    dia = models.DateField()
+    cliente = models.ForeignKey(Cliente, on_delete=models.CASCADE, related_name='+')
+    criados = models.PositiveIntegerField(default=0)
+    finalizados = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Métrica Diária por Cliente"
+        verbose_name_plural = "Métricas Diárias por Cliente"
+        constraints = [
+            models.UniqueConstraint(fields=['dia', 'cliente'], name='metrica_cliente_dia_unica'),
+        ]
+
+
+class DiaMetricaPendente(models.Model):
+    """Dias com protocolos alterados desde o último recálculo das métricas"""
+    dia = models.DateField(primary_key=True)
@@ -0,0 +1,176 @@
+"""
+Paginação por cursor (keyset) e paginador com contagem estimada.
+
+Em vez de OFFSET, cada página continua a partir dos valores de ordenação do
+último item da página anterior, o que mantém o custo de cada página constante
+independentemente de quantos resultados a consulta tenha. A ordenação precisa
+terminar em um campo único (normalmente o id) para que o cursor seja exato.
+
+PaginadorEstimado é para as listagens que precisam de números de página (o
+admin): conta exatamente apenas até LIMITE_CONTAGEM_EXATA e, acima disso, usa
+a estimativa do planejador do PostgreSQL em vez de um COUNT(*) completo.
+"""
+import base64
+import datetime
+import json
+from dataclasses import dataclass
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+LIMITE_CONTAGEM_EXATA = 10_000
+
+
+class CursorInvalido(ValueError):
+    pass
+
+
+@dataclass
+class PaginaKeyset:
+    itens: list
+    proximo_cursor: str = None
+
+    @property
+    def tem_mais(self):
+        return self.proximo_cursor is not None
+
+
+def codificar_cursor(valores):
+    # isoformat() preserva os microssegundos, necessários para comparar datas exatamente
+    valores = [v.isoformat() if isinstance(v, (datetime.date, datetime.time)) else v for v in valores]
+    texto = json.dumps(valores, separators=(',', ':'))
+    return base64.urlsafe_b64encode(texto.encode()).decode().rstrip('=')
+
+
+def decodificar_cursor(cursor, model, campos):
+    """Converte o cursor de volta para os tipos Python dos campos de ordenação"""
+    try:
+        texto = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        valores = json.loads(texto)
+    except (ValueError, TypeError) as exc:
+        raise CursorInvalido('Cursor de paginação inválido.') from exc
+    if not isinstance(valores, list) or len(valores) != len(campos):
+        raise CursorInvalido('Cursor de paginação inválido.')
+
+    try:
+        return [
+            model._meta.get_field(_nome(campo)).to_python(valor)
+            for campo, valor in zip(campos, valores)
+        ]
+    except Exception as exc:
+        raise CursorInvalido('Cursor de paginação inválido.') from exc
+
+
+def _nome(campo):
+    nome = campo.lstrip('-')
+    return 'id' if nome == 'pk' else nome
+
+
+def _filtro_apos(campos, valores):
+    """(a, b) > (va, vb) expandido em OR/AND, respeitando a direção de cada campo"""
+    filtro = Q()
+    iguais = {}
+    for campo, valor in zip(campos, valores):
+        nome = _nome(campo)
+        operador = 'lt' if campo.startswith('-') else 'gt'
+        filtro |= Q(**iguais, **{f'{nome}__{operador}': valor})
+        iguais[nome] = valor
+    return filtro
+
+
+def _valor(item, nome):
+    return item[nome] if isinstance(item, dict) else getattr(item, nome)
+
+
+def _filtrar_apos_cursor(queryset, campos, cursor):
+    queryset = queryset.order_by(*campos)
+    if cursor:
+        valores = decodificar_cursor(cursor, queryset.model, campos)
+        queryset = queryset.filter(_filtro_apos(campos, valores))
+    return queryset
+
+
+def _montar_pagina(itens, campos, limite):
+    proximo_cursor = None
+    if len(itens) > limite:
+        itens = itens[:limite]
+        ultimo = itens[-1]
+        proximo_cursor = codificar_cursor([_valor(ultimo, _nome(campo)) for campo in campos])
+    return PaginaKeyset(itens=itens, proximo_cursor=proximo_cursor)
+
+
+def paginar_keyset(queryset, campos, cursor=None, limite=20):
+    """
+    Retorna uma PaginaKeyset com até `limite` itens de `queryset` ordenado por
+    `campos` (ex.: ['-data_criacao', '-id']). Funciona com instâncias ou values().
+    """
+    queryset = _filtrar_apos_cursor(queryset, campos, cursor)
+    # Um item a mais indica se existe próxima página, sem COUNT
+    return _montar_pagina(list(queryset[:limite + 1]), campos, limite)
+
+
+async def apaginar_keyset(queryset, campos, cursor=None, limite=20):
+    """Versão assíncrona de paginar_keyset, com o ORM assíncrono"""
+    queryset = _filtrar_apos_cursor(queryset, campos, cursor)
+    return _montar_pagina([item async for item in queryset[:limite + 1]], campos, limite)
+
+
+def _apos(item, campos, valores):
+    """Equivalente em Python de _filtro_apos, para listas já em memória"""
+    for campo, valor in zip(campos, valores):
+        atual = _valor(item, _nome(campo))
+        if atual != valor:
+            return atual < valor if campo.startswith('-') else atual > valor
+    return False
+
+
+def paginar_lista(itens, model, campos, cursor=None, limite=20):
+    """
+    paginar_keyset sobre uma lista (ex.: atualizações descomprimidas), com
+    os mesmos cursores; `model` converte os valores do cursor.
+    """
+    for campo in reversed(campos):
+        itens = sorted(itens, key=lambda item: _valor(item, _nome(campo)), reverse=campo.startswith('-'))
+    if cursor:
+        valores = decodificar_cursor(cursor, model, campos)
+        itens = [item for item in itens if _apos(item, campos, valores)]
+    return _montar_pagina(itens[:limite + 1], campos, limite)
+
+
+def _estimativa_postgres(queryset):
+    """Linhas estimadas: pg_class.reltuples sem filtro, senão o plano do EXPLAIN"""
+    if not queryset.query.where:
+        with connections[queryset.db].cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                [queryset.model._meta.db_table],
+            )
+            linha = cursor.fetchone()
+        # -1 enquanto a tabela nunca passou por VACUUM/ANALYZE
+        return linha[0] if linha and linha[0] >= 0 else None
+    plano = json.loads(queryset.order_by().explain(format='json'))
+    return plano[0]['Plan']['Plan Rows']
+
+
+class PaginadorEstimado(Paginator):
+    """
+    Paginator cujo `count` é exato até LIMITE_CONTAGEM_EXATA e estimado acima
+    disso no PostgreSQL; as últimas páginas podem ficar vazias ou incompletas.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not hasattr(queryset, 'query'):
+            return super().count
+        # COUNT sobre uma subconsulta com LIMIT: para de ler ao passar do limite
+        limitado = queryset.order_by()[:LIMITE_CONTAGEM_EXATA + 1].count()
+        if limitado <= LIMITE_CONTAGEM_EXATA:
+            return limitado
+        if connections[queryset.db].vendor == 'postgresql':
+            estimativa = _estimativa_postgres(queryset)
+            if estimativa is not None:
+                return max(estimativa, limitado)
+        return super().count
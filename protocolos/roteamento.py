@@ -0,0 +1,78 @@
+"""
+Roteamento de leituras para a réplica.
+
+Só as views decoradas com @leitura_na_replica leem da réplica, e apenas se
+DATABASES tiver o alias "replica"; todo o resto (inclusive escritas feitas
+durante essas views) continua no banco principal. A marcação fica em um
+ContextVar, então vale tanto para views síncronas quanto assíncronas.
+
+O que vai para os caches compartilhados não pode vir da réplica: um valor
+atrasado gravado lá seria servido (e, no caso dos contadores, ajustado por
+incr/decr) como se fosse atual. Esses cálculos rodam em no_principal(), ou
+não são guardados quando lendo_da_replica().
+"""
+import contextvars
+import functools
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+
+ALIAS_REPLICA = 'replica'
+
+_usar_replica = contextvars.ContextVar('usar_replica', default=False)
+
+
+@contextmanager
+def replica():
+    token = _usar_replica.set(True)
+    try:
+        yield
+    finally:
+        _usar_replica.reset(token)
+
+
+@contextmanager
+def no_principal():
+    """Dentro de uma view com @leitura_na_replica, volta a ler do banco principal"""
+    token = _usar_replica.set(False)
+    try:
+        yield
+    finally:
+        _usar_replica.reset(token)
+
+
+def lendo_da_replica():
+    return _usar_replica.get() and ALIAS_REPLICA in settings.DATABASES
+
+
+def leitura_na_replica(view):
+    """Envia as leituras da view para a réplica (dados podem ter alguns segundos de atraso)"""
+    if iscoroutinefunction(view):
+        @functools.wraps(view)
+        async def envolvida(*args, **kwargs):
+            with replica():
+                return await view(*args, **kwargs)
+    else:
+        @functools.wraps(view)
+        def envolvida(*args, **kwargs):
+            with replica():
+                return view(*args, **kwargs)
+    return envolvida
+
+
+class RoteadorReplica:
+    def db_for_read(self, model, **hints):
+        if _usar_replica.get() and ALIAS_REPLICA in settings.DATABASES:
+            return ALIAS_REPLICA
+        return None
+
+    def db_for_write(self, model, **hints):
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Réplica e principal têm os mesmos dados
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != ALIAS_REPLICA
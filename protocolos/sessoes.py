@@ -0,0 +1,76 @@
+"""
+Sessão e usuário autenticado sem consultas ao banco em regime normal.
+
+A sessão usa o backend escolhido em PROTOCOLOS_SESSOES (settings.py): por
+padrão cached_db, que lê do cache 'sessoes' e só vai ao banco quando a chave
+não está lá. O usuário autenticado fica no mesmo cache, por
+PROTOCOLOS_CACHE_USUARIO_SEGUNDOS, sob o id guardado na sessão;
+UsuarioEmCacheMiddleware substitui o AuthenticationMiddleware e lê dele.
+
+A cada requisição o hash de autenticação da sessão continua sendo conferido
+com o do usuário em cache, como em django.contrib.auth.get_user. Os sinais
+de signals.py removem o usuário do cache quando ele é salvo (troca de senha,
+is_active, is_staff...), removido, sai do sistema ou muda de grupos e
+permissões. As permissões em si não vão para o cache.
+"""
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.contrib.auth.models import AnonymousUser
+from django.utils.crypto import constant_time_compare
+from django.utils.functional import SimpleLazyObject
+
+from .cache import cache_nomeado
+
+cache = cache_nomeado('sessoes')
+
+
+def chave_usuario(pk):
+    return f'usuario:{pk}'
+
+
+def invalidar_usuarios(pks):
+    cache.delete_many([chave_usuario(pk) for pk in pks])
+
+
+def _sessao_valida(request, usuario):
+    """Mesmas verificações de auth.get_user, sem consultar o banco"""
+    if request.session.get(auth.BACKEND_SESSION_KEY) not in settings.AUTHENTICATION_BACKENDS:
+        return False
+    if not usuario.is_active:
+        return False
+    hash_sessao = request.session.get(auth.HASH_SESSION_KEY)
+    return bool(hash_sessao) and constant_time_compare(hash_sessao, usuario.get_session_auth_hash())
+
+
+def obter_usuario(request):
+    """O usuário da sessão, do cache quando possível; AnonymousUser se não houver"""
+    pk = request.session.get(auth.SESSION_KEY)
+    if pk is None:
+        return AnonymousUser()
+    usuario = cache.get(chave_usuario(pk))
+    if usuario is not None and _sessao_valida(request, usuario):
+        return usuario
+
+    # Caminho normal do Django, que também encerra sessões com hash inválido
+    usuario = auth.get_user(request)
+    if usuario.is_authenticated:
+        # Recém-carregado: ainda sem os caches de permissões do ModelBackend
+        cache.set(chave_usuario(usuario.pk), usuario, settings.PROTOCOLOS_CACHE_USUARIO_SEGUNDOS)
+    return usuario
+
+
+async def aobter_usuario(request):
+    return await sync_to_async(obter_usuario)(request)
+
+
+class UsuarioEmCacheMiddleware(AuthenticationMiddleware):
+    """AuthenticationMiddleware com o usuário lido por obter_usuario"""
+
+    def process_request(self, request):
+        super().process_request(request)
+        request.user = SimpleLazyObject(lambda: obter_usuario(request))
+        request.auser = partial(aobter_usuario, request)
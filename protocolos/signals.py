@@ -0,0 +1,183 @@
+from django.contrib.auth.models import User
+from django.contrib.auth.signals import user_logged_out
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.utils.text import Truncator
+
+from . import contadores, eventos
+from .busca import atualizar_indice_busca, invalidar_cache_busca, invalidar_cache_clientes, reindexar_protocolos
+from .historico import invalidar_historico
+from .metricas import marcar_dias_pendentes, marcar_protocolos_pendentes
+from .models import Atualizacao, Cliente, Protocolo
+from .sessoes import invalidar_usuarios
+
+CAMPOS_INDEXADOS = {'buic_dispositivo', 'descricao_problema'}
+
+
+def _resumo_protocolo(protocolo):
+    """Dados de uma linha de "Últimos Protocolos Criados" no dashboard"""
+    return {
+        'id': protocolo.pk,
+        'numero': protocolo.numero,
+        'status': protocolo.status,
+        'status_display': protocolo.get_status_display(),
+        'descricao': Truncator(protocolo.descricao_problema).chars(50),
+        'usuario': protocolo.usuario_criador.username,
+        'data_criacao': protocolo.data_criacao.isoformat(),
+    }
+
+
+@receiver(post_save, sender=Protocolo)
+def protocolo_salvo(sender, instance, created, raw=False, using=None, **kwargs):
+    if raw:
+        return
+
+    anterior = getattr(instance, '_status_original', None)
+    if created:
+        variacoes = {instance.status: 1}
+        evento = ('protocolo_criado', {'protocolo': _resumo_protocolo(instance)})
+    elif anterior is None:
+        variacoes = None
+        evento = None
+    elif anterior != instance.status:
+        variacoes = {anterior: -1, instance.status: 1}
+        evento = ('status_alterado', {'ids': [instance.pk], 'anterior': anterior, 'status': instance.status})
+    else:
+        variacoes = {}
+        evento = None
+    instance._status_original = instance.status
+    # Só a criação e as mudanças de status alteram as métricas diárias
+    if created or anterior != instance.status:
+        marcar_dias_pendentes([instance.data_criacao, instance.data_finalizacao])
+
+    def ajustar():
+        if variacoes is None:
+            contadores.invalidar_contadores()
+        else:
+            contadores.ajustar_contadores(variacoes)
+        contadores.invalidar_ultimos_protocolos()
+        invalidar_cache_busca()
+        if evento:
+            tipo, dados = evento
+            eventos.publicar(tipo, variacoes=variacoes, **dados)
+
+    transaction.on_commit(ajustar, using=using)
+
+
+@receiver(post_delete, sender=Protocolo)
+def protocolo_removido(sender, instance, using=None, **kwargs):
+    status = getattr(instance, '_status_original', None) or instance.status
+    numero = instance.numero
+
+    def ajustar():
+        contadores.ajustar_contadores({status: -1})
+        contadores.invalidar_ultimos_protocolos()
+        invalidar_cache_busca()
+        eventos.publicar('protocolo_removido', numero=numero, variacoes={status: -1})
+
+    transaction.on_commit(ajustar, using=using)
+
+
+@receiver(post_save, sender=Protocolo)
+def indexar_protocolo(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields is not None and not CAMPOS_INDEXADOS & set(update_fields)):
+        return
+    atualizar_indice_busca([instance.pk])
+
+
+@receiver(m2m_changed, sender=Protocolo.clientes.through)
+def indexar_clientes_do_protocolo(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        atualizar_indice_busca([instance.pk])
+    elif pk_set:
+        atualizar_indice_busca(pk_set)
+
+
+@receiver([post_save, post_delete], sender=Cliente)
+def invalidar_cache_de_clientes(sender, instance, raw=False, using=None, **kwargs):
+    if raw:
+        return
+    transaction.on_commit(invalidar_cache_clientes, using=using)
+
+
+@receiver(post_save, sender=Cliente)
+def indexar_protocolos_do_cliente(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw or created:
+        return
+    if update_fields is not None and not {'nome', 'email'} & set(update_fields):
+        return
+    # Sem os valores carregados (instância montada à mão), reindexa por garantia
+    indexados = (instance.nome, instance.email)
+    if getattr(instance, '_busca_original', None) == indexados:
+        return
+    instance._busca_original = indexados
+    reindexar_protocolos(instance.protocolos.all())
+
+
+@receiver([post_save, post_delete], sender=Atualizacao)
+def indexar_historico(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    atualizar_indice_busca([instance.protocolo_id])
+
+
+@receiver([post_save, post_delete], sender=Atualizacao)
+def invalidar_linha_do_tempo(sender, instance, raw=False, using=None, **kwargs):
+    if raw:
+        return
+    protocolo_id = instance.protocolo_id
+    transaction.on_commit(lambda: invalidar_historico(protocolo_id), using=using)
+
+
+@receiver(post_delete, sender=Protocolo)
+def marcar_metricas_do_protocolo_removido(sender, instance, **kwargs):
+    marcar_dias_pendentes([instance.data_criacao, instance.data_finalizacao])
+
+
+@receiver(m2m_changed, sender=Protocolo.clientes.through)
+def marcar_metricas_dos_clientes(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        marcar_dias_pendentes([instance.data_criacao, instance.data_finalizacao])
+    elif pk_set:
+        marcar_protocolos_pendentes(Protocolo.objects.filter(pk__in=pk_set))
+
+
+@receiver(post_save, sender=Atualizacao)
+def publicar_atualizacao(sender, instance, created, raw=False, using=None, **kwargs):
+    if not raw and created:
+        eventos.publicar_atualizacoes([instance], using=using)
+
+
+# Usuário autenticado em cache (ver sessoes.py)
+
+@receiver([post_save, post_delete], sender=User)
+def invalidar_usuario_salvo(sender, instance, raw=False, using=None, **kwargs):
+    if not raw:
+        # Depois do commit: antes disso outra requisição ainda leria a versão antiga
+        transaction.on_commit(lambda: invalidar_usuarios([instance.pk]), using=using)
+
+
+@receiver(user_logged_out)
+def invalidar_usuario_ao_sair(sender, request, user, **kwargs):
+    if user is not None:
+        invalidar_usuarios([user.pk])
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+def invalidar_usuario_por_permissoes(sender, instance, action, reverse, pk_set, using=None, **kwargs):
+    if not reverse and action in ('post_add', 'post_remove', 'post_clear'):
+        pks = [instance.pk]
+    elif reverse and action in ('post_add', 'post_remove'):
+        pks = list(pk_set)
+    elif reverse and action == 'pre_clear':
+        # A partir do grupo ou da permissão; depois do clear() não há como saber os usuários
+        pks = list(instance.user_set.using(using).values_list('pk', flat=True))
+    else:
+        return
+    transaction.on_commit(lambda: invalidar_usuarios(pks), using=using)
@@ -0,0 +1,135 @@
+"""
+Gerador de dados sintéticos para testes de carga.
+
+Cria usuários, clientes, protocolos (com 1 a 4 clientes cada) e atualizações
+com bulk inserts em lotes. A semente fixa torna a base reproduzível entre
+execuções, e as datas se espalham pelos últimos `dias` para simular histórico.
+"""
+import datetime
+import random
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from .busca import atualizar_indice_busca
+from .contadores import invalidar_contadores, invalidar_ultimos_protocolos
+from .metricas import marcar_dias_pendentes
+from .models import Atualizacao, Cliente, Protocolo
+
+PALAVRAS = [
+    'conexão', 'internet', 'login', 'falha', 'sistema', 'lentidão', 'impressora', 'senha',
+    'bloqueio', 'atualização', 'rede', 'servidor', 'instabilidade', 'configuração', 'acesso',
+    'roteador', 'certificado', 'backup', 'licença', 'cadastro', 'relatório', 'integração',
+]
+EMPRESAS = ['Comércio', 'Indústria', 'Serviços', 'Transportes', 'Tecnologia', 'Alimentos', 'Construtora']
+
+# Proporções aproximadas de um ambiente de produção
+PESOS_STATUS = {'aberto': 15, 'em_andamento': 25, 'finalizado': 60}
+PESOS_CLIENTES_POR_PROTOCOLO = {1: 65, 2: 22, 3: 9, 4: 4}
+
+
+def _texto(aleatorio, palavras):
+    return ' '.join(aleatorio.choices(PALAVRAS, k=palavras)).capitalize() + '.'
+
+
+def gerar_dados_sinteticos(
+    clientes=1_000, protocolos=10_000, atualizacoes_por_protocolo=3, usuarios=10,
+    dias=365, seed=42, lote=5_000, progresso=None, status=None, deslocamento_dias=0,
+):
+    """
+    Acrescenta a quantidade pedida de clientes e protocolos à base.
+    `progresso`, se informado, é chamado com (protocolos_gerados, total).
+    Com `status`, todos os protocolos são gerados nele; `deslocamento_dias`
+    recua a janela de criação (histórico antigo, para o arquivo).
+    """
+    # Fluxos separados: a sequência de protocolos não depende de quantos clientes foram gerados
+    aleatorio = random.Random(seed)
+    aleatorio_clientes = random.Random(f'{seed}-clientes')
+    agora = timezone.now()
+    referencia = agora - datetime.timedelta(days=deslocamento_dias)
+
+    User.objects.bulk_create(
+        [User(username=f'sintetico{i}', password='!') for i in range(usuarios)],
+        ignore_conflicts=True,
+    )
+    usuario_ids = list(
+        User.objects.filter(username__startswith='sintetico').values_list('pk', flat=True)[:usuarios]
+    )
+
+    existentes = Cliente.objects.filter(email__endswith='@sintetico.local').count()
+    for inicio in range(existentes, existentes + clientes, lote):
+        Cliente.objects.bulk_create([
+            Cliente(
+                nome=f'{aleatorio_clientes.choice(EMPRESAS)} {i}',
+                email=f'cliente{i}@sintetico.local',
+                senha='!',
+            )
+            for i in range(inicio, min(inicio + lote, existentes + clientes))
+        ], ignore_conflicts=True)
+    cliente_ids = list(Cliente.objects.filter(email__endswith='@sintetico.local').values_list('pk', flat=True))
+
+    Vinculo = Protocolo.clientes.through
+    quantidades = list(PESOS_CLIENTES_POR_PROTOCOLO)
+    pesos = list(PESOS_CLIENTES_POR_PROTOCOLO.values())
+    for inicio in range(0, protocolos, lote):
+        tamanho = min(lote, protocolos - inicio)
+        with transaction.atomic():
+            primeiro = Protocolo.reservar_numeros(tamanho)
+            novos, historicos = [], []
+            for i in range(tamanho):
+                criacao = referencia - datetime.timedelta(seconds=aleatorio.randrange(dias * 86_400))
+                sorteado = aleatorio.choices(list(PESOS_STATUS), weights=list(PESOS_STATUS.values()))[0]
+                status_protocolo = status or sorteado
+                datas = sorted(
+                    criacao + datetime.timedelta(minutes=aleatorio.randrange(1, 60 * 24 * 10))
+                    for _ in range(atualizacoes_por_protocolo)
+                )
+                # Protocolos abertos ainda não receberam atualizações
+                datas = [data for data in datas if data < agora] if status_protocolo != 'aberto' else []
+                finalizacao = None
+                if status_protocolo == 'finalizado':
+                    finalizacao = min(agora, (datas[-1] if datas else criacao) + datetime.timedelta(hours=1))
+                novos.append(Protocolo(
+                    numero=primeiro + i,
+                    buic_dispositivo=f'BUIC-{aleatorio.randrange(1_000_000):06d}',
+                    descricao_problema=_texto(aleatorio, 15),
+                    status=status_protocolo,
+                    usuario_criador_id=aleatorio.choice(usuario_ids),
+                    data_criacao=criacao,
+                    data_finalizacao=finalizacao,
+                ))
+                historicos.append(datas)
+            Protocolo.objects.bulk_create(novos)
+
+            ids = dict(
+                Protocolo.objects.filter(numero__gte=primeiro, numero__lt=primeiro + tamanho)
+                .values_list('numero', 'pk')
+            )
+            Vinculo.objects.bulk_create([
+                Vinculo(protocolo_id=ids[protocolo.numero], cliente_id=cliente_id)
+                for protocolo in novos
+                for cliente_id in aleatorio.sample(
+                    cliente_ids, k=min(len(cliente_ids), aleatorio.choices(quantidades, weights=pesos)[0])
+                )
+            ])
+            Atualizacao.objects.bulk_create([
+                Atualizacao(
+                    protocolo_id=ids[protocolo.numero],
+                    descricao=_texto(aleatorio, 10),
+                    usuario_id=aleatorio.choice(usuario_ids),
+                    data_hora=data,
+                )
+                for protocolo, datas in zip(novos, historicos)
+                for data in datas
+            ])
+            atualizar_indice_busca(ids.values())
+            marcar_dias_pendentes(
+                data for protocolo in novos for data in (protocolo.data_criacao, protocolo.data_finalizacao)
+            )
+
+        if progresso:
+            progresso(inicio + tamanho, protocolos)
+
+    invalidar_contadores()
+    invalidar_ultimos_protocolos()
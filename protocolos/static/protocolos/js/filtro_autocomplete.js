@@ -0,0 +1,12 @@
+/* Filtros de lista do admin com autocomplete (FiltroAutocomplete em admin.py) */
+django.jQuery(function($) {
+    $('.filtro-autocomplete').off('change.filtro').on('change.filtro', function() {
+        const todos = this.dataset.urlTodos;
+        if (!this.value) {
+            window.location.href = todos;
+            return;
+        }
+        const parametro = encodeURIComponent(this.dataset.parametro) + '=' + encodeURIComponent(this.value);
+        window.location.href = todos + (todos.length > 1 ? '&' : '') + parametro;
+    });
+});
@@ -0,0 +1,262 @@
+/*
+ * Scripts das páginas do sistema. Cada página é iniciada pelo elemento que
+ * só existe nela; as URLs e os dados vêm de atributos data-* e json_script.
+ */
+(function() {
+    'use strict';
+
+    function iniciarDashboard(painel) {
+        const status = JSON.parse(document.getElementById('contadores-status').textContent);
+        const graficoStatus = new Chart(document.getElementById('graficoStatus'), {
+            type: 'doughnut',
+            data: {
+                labels: ['Abertos', 'Em Andamento', 'Finalizados'],
+                datasets: [{
+                    data: [status.aberto, status.em_andamento, status.finalizado],
+                    backgroundColor: ['#0dcaf0', '#ffc107', '#198754'],
+                }],
+            },
+        });
+
+        const tendencia = document.getElementById('graficoTendencia');
+        fetch(tendencia.dataset.url)
+            .then(resposta => resposta.json())
+            .then(function(dados) {
+                if (!dados.success) {
+                    return;
+                }
+                new Chart(tendencia, {
+                    type: 'line',
+                    data: {
+                        labels: dados.dias.map(d => d.dia.split('-').reverse().slice(0, 2).join('/')),
+                        datasets: [
+                            {label: 'Criados', data: dados.dias.map(d => d.criados), borderColor: '#0d6efd'},
+                            {label: 'Finalizados', data: dados.dias.map(d => d.finalizados), borderColor: '#198754'},
+                            {label: 'Backlog', data: dados.dias.map(d => d.backlog), borderColor: '#dc3545', yAxisID: 'backlog'},
+                        ],
+                    },
+                    options: {
+                        scales: {
+                            y: {beginAtZero: true},
+                            backlog: {beginAtZero: true, position: 'right', grid: {drawOnChartArea: false}},
+                        },
+                    },
+                });
+            });
+
+        // Feed em tempo real: contadores, últimos protocolos e atividade recente
+        const STATUS = ['aberto', 'em_andamento', 'finalizado'];
+        const NOMES_STATUS = {aberto: 'Aberto', em_andamento: 'Em Andamento', finalizado: 'Finalizado'};
+        const contadores = Object.assign(
+            {total: Number(document.querySelector('[data-contador="total"]').textContent)}, status
+        );
+        const ultimos = document.getElementById('ultimosProtocolos');
+        const atividade = document.getElementById('atividadeRecente');
+
+        function mostrarContadores() {
+            document.querySelectorAll('[data-contador]').forEach(function(el) {
+                el.textContent = contadores[el.dataset.contador];
+            });
+            graficoStatus.data.datasets[0].data = STATUS.map(s => contadores[s]);
+            graficoStatus.update();
+        }
+
+        function aplicarVariacoes(variacoes) {
+            for (const [nome, delta] of Object.entries(variacoes || {})) {
+                contadores[nome] = (contadores[nome] || 0) + delta;
+                contadores.total += delta;
+            }
+            mostrarContadores();
+        }
+
+        function celula(texto) {
+            const td = document.createElement('td');
+            td.textContent = texto;
+            return td;
+        }
+
+        function registrarAtividade(texto) {
+            const vazio = atividade.querySelector('[data-vazio]');
+            if (vazio) {
+                vazio.remove();
+            }
+            const item = document.createElement('li');
+            item.className = 'list-group-item';
+            item.textContent = new Date().toLocaleTimeString('pt-BR') + ' - ' + texto;
+            atividade.prepend(item);
+            while (atividade.children.length > 10) {
+                atividade.lastElementChild.remove();
+            }
+        }
+
+        const eventos = new EventSource(painel.dataset.eventosUrl);
+        eventos.addEventListener('contadores', function(e) {
+            Object.assign(contadores, JSON.parse(e.data).contadores);
+            mostrarContadores();
+        });
+        eventos.addEventListener('protocolo_criado', function(e) {
+            const dados = JSON.parse(e.data);
+            const protocolo = dados.protocolo;
+            aplicarVariacoes(dados.variacoes);
+
+            const vazio = ultimos.querySelector('[data-vazio]');
+            if (vazio) {
+                vazio.remove();
+            }
+            const linha = document.createElement('tr');
+            linha.dataset.id = protocolo.id;
+            const link = document.createElement('a');
+            link.href = ultimos.dataset.urlDetalhe.replace(/0\/$/, protocolo.numero + '/');
+            link.textContent = protocolo.numero;
+            const numero = document.createElement('td');
+            numero.appendChild(link);
+            const statusCelula = celula(protocolo.status_display);
+            statusCelula.dataset.campo = 'status';
+            linha.append(
+                numero, statusCelula, celula(protocolo.descricao), celula(protocolo.usuario),
+                celula(new Date(protocolo.data_criacao).toLocaleString('pt-BR', {dateStyle: 'short', timeStyle: 'short'})),
+            );
+            ultimos.prepend(linha);
+            while (ultimos.children.length > Number(ultimos.dataset.limite)) {
+                ultimos.lastElementChild.remove();
+            }
+            registrarAtividade('Protocolo ' + protocolo.numero + ' criado por ' + protocolo.usuario);
+        });
+        eventos.addEventListener('status_alterado', function(e) {
+            const dados = JSON.parse(e.data);
+            aplicarVariacoes(dados.variacoes);
+            dados.ids.forEach(function(id) {
+                const celulaStatus = ultimos.querySelector('tr[data-id="' + id + '"] [data-campo="status"]');
+                if (celulaStatus) {
+                    celulaStatus.textContent = NOMES_STATUS[dados.status];
+                }
+            });
+        });
+        eventos.addEventListener('protocolo_removido', function(e) {
+            const dados = JSON.parse(e.data);
+            aplicarVariacoes(dados.variacoes);
+            registrarAtividade('Protocolo ' + dados.numero + ' removido');
+        });
+        eventos.addEventListener('atualizacao_criada', function(e) {
+            const dados = JSON.parse(e.data);
+            registrarAtividade('Protocolo ' + dados.numero + ': ' + dados.usuario + ' - ' + dados.descricao);
+        });
+    }
+
+    function iniciarNovoProtocolo($clientes) {
+        // Inicializar Select2 para o campo de clientes; as opções vêm do
+        // endpoint de autocomplete, paginadas por cursor conforme a rolagem
+        let cursorClientes = null;
+        $clientes.select2({
+            placeholder: 'Digite o nome do cliente para buscar...',
+            allowClear: true,
+            width: '100%',
+            minimumInputLength: 1,
+            ajax: {
+                url: $clientes.data('autocomplete-url'),
+                dataType: 'json',
+                delay: 250,
+                data: function(params) {
+                    return {
+                        q: params.term || '',
+                        cursor: params.page ? cursorClientes : ''
+                    };
+                },
+                processResults: function(data) {
+                    cursorClientes = data.cursor;
+                    return {
+                        results: data.results,
+                        pagination: { more: data.pagination.more }
+                    };
+                }
+            },
+            language: {
+                noResults: function() {
+                    return "Nenhum cliente encontrado";
+                },
+                searching: function() {
+                    return "Buscando...";
+                },
+                inputTooShort: function() {
+                    return "Digite pelo menos 1 caractere para buscar";
+                }
+            }
+        });
+
+        // Função para adicionar novo cliente
+        document.getElementById('salvarCliente').addEventListener('click', function() {
+            const form = document.getElementById('formAdicionarCliente');
+            const formData = new FormData(form);
+            
+            // Verificar se os campos obrigatórios estão preenchidos
+            const nome = document.getElementById('nomeCliente').value.trim();
+            const email = document.getElementById('emailCliente').value.trim();
+            const senha = document.getElementById('senhaCliente').value.trim();
+            
+            if (!nome || !email || !senha) {
+                alert('Por favor, preencha todos os campos obrigatórios.');
+                return;
+            }
+            
+            fetch(form.dataset.url, {
+                method: 'POST',
+                body: formData,
+                headers: {
+                    'X-CSRFToken': document.querySelector('[name=csrfmiddlewaretoken]').value
+                }
+            })
+            .then(response => response.json())
+            .then(data => {
+                if (data.success) {
+                    // Adicionar o novo cliente ao select
+                    const select = document.getElementById('id_clientes');
+                    const option = new Option(data.cliente.nome, data.cliente.id, true, true);
+                    $(select).append(option).trigger('change');
+                    
+                    // Fechar modal e limpar formulário
+                    $('#modalAdicionarCliente').modal('hide');
+                    form.reset();
+                    
+                    // Mostrar mensagem de sucesso
+                    showAlert('Cliente adicionado com sucesso!', 'success');
+                } else {
+                    showAlert('Erro ao adicionar cliente: ' + data.error, 'danger');
+                }
+            })
+            .catch(error => {
+                console.error('Erro:', error);
+                showAlert('Erro ao adicionar cliente. Tente novamente.', 'danger');
+            });
+        });
+        
+        function showAlert(message, type) {
+            const alertDiv = document.createElement('div');
+            alertDiv.className = `alert alert-${type} alert-dismissible fade show`;
+            alertDiv.innerHTML = `
+                ${message}
+                <button type="button" class="btn-close" data-bs-dismiss="alert"></button>
+            `;
+            
+            const container = document.querySelector('.container-fluid');
+            container.insertBefore(alertDiv, container.firstChild);
+            
+            // Remover automaticamente após 5 segundos
+            setTimeout(() => {
+                if (alertDiv.parentNode) {
+                    alertDiv.remove();
+                }
+            }, 5000);
+        }
+    }
+
+    document.addEventListener('DOMContentLoaded', function() {
+        const painel = document.getElementById('dashboard');
+        if (painel) {
+            iniciarDashboard(painel);
+        }
+        const $clientes = $('.select2-clientes');
+        if ($clientes.length) {
+            iniciarNovoProtocolo($clientes);
+        }
+    });
+})();
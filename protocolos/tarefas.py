@@ -0,0 +1,229 @@
+"""
+Exportações em segundo plano.
+
+Uma Exportacao é criada como "pendente" e processada por um ThreadPoolExecutor
+local (settings.EXPORTACOES_WORKERS) ou pelo comando processar_exportacoes,
+sem broker externo. O job é "reivindicado" com um UPDATE condicional, então
+os dois caminhos podem rodar ao mesmo tempo sem processar o mesmo job duas
+vezes. O arquivo é escrito em lotes em settings.EXPORTACOES_DIR e o progresso
+fica registrado no próprio job, junto com data_progresso, que serve de sinal
+de vida do worker. Jobs sem progresso há muito tempo (queda do worker) são
+devolvidos à fila por recuperar_interrompidas; cada tentativa escreve no seu
+próprio arquivo temporário e só altera o job enquanto ele ainda for dela.
+"""
+import datetime
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .exportacao import filtrar_protocolos, gerar_csv, linhas_exportacao
+from .forms import FiltroExportacaoForm
+from .models import Exportacao
+
+logger = logging.getLogger(__name__)
+
+LINHAS_POR_ATUALIZACAO = 5000
+
+_executor = None
+
+
+class FormatoIndisponivel(Exception):
+    pass
+
+
+class TentativaSubstituida(Exception):
+    """O job foi devolvido à fila (e talvez reivindicado de novo) durante esta tentativa"""
+
+
+def diretorio_exportacoes():
+    diretorio = Path(settings.EXPORTACOES_DIR)
+    diretorio.mkdir(parents=True, exist_ok=True)
+    return diretorio
+
+
+def enfileirar_exportacao(exportacao):
+    """Agenda o job no executor local após o commit (se houver workers configurados)"""
+    workers = getattr(settings, 'EXPORTACOES_WORKERS', 0)
+    if not workers:
+        return
+
+    def submeter():
+        global _executor
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='exportacao')
+        _executor.submit(_executar_em_thread, exportacao.pk)
+
+    transaction.on_commit(submeter)
+
+
+def _executar_em_thread(exportacao_id):
+    close_old_connections()
+    try:
+        executar_exportacao(exportacao_id)
+    finally:
+        connection.close()
+
+
+def reivindicar(exportacao_id):
+    """Marca o job como em processamento; False se outro worker já o pegou"""
+    return bool(
+        Exportacao.objects.filter(pk=exportacao_id, status='pendente')
+        .update(
+            status='processando', data_inicio=timezone.now(), data_progresso=timezone.now(),
+            tentativas=F('tentativas') + 1,
+        )
+    )
+
+
+def recuperar_interrompidas(tempo_maximo=None):
+    """
+    Jobs em "processando" sem progresso registrado há mais de `tempo_maximo`
+    segundos (padrão: settings.EXPORTACOES_TEMPO_MAXIMO) voltam a "pendente",
+    ou ficam com erro se já somam settings.EXPORTACOES_TENTATIVAS tentativas.
+    Retorna (reenfileirados, com_erro).
+    """
+    if tempo_maximo is None:
+        tempo_maximo = settings.EXPORTACOES_TEMPO_MAXIMO
+    agora = timezone.now()
+    interrompidas = Exportacao.objects.filter(
+        status='processando', data_progresso__lt=agora - datetime.timedelta(seconds=tempo_maximo)
+    )
+    reenfileirados = interrompidas.filter(tentativas__lt=settings.EXPORTACOES_TENTATIVAS).update(
+        status='pendente', data_inicio=None, data_progresso=None, linhas_processadas=0
+    )
+    com_erro = interrompidas.update(
+        status='erro', data_conclusao=agora,
+        erro='Exportação interrompida (worker encerrado durante o processamento).',
+    )
+    if reenfileirados or com_erro:
+        logger.warning("Exportações interrompidas: %s reenfileirada(s), %s com erro", reenfileirados, com_erro)
+    return reenfileirados, com_erro
+
+
+def executar_exportacao(exportacao_id):
+    if not reivindicar(exportacao_id):
+        return
+
+    exportacao = Exportacao.objects.get(pk=exportacao_id)
+    # Só altera o job enquanto ele estiver nesta tentativa
+    desta_tentativa = Exportacao.objects.filter(
+        pk=exportacao.pk, status='processando', tentativas=exportacao.tentativas
+    )
+    nome_arquivo = f"protocolos_{exportacao.pk}.{exportacao.formato}"
+    destino = diretorio_exportacoes() / nome_arquivo
+    temporario = destino.with_suffix(f'{destino.suffix}.{exportacao.tentativas}.parcial')
+
+    try:
+        form = FiltroExportacaoForm(exportacao.filtros)
+        if not form.is_valid():
+            raise ValueError(f"Filtros inválidos: {form.errors.as_json()}")
+        filtros = form.cleaned_data
+
+        protocolos = filtrar_protocolos(filtros)
+        desta_tentativa.update(total_linhas=protocolos.count())
+
+        linhas = _registrar_progresso(
+            desta_tentativa,
+            linhas_exportacao(
+                protocolos,
+                incluir_clientes=filtros['incluir_clientes'],
+                incluir_atualizacoes=filtros['incluir_atualizacoes'],
+            ),
+        )
+        ESCRITORES[exportacao.formato](linhas, temporario)
+        os.replace(temporario, destino)
+    except TentativaSubstituida:
+        logger.warning("Exportação #%s devolvida à fila durante a tentativa %s", exportacao.pk, exportacao.tentativas)
+        temporario.unlink(missing_ok=True)
+        return
+    except Exception as exc:
+        logger.exception("Falha na exportação #%s", exportacao.pk)
+        temporario.unlink(missing_ok=True)
+        desta_tentativa.update(status='erro', erro=str(exc), data_conclusao=timezone.now())
+        return
+
+    desta_tentativa.update(status='concluida', arquivo=nome_arquivo, data_conclusao=timezone.now())
+
+
+def _registrar_progresso(desta_tentativa, linhas):
+    """
+    Repassa as linhas e grava o progresso (e data_progresso) a cada
+    LINHAS_POR_ATUALIZACAO. Interrompe com TentativaSubstituida se o job já
+    não estiver nesta tentativa.
+    """
+    def registrar(processadas):
+        if not desta_tentativa.update(linhas_processadas=processadas, data_progresso=timezone.now()):
+            raise TentativaSubstituida()
+
+    processadas = -1  # o cabeçalho não conta
+    for linha in linhas:
+        yield linha
+        processadas += 1
+        if processadas and processadas % LINHAS_POR_ATUALIZACAO == 0:
+            registrar(processadas)
+    registrar(max(processadas, 0))
+
+
+def _lotes(linhas, tamanho):
+    lote = []
+    for linha in linhas:
+        lote.append(linha)
+        if len(lote) >= tamanho:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+def escrever_csv(linhas, caminho):
+    with open(caminho, 'w', encoding='utf-8', newline='') as arquivo:
+        for bloco in gerar_csv(linhas):
+            arquivo.write(bloco)
+
+
+def escrever_parquet(linhas, caminho, linhas_por_grupo=50_000):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise FormatoIndisponivel("A exportação em Parquet requer o pacote pyarrow.")
+
+    linhas = iter(linhas)
+    cabecalho = next(linhas)
+    # Número e total de atualizações são inteiros; o resto sai como texto
+    inteiros = {0, *(i for i, coluna in enumerate(cabecalho) if coluna == "Atualizações")}
+    schema = pa.schema([
+        (coluna, pa.int64() if i in inteiros else pa.string()) for i, coluna in enumerate(cabecalho)
+    ])
+
+    with pq.ParquetWriter(caminho, schema, compression='zstd') as escritor:
+        for lote in _lotes(linhas, linhas_por_grupo):
+            colunas = [list(coluna) for coluna in zip(*lote)]
+            escritor.write_table(pa.Table.from_arrays(colunas, schema=schema))
+
+
+def escrever_xlsx(linhas, caminho):
+    try:
+        from openpyxl import Workbook
+    except ImportError:
+        raise FormatoIndisponivel("A exportação em XLSX requer o pacote openpyxl.")
+
+    # write_only grava as linhas direto no arquivo, sem manter a planilha em memória
+    planilha = Workbook(write_only=True)
+    aba = planilha.create_sheet("Protocolos")
+    for linha in linhas:
+        aba.append(linha)
+    planilha.save(caminho)
+
+
+ESCRITORES = {
+    'csv': escrever_csv,
+    'parquet': escrever_parquet,
+    'xlsx': escrever_xlsx,
+}
@@ -0,0 +1,11 @@
+from django import template
+
+from protocolos.estaticos import url_vendor
+
+register = template.Library()
+
+
+@register.simple_tag
+def vendor(nome):
+    """URL de uma biblioteca de terceiros (ver protocolos/estaticos.py: VENDOR)"""
+    return url_vendor(nome)
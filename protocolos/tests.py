@@ -1,3 +1,1680 @@
-from django.test import TestCase
+import asyncio
+import datetime
+import gzip
+import importlib.util
+import io
+import json
+import os
+import re
+import tempfile
+import threading
+import warnings
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import Group, User
+from django.contrib.sessions.models import Session
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .busca import buscar_clientes, buscar_protocolos, reindexar_protocolos
+from .cache import SQLiteCache, resumo_caches, zerar_contagem
+from .contadores import CHAVES as CHAVES_CONTADORES, obter_contadores
+from .eventos import LIMITE_NOTIFY, difusor, publicar
+from .exportacao import linhas_exportacao
+from .management.commands import importar_protocolos
+from .forms import ProtocoloForm
+from .instrumentacao import ColetorConsultas, coletar_consultas, estatisticas
+from .metricas import processar_pendentes
+from .models import (
+    NUMERO_INICIAL_PROTOCOLO, Atualizacao, Cliente, ContadorProtocolo, DiaMetricaPendente, Exportacao,
+    HistoricoCompactado, MetricaDiaria, MetricaDiariaCliente, MetricaDiariaUsuario, Protocolo,
+)
+from .paginacao import PaginadorEstimado
+from .roteamento import RoteadorReplica, leitura_na_replica, lendo_da_replica, no_principal, replica
+from .sessoes import cache as cache_sessoes, chave_usuario
+from .sinteticos import gerar_dados_sinteticos
+from .tarefas import ESCRITORES, escrever_csv, executar_exportacao, recuperar_interrompidas, reivindicar
+from .transicoes import aplicar_transicao
+
+
+def limpar_caches():
+    # Os caches não participam do rollback de cada teste
+    for alias in settings.CACHES:
+        caches[alias].clear()
+
+
+def criar_protocolo(usuario, **kwargs):
+    dados = {'buic_dispositivo': 'BUIC-001', 'descricao_problema': 'Sem conexão.'}
+    dados.update(kwargs)
+    return Protocolo.objects.create(usuario_criador=usuario, **dados)
+
+
+class NumeracaoProtocoloTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('operador', password='senha')
+
+    def test_numeracao_sequencial(self):
+        primeiro = criar_protocolo(self.usuario)
+        segundo = criar_protocolo(self.usuario)
+        self.assertEqual(primeiro.numero, NUMERO_INICIAL_PROTOCOLO)
+        self.assertEqual(segundo.numero, NUMERO_INICIAL_PROTOCOLO + 1)
+        self.assertEqual(Protocolo.get_proximo_numero(), NUMERO_INICIAL_PROTOCOLO + 2)
+
+    def test_contador_parte_do_maior_numero_existente(self):
+        criar_protocolo(self.usuario, numero=5000)
+        self.assertEqual(Protocolo.get_proximo_numero(), 5001)
+        self.assertEqual(criar_protocolo(self.usuario).numero, 5001)
+
+    def test_numero_manual_alem_do_contador(self):
+        criar_protocolo(self.usuario)
+        criar_protocolo(self.usuario, numero=NUMERO_INICIAL_PROTOCOLO + 50)
+        self.assertEqual(criar_protocolo(self.usuario).numero, NUMERO_INICIAL_PROTOCOLO + 51)
+        self.assertEqual(Protocolo.reservar_numeros(5), NUMERO_INICIAL_PROTOCOLO + 52)
+        # Mesmo resultado no caminho sem RETURNING (SELECT ... FOR UPDATE)
+        criar_protocolo(self.usuario, numero=NUMERO_INICIAL_PROTOCOLO + 100)
+        with mock.patch.object(connection.features, 'can_return_columns_from_insert', False):
+            self.assertEqual(criar_protocolo(self.usuario).numero, NUMERO_INICIAL_PROTOCOLO + 101)
+
+    def test_reserva_de_bloco(self):
+        criar_protocolo(self.usuario)
+        inicio = Protocolo.reservar_numeros(10)
+        self.assertEqual(inicio, NUMERO_INICIAL_PROTOCOLO + 1)
+        self.assertEqual(criar_protocolo(self.usuario).numero, inicio + 10)
+
+    def test_consulta_nao_reserva(self):
+        Protocolo.get_proximo_numero()
+        Protocolo.get_proximo_numero()
+        self.assertEqual(criar_protocolo(self.usuario).numero, NUMERO_INICIAL_PROTOCOLO)
+
+    def test_quantidade_invalida(self):
+        with self.assertRaises(ValueError):
+            ContadorProtocolo.incrementar(0)
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class NumeracaoConcorrenteTests(TransactionTestCase):
+    THREADS = 16
+    PROTOCOLOS_POR_THREAD = 10
+    BLOCO = 5
+
+    def test_criacao_concorrente_sem_colisao(self):
+        usuario = User.objects.create_user('operador', password='senha')
+        numeros, blocos, erros = [], [], []
+        trava = threading.Lock()
+        barreira = threading.Barrier(self.THREADS)
+
+        def trabalhador(indice):
+            try:
+                barreira.wait()
+                for _ in range(self.PROTOCOLOS_POR_THREAD):
+                    protocolo = criar_protocolo(usuario)
+                    with trava:
+                        numeros.append(protocolo.numero)
+                if indice % 4 == 0:
+                    inicio = Protocolo.reservar_numeros(self.BLOCO)
+                    with trava:
+                        blocos.append(inicio)
+            except Exception as exc:
+                with trava:
+                    erros.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=trabalhador, args=(i,)) for i in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(erros, [])
+        self.assertEqual(len(numeros), len(set(numeros)))
+        self.assertEqual(len(numeros), self.THREADS * self.PROTOCOLOS_POR_THREAD)
+
+        # Números usados + blocos reservados formam uma faixa contínua
+        reservados = {inicio + i for inicio in blocos for i in range(self.BLOCO)}
+        self.assertFalse(reservados & set(numeros))
+        todos = sorted(set(numeros) | reservados)
+        self.assertEqual(todos, list(range(NUMERO_INICIAL_PROTOCOLO, NUMERO_INICIAL_PROTOCOLO + len(todos))))
+
+
+class DashboardTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('operador', password='senha')
+
+    def setUp(self):
+        limpar_caches()
+        self.client.force_login(self.usuario)
+
+    def criar(self, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return criar_protocolo(self.usuario, **kwargs)
+
+    def test_contadores_em_uma_consulta(self):
+        self.criar()
+        self.criar(status='finalizado')
+        with self.assertNumQueries(1):
+            contadores = obter_contadores()
+        self.assertEqual(contadores, {'total': 2, 'aberto': 1, 'em_andamento': 0, 'finalizado': 1})
+
+    def test_contadores_acompanham_transicoes(self):
+        obter_contadores()
+        protocolo = self.criar()
+        protocolo = Protocolo.objects.get(pk=protocolo.pk)
+        protocolo.status = 'em_andamento'
+        with self.captureOnCommitCallbacks(execute=True):
+            protocolo.save()
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                obter_contadores(), {'total': 1, 'aberto': 0, 'em_andamento': 1, 'finalizado': 0}
+            )
+        with self.captureOnCommitCallbacks(execute=True):
+            protocolo.delete()
+        self.assertEqual(obter_contadores()['total'], 0)
+
+    def test_salvar_sem_mudar_status_nao_altera_contadores(self):
+        protocolo = Protocolo.objects.get(pk=self.criar().pk)
+        obter_contadores()
+        protocolo.descricao_problema = 'Sem conexão desde ontem.'
+        with self.captureOnCommitCallbacks(execute=True):
+            protocolo.save()
+        self.assertEqual(obter_contadores(), {'total': 1, 'aberto': 1, 'em_andamento': 0, 'finalizado': 0})
+
+    def test_dashboard_em_regime_usa_apenas_cache(self):
+        for _ in range(3):
+            self.criar()
+        self.client.get(reverse('dashboard'))
+        # Sessão e usuário autenticado também vêm do cache (ver sessoes.py)
+        with self.assertNumQueries(0):
+            resposta = self.client.get(reverse('dashboard'))
+        self.assertEqual(resposta.context['total_protocolos'], 3)
+        self.assertEqual(len(resposta.context['ultimos_protocolos']), 3)
+
+
+class EventosDashboardTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('operador', password='senha')
+
+    def setUp(self):
+        limpar_caches()
+
+    def executar(self, funcao, *args, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return funcao(*args, **kwargs)
+
+    async def receber(self, assinatura, quantidade):
+        return [await assinatura.proximo(1) for _ in range(quantidade)]
+
+    async def test_criacao_atualizacao_e_status(self):
+        assinatura = difusor.assinar()
+        try:
+            protocolo = await sync_to_async(self.executar)(criar_protocolo, self.usuario)
+            await sync_to_async(self.executar)(
+                Atualizacao.objects.create, protocolo=protocolo, descricao='Cabo trocado.', usuario=self.usuario
+            )
+            recebidos = {evento['tipo']: evento for evento in await self.receber(assinatura, 3)}
+        finally:
+            difusor.cancelar(assinatura)
+
+        criado, status, atualizacao = (
+            recebidos['protocolo_criado'], recebidos['status_alterado'], recebidos['atualizacao_criada']
+        )
+
+        self.assertEqual(criado['tipo'], 'protocolo_criado')
+        self.assertEqual(criado['variacoes'], {'aberto': 1})
+        self.assertEqual(criado['protocolo']['numero'], protocolo.numero)
+        self.assertEqual(criado['protocolo']['usuario'], 'operador')
+        self.assertEqual(status, {
+            'tipo': 'status_alterado', 'ids': [protocolo.pk], 'anterior': 'aberto', 'status': 'em_andamento',
+            'variacoes': {'aberto': -1, 'em_andamento': 1},
+        })
+        self.assertEqual(atualizacao['tipo'], 'atualizacao_criada')
+        self.assertEqual(atualizacao['descricao'], 'Cabo trocado.')
+
+    async def test_fila_cheia_pede_ressincronizacao(self):
+        assinatura = difusor.assinar()
+        try:
+            for i in range(settings.PROTOCOLOS_EVENTOS_FILA + 1):
+                difusor.distribuir({'tipo': 'teste', 'i': i})
+            await asyncio.sleep(0)
+            self.assertEqual(await assinatura.proximo(1), {'tipo': 'ressincronizar'})
+            self.assertTrue(assinatura.fila.empty())
+        finally:
+            difusor.cancelar(assinatura)
+        self.assertEqual(len(difusor), 0)
+
+    @override_settings(PROTOCOLOS_EVENTOS_MAX_CONEXOES=0)
+    async def test_limite_de_conexoes(self):
+        await self.async_client.aforce_login(self.usuario)
+        resposta = await self.async_client.get(reverse('eventos_dashboard'))
+        self.assertEqual(resposta.status_code, 503)
+
+    def test_notify_divide_listas_grandes_de_ids(self):
+        conexoes = mock.MagicMock()
+        cursor = conexoes['default'].cursor.return_value.__enter__.return_value
+        ids = list(range(1_000_000, 1_003_000))
+        with mock.patch('protocolos.eventos._usa_notify', return_value=True), \
+                mock.patch('protocolos.eventos.connections', conexoes):
+            publicar('status_alterado', ids=ids, anterior='aberto', status='finalizado',
+                     variacoes={'aberto': -3000, 'finalizado': 3000})
+
+        payloads = [chamada.args[1][1] for chamada in cursor.execute.call_args_list]
+        self.assertGreater(len(payloads), 1)
+        self.assertTrue(all(len(payload.encode()) < LIMITE_NOTIFY for payload in payloads))
+        eventos = [json.loads(payload) for payload in payloads]
+        self.assertEqual([i for evento in eventos for i in evento['ids']], ids)
+        self.assertEqual(
+            [evento['variacoes'] for evento in eventos if evento['variacoes']],
+            [{'aberto': -3000, 'finalizado': 3000}],
+        )
+
+    def test_wsgi_desliga_o_feed(self):
+        self.client.force_login(self.usuario)
+        self.assertEqual(self.client.get(reverse('eventos_dashboard')).status_code, 204)
+
+    async def test_fluxo_sse(self):
+        await self.async_client.aforce_login(self.usuario)
+        resposta = await self.async_client.get(reverse('eventos_dashboard'))
+        self.assertEqual(resposta['Content-Type'], 'text/event-stream')
+        fluxo = aiter(resposta.streaming_content)
+        self.assertEqual(await anext(fluxo), b'retry: 5000\n\n')
+        contadores = await anext(fluxo)
+        self.assertTrue(contadores.startswith(b'event: contadores\ndata: '))
+        self.assertEqual(json.loads(contadores.split(b'data: ')[1])['contadores']['total'], 0)
+
+        await sync_to_async(self.executar)(criar_protocolo, self.usuario)
+        evento = await asyncio.wait_for(anext(fluxo), 1)
+        self.assertTrue(evento.startswith(b'event: protocolo_criado\n'))
+
+        # O navegador desconecta: o servidor ASGI cancela a tarefa que lê o fluxo
+        leitura = asyncio.ensure_future(anext(fluxo))
+        await asyncio.sleep(0.01)
+        leitura.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await leitura
+        self.assertEqual(len(difusor), 0)
+
+
+class TransicaoStatusTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_superuser('admin', password='senha')
+        cls.cliente = Cliente.objects.create(nome='ACME', email='acme@example.com', senha='x')
+
+    def setUp(self):
+        limpar_caches()
+
+    def test_primeira_atualizacao_inicia_atendimento(self):
+        protocolo = criar_protocolo(self.usuario)
+        obter_contadores()
+        with self.captureOnCommitCallbacks(execute=True):
+            Atualizacao.objects.create(protocolo=protocolo, descricao='Em análise.', usuario=self.usuario)
+
+        self.assertEqual(protocolo.status, 'em_andamento')
+        self.assertEqual(Protocolo.objects.get(pk=protocolo.pk).status, 'em_andamento')
+        self.assertEqual(obter_contadores()['aberto'], 0)
+        self.assertEqual(obter_contadores()['em_andamento'], 1)
+
+    def test_nao_regrava_o_protocolo(self):
+        protocolo = criar_protocolo(self.usuario)
+        with self.captureOnCommitCallbacks(execute=True), self.assertNumQueries(4):
+            # SAVEPOINT, INSERT, UPDATE condicional e RELEASE
+            Atualizacao.objects.create(protocolo=protocolo, descricao='Em análise.', usuario=self.usuario)
+
+    def test_nao_sobrescreve_mudanca_concorrente(self):
+        protocolo = criar_protocolo(self.usuario)
+        Protocolo.objects.filter(pk=protocolo.pk).update(status='finalizado')
+
+        Atualizacao.objects.create(protocolo=protocolo, descricao='Atrasada.', usuario=self.usuario)
+        self.assertEqual(Protocolo.objects.get(pk=protocolo.pk).status, 'finalizado')
+
+    def test_evento_da_atualizacao_sem_relacoes_carregadas(self):
+        protocolo = criar_protocolo(self.usuario)
+        with mock.patch('protocolos.eventos.publicar') as publicar:
+            with CaptureQueriesContext(connection) as ctx, self.captureOnCommitCallbacks(execute=True):
+                Atualizacao.objects.create(protocolo_id=protocolo.pk, descricao='Cabo trocado.', usuario_id=self.usuario.pk)
+        publicar.assert_any_call('atualizacao_criada', numero=protocolo.numero, usuario='admin', descricao='Cabo trocado.')
+        # Número e username em uma só consulta, sem carregar protocolo e usuário
+        com_usuario = [q['sql'] for q in ctx.captured_queries if 'auth_user' in q['sql']]
+        self.assertEqual(len(com_usuario), 1)
+        self.assertIn('"numero"', com_usuario[0])
+
+    def test_inline_do_admin_em_lote(self):
+        protocolo = criar_protocolo(self.usuario)
+        protocolo.clientes.add(self.cliente)
+        existente = Atualizacao.objects.create(protocolo=protocolo, descricao='Antiga.', usuario=self.usuario)
+        Protocolo.objects.filter(pk=protocolo.pk).update(status='aberto')
+
+        cliente = Client()
+        cliente.force_login(self.usuario)
+        with mock.patch('protocolos.eventos.publicar') as publicar, self.captureOnCommitCallbacks(execute=True):
+            resposta = cliente.post(reverse('admin:protocolos_protocolo_change', args=[protocolo.pk]), {
+                'clientes': [self.cliente.pk],
+                'buic_dispositivo': protocolo.buic_dispositivo,
+                'descricao_problema': protocolo.descricao_problema,
+                'status': 'aberto',
+                'atualizacoes-TOTAL_FORMS': 3,
+                'atualizacoes-INITIAL_FORMS': 1,
+                'atualizacoes-0-id': existente.pk,
+                'atualizacoes-0-protocolo': protocolo.pk,
+                'atualizacoes-0-descricao': existente.descricao,
+                'atualizacoes-0-DELETE': 'on',
+                'atualizacoes-1-protocolo': protocolo.pk,
+                'atualizacoes-1-descricao': 'Primeira.',
+                'atualizacoes-2-protocolo': protocolo.pk,
+                'atualizacoes-2-descricao': 'Segunda.',
+            })
+
+        self.assertEqual(resposta.status_code, 302)
+        protocolo.refresh_from_db()
+        self.assertEqual(protocolo.status, 'em_andamento')
+        # bulk_create não dispara post_save: os eventos são publicados pelo admin
+        self.assertEqual(
+            sorted(c.kwargs['descricao'] for c in publicar.call_args_list if c.args == ('atualizacao_criada',)),
+            ['Primeira.', 'Segunda.'],
+        )
+        self.assertEqual(
+            sorted(protocolo.atualizacoes.values_list('descricao', flat=True)), ['Primeira.', 'Segunda.']
+        )
+        self.assertEqual(set(protocolo.atualizacoes.values_list('usuario', flat=True)), {self.usuario.pk})
+
+
+class TransicoesEmLoteTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', password='senha')
+        cls.operador = User.objects.create_user('operador', password='senha')
+
+    def setUp(self):
+        limpar_caches()
+
+    def criar(self, quantidade, **kwargs):
+        return [criar_protocolo(self.admin, **kwargs) for _ in range(quantidade)]
+
+    def aplicar(self, nome, ids):
+        with self.captureOnCommitCallbacks(execute=True):
+            return aplicar_transicao(nome, ids, self.admin)
+
+    def test_finalizar_em_lote(self):
+        abertos = self.criar(2)
+        andamento = self.criar(1, status='em_andamento')
+        finalizado = self.criar(1, status='finalizado')[0]
+        obter_contadores()
+
+        ids = [p.pk for p in abertos + andamento] + [finalizado.pk]
+        alterados = self.aplicar('finalizar', ids)
+
+        self.assertEqual(sorted(alterados), sorted(p.pk for p in abertos + andamento))
+        self.assertFalse(Protocolo.objects.filter(pk__in=alterados, data_finalizacao__isnull=True).exists())
+        self.assertEqual(Atualizacao.objects.filter(protocolo_id__in=alterados).count(), 3)
+        self.assertFalse(Atualizacao.objects.filter(protocolo=finalizado).exists())
+        self.assertEqual(obter_contadores(), {'total': 4, 'aberto': 0, 'em_andamento': 0, 'finalizado': 4})
+
+    def test_consultas_nao_dependem_do_tamanho_do_lote(self):
+        pequeno, grande = self.criar(2), self.criar(30)
+        with CaptureQueriesContext(connection) as pequeno_ctx:
+            self.aplicar('finalizar', [p.pk for p in pequeno])
+        with CaptureQueriesContext(connection) as grande_ctx:
+            self.aplicar('finalizar', [p.pk for p in grande])
+        self.assertEqual(len(pequeno_ctx), len(grande_ctx))
+        self.assertEqual(sum('UPDATE' in q['sql'] for q in grande_ctx.captured_queries), 1)
+
+    def test_reabrir_em_lote_e_individual_mantem_finalizacao(self):
+        em_lote, individual = self.criar(2, status='finalizado')
+        self.assertEqual(self.aplicar('reabrir', [em_lote.pk]), [em_lote.pk])
+        individual.status = 'aberto'
+        individual.save()
+
+        for protocolo in (em_lote, individual):
+            finalizado_em = protocolo.data_finalizacao
+            protocolo.refresh_from_db()
+            self.assertEqual(protocolo.status, 'aberto')
+            self.assertEqual(protocolo.data_finalizacao, finalizado_em)
+
+    def test_api_json(self):
+        aberto, finalizado = self.criar(1)[0], self.criar(1, status='finalizado')[0]
+        self.client.force_login(self.admin)
+        url = reverse('transicao_protocolos', args=['iniciar'])
+        with self.captureOnCommitCallbacks(execute=True):
+            resposta = self.client.post(
+                url, {'ids': [aberto.pk, finalizado.pk], 'observacao': 'Triagem.'}, content_type='application/json'
+            )
+        self.assertEqual(resposta.json(), {
+            'success': True, 'status': 'em_andamento', 'alterados': [aberto.pk], 'ignorados': [finalizado.pk],
+        })
+        self.assertEqual(
+            Atualizacao.objects.get(protocolo=aberto).descricao, 'Atendimento iniciado em lote.\nTriagem.'
+        )
+
+        self.assertEqual(self.client.post(url, {'ids': 'x'}, content_type='application/json').status_code, 400)
+        self.assertEqual(self.client.post(reverse('transicao_protocolos', args=['arquivar'])).status_code, 404)
+        self.client.force_login(self.operador)
+        self.assertEqual(self.client.post(url, {'ids': [aberto.pk]}).status_code, 403)
+
+    def test_acao_do_admin(self):
+        protocolos = self.criar(3)
+        self.client.force_login(self.admin)
+        resposta = self.client.post(reverse('admin:protocolos_protocolo_changelist'), {
+            'action': 'transicao_finalizar',
+            '_selected_action': [p.pk for p in protocolos[:2]],
+        })
+        self.assertEqual(resposta.status_code, 302)
+        self.assertEqual(
+            list(Protocolo.objects.order_by('pk').values_list('status', flat=True)),
+            ['finalizado', 'finalizado', 'aberto'],
+        )
+
+
+# Busca em thread própria não enxergaria a transação do teste
+@override_settings(PROTOCOLOS_CONSULTAS_PARALELAS=False)
+class ArquivoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', password='senha')
+        antigo = timezone.now() - datetime.timedelta(days=settings.PROTOCOLOS_HORIZONTE_ARQUIVO_DIAS + 30)
+        cls.antigos = [criar_protocolo(cls.admin, buic_dispositivo=f'BUIC-50{i}', status='finalizado') for i in range(3)]
+        Protocolo.objects.filter(pk__in=[p.pk for p in cls.antigos]).update(data_finalizacao=antigo)
+        cls.recente = criar_protocolo(cls.admin, buic_dispositivo='BUIC-510', status='finalizado')
+        cls.aberto = criar_protocolo(cls.admin, buic_dispositivo='BUIC-520')
+
+    def setUp(self):
+        limpar_caches()
+        self.client.force_login(self.admin)
+
+    def arquivar(self, *argumentos):
+        saida = io.StringIO()
+        call_command('arquivar_protocolos', '--lote', '2', *argumentos, stdout=saida)
+        return saida.getvalue()
+
+    def test_comando_arquiva_apenas_finalizados_antigos(self):
+        self.assertIn('3 protocolo(s)', self.arquivar('--simular'))
+        self.assertFalse(Protocolo.objects.arquivados().exists())
+        self.assertIn('3 protocolo(s)', self.arquivar())
+        self.assertEqual(set(Protocolo.objects.arquivados()), set(self.antigos))
+        self.assertIn('0 protocolo(s)', self.arquivar())
+
+    def test_busca_exportacao_e_admin_ignoram_arquivados(self):
+        self.client.get(reverse('busca_global_json'), {'q': 'BUIC-5'})  # popula o cache da busca
+        self.arquivar()
+
+        def ids_busca(**parametros):
+            dados = self.client.get(reverse('busca_global_json'), {'q': 'BUIC-5', **parametros}).json()
+            return {item['id'] for item in dados['resultados']['protocolos']['itens']}
+
+        self.assertEqual(ids_busca(), {self.recente.pk, self.aberto.pk})
+        self.assertEqual(len(ids_busca(arquivados='1')), 5)
+
+        exportar = lambda **p: b''.join(self.client.get(reverse('exportar_protocolos_csv'), p).streaming_content)
+        self.assertEqual(len(exportar().decode().splitlines()), 3)
+        self.assertEqual(len(exportar(incluir_arquivados='on').decode().splitlines()), 6)
+
+        url = reverse('admin:protocolos_protocolo_changelist')
+        self.assertEqual(self.client.get(url).context['cl'].result_count, 2)
+        self.assertEqual(self.client.get(url, {'arquivo': 'arquivados'}).context['cl'].result_count, 3)
+        self.assertEqual(self.client.get(url, {'arquivo': 'todos'}).context['cl'].result_count, 5)
+
+    def test_reabrir_tira_do_arquivo(self):
+        self.arquivar()
+        protocolo = self.antigos[0]
+        protocolo.refresh_from_db()
+        protocolo.status = 'aberto'
+        protocolo.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            aplicar_transicao('reabrir', [self.antigos[1].pk], self.admin)
+        self.assertEqual(list(Protocolo.objects.arquivados()), [self.antigos[2]])
+
+
+class DetalheProtocoloTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('operador', password='senha')
+        cls.protocolo = criar_protocolo(cls.usuario, status='em_andamento')
+        cls.protocolo.clientes.add(
+            Cliente.objects.create(nome='ACME', email='acme@example.com', senha='x'),
+            Cliente.objects.create(nome='Beta', email='beta@example.com', senha='x'),
+        )
+        Atualizacao.objects.bulk_create([
+            Atualizacao(protocolo=cls.protocolo, descricao=f'Passo {i}.', usuario=cls.usuario)
+            for i in range(25)
+        ])
+
+    def setUp(self):
+        limpar_caches()
+        self.client.force_login(self.usuario)
+        self.url = reverse('detalhe_protocolo', args=[self.protocolo.numero])
+
+    def test_consultas_fixas_e_paginacao(self):
+        # usuário (a sessão vem do cache), protocolo + criador, clientes e uma página do histórico
+        with self.assertNumQueries(4):
+            resposta = self.client.get(self.url)
+        self.assertContains(resposta, 'ACME')
+        self.assertContains(resposta, 'Passo 24.')
+        self.assertNotContains(resposta, 'Passo 4.')
+
+        cursor = re.search(r'cursor=([\w-]+)', resposta.content.decode()).group(1)
+        resposta = self.client.get(self.url, {'cursor': cursor})
+        self.assertContains(resposta, 'Passo 4.')
+        self.assertNotContains(resposta, 'Passo 24.')
+
+    def test_fragmento_em_cache_ate_nova_atualizacao(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(2):  # protocolo + criador e clientes
+            self.client.get(self.url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Atualizacao.objects.create(protocolo=self.protocolo, descricao='Novo passo.', usuario=self.usuario)
+        self.assertContains(self.client.get(self.url), 'Novo passo.')
+
+    def test_cursor_invalido(self):
+        self.assertEqual(self.client.get(self.url, {'cursor': 'x'}).status_code, 400)
+
+    def test_cursor_entra_na_chave_so_pelo_hash(self):
+        cursor = ' ' + 'á' * 500
+        with mock.patch('protocolos.historico.cache') as cache:
+            cache.get.return_value = ''
+            self.client.get(self.url, {'cursor': cursor})
+        chave = cache.get.call_args.args[0]
+        self.assertLess(len(chave), 100)
+        self.assertTrue(chave.isascii() and ' ' not in chave)
+
+    def test_protocolo_inexistente(self):
+        self.assertEqual(self.client.get(reverse('detalhe_protocolo', args=[1])).status_code, 404)
+
+
+class CompactacaoHistoricoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', password='senha')
+        cls.protocolo = criar_protocolo(cls.admin, status='em_andamento')
+        inicio = timezone.now() - datetime.timedelta(days=90)
+        Atualizacao.objects.bulk_create([
+            Atualizacao(
+                protocolo=cls.protocolo, descricao=f'Passo {i}.', usuario=cls.admin,
+                data_hora=inicio + datetime.timedelta(hours=i),
+            )
+            for i in range(25)
+        ])
+        cls.protocolo.status = 'finalizado'
+        cls.protocolo.save()
+        Protocolo.objects.filter(pk=cls.protocolo.pk).update(data_finalizacao=inicio + datetime.timedelta(days=2))
+        cls.ids = sorted(Atualizacao.objects.values_list('pk', flat=True))
+
+    def setUp(self):
+        limpar_caches()
+        self.client.force_login(self.admin)
+
+    def compactar(self):
+        saida = io.StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('compactar_historicos', '--medir', '1', stdout=saida)
+        return saida.getvalue()
+
+    def test_compacta_e_le_de_forma_transparente(self):
+        url = reverse('detalhe_protocolo', args=[self.protocolo.numero])
+        antes = self.client.get(url).context['historico']
+        self.assertIn('1 protocolo(s) e 25 atualização(ões)', self.compactar())
+        self.assertFalse(Atualizacao.objects.exists())
+        historico = HistoricoCompactado.objects.get()
+        self.assertEqual(historico.quantidade, 25)
+        self.assertLess(len(historico.dados), historico.tamanho_original)
+
+        self.assertEqual(self.client.get(url).context['historico'], antes)
+        cursor = re.search(r'cursor=([\w-]+)', antes).group(1)
+        resposta = self.client.get(url, {'cursor': cursor})
+        self.assertContains(resposta, 'Passo 4.')
+        self.assertNotContains(resposta, 'Passo 5.')
+
+        atualizacoes = self.protocolo.listar_atualizacoes()
+        self.assertEqual([a.descricao for a in atualizacoes[:2]], ['Passo 24.', 'Passo 23.'])
+        self.assertEqual(atualizacoes[0].usuario.username, 'admin')
+
+        admin_url = reverse('admin:protocolos_protocolo_change', args=[self.protocolo.pk])
+        self.assertContains(self.client.get(admin_url), 'Passo 24.')
+        csv = b''.join(self.client.get(
+            reverse('exportar_protocolos_csv'), {'incluir_atualizacoes': 'on'}
+        ).streaming_content).decode()
+        self.assertTrue(csv.splitlines()[1].endswith(',25'))
+
+    def test_novas_atualizacoes_entram_na_proxima_compactacao(self):
+        self.compactar()
+        Atualizacao.objects.create(
+            protocolo=self.protocolo, descricao='Depois.', usuario=self.admin,
+        )
+        Atualizacao.objects.filter(descricao='Depois.').update(data_hora=timezone.now() - datetime.timedelta(days=60))
+        self.assertEqual(self.protocolo.listar_atualizacoes()[0].descricao, 'Depois.')
+        self.compactar()
+        self.assertEqual(HistoricoCompactado.objects.get().quantidade, 26)
+        self.assertEqual(len(self.protocolo.listar_atualizacoes()), 26)
+
+    def test_reabrir_reidrata_o_historico(self):
+        self.compactar()
+        self.protocolo.refresh_from_db()
+        self.protocolo.status = 'aberto'
+        self.protocolo.save()
+        self.assertFalse(HistoricoCompactado.objects.exists())
+        self.assertEqual(sorted(Atualizacao.objects.values_list('pk', flat=True)), self.ids)
+
+        Protocolo.objects.filter(pk=self.protocolo.pk).update(status='finalizado')
+        self.compactar()
+        with self.captureOnCommitCallbacks(execute=True):
+            aplicar_transicao('reabrir', [self.protocolo.pk], self.admin)
+        self.assertEqual(Atualizacao.objects.count(), 26)
+
+
+class ApiLeituraTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('operador', password='senha')
+        cls.cliente = Cliente.objects.create(nome='Alfa', email='alfa@exemplo.com', senha='x')
+        Cliente.objects.create(nome='Beta', email='beta@exemplo.com', senha='x', ativo=False)
+        cls.protocolos = [criar_protocolo(cls.usuario, buic_dispositivo=f'BUIC-{i}') for i in range(5)]
+        cls.protocolos[0].clientes.add(cls.cliente)
+        Atualizacao.objects.create(protocolo=cls.protocolos[0], descricao='Primeiro contato.', usuario=cls.usuario)
+
+    def setUp(self):
+        limpar_caches()
+        self.client.force_login(self.usuario)
+
+    def test_paginacao_campos_e_filtros(self):
+        url = reverse('api_protocolos')
+        vistos, cursor = [], None
+        while True:
+            parametros = {'fields': 'numero,status', 'limite': 2}
+            if cursor:
+                parametros['cursor'] = cursor
+            dados = self.client.get(url, parametros).json()
+            self.assertTrue(all(set(item) == {'numero', 'status'} for item in dados['resultados']))
+            vistos += [item['numero'] for item in dados['resultados']]
+            cursor = dados['proximo_cursor']
+            if not cursor:
+                break
+        self.assertEqual(vistos, sorted((p.numero for p in self.protocolos), reverse=True))
+
+        dados = self.client.get(url, {'cliente': self.cliente.pk, 'status': 'em_andamento'}).json()
+        self.assertEqual([item['id'] for item in dados['resultados']], [self.protocolos[0].pk])
+        self.assertEqual(dados['resultados'][0]['clientes'], [self.cliente.pk])
+        self.assertEqual(dados['resultados'][0]['usuario'], 'operador')
+
+        self.assertEqual(self.client.get(url, {'fields': 'senha'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'status': 'x'}).status_code, 400)
+        clientes = self.client.get(reverse('api_clientes'), {'ativo': '1', 'fields': 'nome'}).json()
+        self.assertEqual(clientes['resultados'], [{'nome': 'Alfa'}])
+
+        atualizacoes = self.client.get(reverse('api_atualizacoes', args=[self.protocolos[0].numero])).json()
+        self.assertEqual(atualizacoes['resultados'][0]['descricao'], 'Primeiro contato.')
+
+    def test_requisicao_condicional(self):
+        url = reverse('api_protocolos')
+        resposta = self.client.get(url, {'fields': 'numero'})
+        etag, modificado = resposta['ETag'], resposta['Last-Modified']
+
+        with self.assertNumQueries(0):  # nem sessão, nem usuário, nem protocolos
+            resposta = self.client.get(url, {'fields': 'numero'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 304)
+        self.assertEqual(self.client.get(url, {'fields': 'numero'}, HTTP_IF_MODIFIED_SINCE=modificado).status_code, 304)
+        self.assertEqual(self.client.get(url, {'fields': 'status'}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        # Mudança de status não altera data_criacao, mas troca a versão
+        with self.captureOnCommitCallbacks(execute=True):
+            aplicar_transicao('finalizar', [self.protocolos[1].pk], self.usuario)
+        self.assertEqual(self.client.get(url, {'fields': 'numero'}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        url = reverse('api_atualizacoes', args=[self.protocolos[0].numero])
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            Atualizacao.objects.create(protocolo=self.protocolos[0], descricao='Retorno.', usuario=self.usuario)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertEqual(self.client.get(reverse('api_atualizacoes', args=[1])).status_code, 404)
+
+
+class EstaticosTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('operador', password='senha')
+
+    def setUp(self):
+        limpar_caches()
+        self.client.force_login(self.usuario)
+
+    def test_collectstatic_gera_versoes_comprimidas_servidas_pelo_middleware(self):
+        with tempfile.TemporaryDirectory() as destino, override_settings(
+            STATIC_ROOT=destino,
+            STORAGES={**settings.STORAGES, 'staticfiles': {'BACKEND': 'protocolos.estaticos.ArmazenamentoComprimido'}},
+        ):
+            call_command('collectstatic', interactive=False, verbosity=0)
+            with open(os.path.join(destino, 'staticfiles.json')) as arquivo:
+                manifesto = json.load(arquivo)['paths']
+            nome = manifesto['protocolos/js/protocolos.js']
+            self.assertNotEqual(nome, 'protocolos/js/protocolos.js')
+            self.assertTrue(os.path.exists(os.path.join(destino, nome + '.gz')))
+            self.assertIn(nome, self.client.get(reverse('dashboard')).content.decode())
+
+            # Estáticos não abrem sessão nem consultam o banco
+            self.client.logout()
+            url = settings.STATIC_URL + nome
+            with self.assertNumQueries(0):
+                resposta = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+            self.assertEqual(resposta['Content-Encoding'], 'gzip')
+            self.assertEqual(resposta['Cache-Control'], 'public, max-age=31536000, immutable')
+            self.assertEqual(resposta['Vary'], 'Accept-Encoding')
+            conteudo = gzip.decompress(b''.join(resposta.streaming_content))
+            with open(os.path.join(destino, nome), 'rb') as arquivo:
+                self.assertEqual(conteudo, arquivo.read())
+
+            repetida = self.client.get(url, HTTP_IF_MODIFIED_SINCE=resposta['Last-Modified'])
+            self.assertEqual(repetida.status_code, 304)
+            sem_hash = self.client.get(settings.STATIC_URL + 'protocolos/js/protocolos.js')
+            self.assertNotIn('Content-Encoding', sem_hash)
+            self.assertEqual(sem_hash['Cache-Control'], 'public, max-age=60')
+            self.assertEqual(self.client.get(settings.STATIC_URL + '../manage.py').status_code, 404)
+
+    def test_paginas_sem_scripts_inline(self):
+        criar_protocolo(self.usuario)
+        for url in (reverse('dashboard'), reverse('novo_protocolo')):
+            html = self.client.get(url).content.decode()
+            inline = re.findall(r'<script(?![^>]*\bsrc=)(?![^>]*application/json)[^>]*>', html)
+            self.assertEqual(inline, [], url)
+            self.assertNotIn('<style', html)
+            self.assertIn('protocolos/js/protocolos.js', html)
+
+
+class SessoesEmCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('operador', password='senha')
+
+    def setUp(self):
+        limpar_caches()
+        self.client.force_login(self.usuario)
+        self.url = reverse('autocomplete_clientes')
+        self.client.get(self.url)
+
+    def em_cache(self):
+        return cache_sessoes.get(chave_usuario(self.usuario.pk)) is not None
+
+    def test_troca_de_senha_encerra_a_sessao(self):
+        self.assertTrue(self.em_cache())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.usuario.set_password('outra')
+            self.usuario.save()
+        self.assertFalse(self.em_cache())
+        self.assertEqual(self.client.get(self.url).status_code, 302)
+
+    def test_usuario_desativado_perde_acesso(self):
+        User.objects.filter(pk=self.usuario.pk).update(is_active=False)
+        # update() não dispara sinais: o cache segue valendo até o save() ou até expirar
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.get(pk=self.usuario.pk).save()
+        self.assertEqual(self.client.get(self.url).status_code, 302)
+
+    def test_grupos_e_logout_invalidam(self):
+        grupo = Group.objects.create(name='suporte')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.usuario.groups.add(grupo)
+        self.assertFalse(self.em_cache())
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            grupo.user_set.clear()
+        self.assertFalse(self.em_cache())
+
+        self.client.get(self.url)
+        self.client.post(reverse('logout'))
+        self.assertFalse(self.em_cache())
+        self.assertEqual(self.client.get(self.url).status_code, 302)
+
+    def test_limpar_sessoes_remove_expiradas(self):
+        Session.objects.update(expire_date=timezone.now() - datetime.timedelta(days=1))
+        saida = io.StringIO()
+        call_command('limpar_sessoes', stdout=saida)
+        self.assertIn('1 sessão(ões) expirada(s)', saida.getvalue())
+        self.assertFalse(Session.objects.exists())
+
+
+class RoteamentoReplicaTests(TestCase):
+    def test_somente_views_marcadas_leem_da_replica(self):
+        roteador = RoteadorReplica()
+        bancos = {**settings.DATABASES, 'replica': settings.DATABASES['default']}
+        # Ignora o aviso do Django ao sobrescrever DATABASES
+        with warnings.catch_warnings(action='ignore'), override_settings(DATABASES=bancos):
+            self.assertIsNone(roteador.db_for_read(Protocolo))
+            view = leitura_na_replica(lambda request: roteador.db_for_read(Protocolo))
+            self.assertEqual(view(None), 'replica')
+            self.assertIsNone(roteador.db_for_write(Protocolo))
+            self.assertFalse(roteador.allow_migrate('replica', 'protocolos'))
+
+    def test_sem_replica_configurada(self):
+        with replica():
+            self.assertIsNone(RoteadorReplica().db_for_read(Protocolo))
+
+    def test_caches_compartilhados_nao_sao_preenchidos_pela_replica(self):
+        limpar_caches()
+        bancos = {**settings.DATABASES, 'replica': settings.DATABASES['default']}
+        lidos_de = []
+
+        def calcular():
+            lidos_de.append(RoteadorReplica().db_for_read(Protocolo))
+            return {nome: 0 for nome in CHAVES_CONTADORES}
+
+        with warnings.catch_warnings(action='ignore'), override_settings(DATABASES=bancos), replica():
+            self.assertTrue(lendo_da_replica())
+            with mock.patch('protocolos.contadores.calcular_contadores', side_effect=calcular):
+                obter_contadores()
+            with no_principal():
+                self.assertFalse(lendo_da_replica())
+        self.assertEqual(lidos_de, [None])
+
+    @override_settings(PROTOCOLOS_CONSULTAS_PARALELAS=False)
+    def test_busca_lida_da_replica_nao_vai_para_o_cache(self):
+        limpar_caches()
+        self.client.force_login(User.objects.create_user('operador', password='senha'))
+        criar_protocolo(User.objects.get(username='operador'), buic_dispositivo='BUIC-001')
+
+        def consultas():
+            with CaptureQueriesContext(connection) as ctx:
+                self.client.get(reverse('busca_global_json'), {'q': 'BUIC'})
+            return len(ctx.captured_queries)
+
+        with mock.patch('protocolos.views.lendo_da_replica', return_value=True):
+            self.assertGreater(consultas(), 0)
+            self.assertGreater(consultas(), 0)
+        consultas()
+        self.assertEqual(consultas(), 0)
+
+
+class MetricasDiariasTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('operador', password='senha')
+        cls.suporte = User.objects.create_user('suporte', password='senha')
+        cls.cliente = Cliente.objects.create(nome='ACME', email='acme@example.com', senha='x')
+        agora = timezone.localtime().replace(hour=12, minute=0, second=0, microsecond=0)
+        cls.ontem = agora - datetime.timedelta(days=1)
+        for horas in (2, 4, 12):
+            protocolo = criar_protocolo(
+                cls.usuario, status='finalizado', data_criacao=cls.ontem - datetime.timedelta(hours=horas),
+                data_finalizacao=cls.ontem,
+            )
+            protocolo.clientes.add(cls.cliente)
+        criar_protocolo(cls.suporte, data_criacao=cls.ontem)
+        criar_protocolo(cls.suporte, data_criacao=agora)
+
+    def setUp(self):
+        limpar_caches()
+
+    def test_sinais_marcam_os_dias_alterados(self):
+        self.assertEqual(
+            set(DiaMetricaPendente.objects.values_list('dia', flat=True)),
+            {self.ontem.date(), timezone.localdate()},
+        )
+
+    def test_recalculo_dos_pendentes(self):
+        self.assertEqual(processar_pendentes(), 2)
+        self.assertFalse(DiaMetricaPendente.objects.exists())
+
+        metrica = MetricaDiaria.objects.get(dia=self.ontem.date())
+        self.assertEqual((metrica.criados, metrica.finalizados), (4, 3))
+        self.assertEqual(metrica.resolucao_p50, 4 * 3600)
+        self.assertAlmostEqual(metrica.resolucao_media, 6 * 3600)
+        self.assertEqual(
+            set(MetricaDiariaUsuario.objects.filter(dia=self.ontem.date()).values_list('usuario__username', 'criados', 'finalizados')),
+            {('operador', 3, 3), ('suporte', 1, 0)},
+        )
+        self.assertEqual(
+            list(MetricaDiariaCliente.objects.values_list('dia', 'criados', 'finalizados')),
+            [(self.ontem.date(), 3, 3)],
+        )
+
+    def test_serie_com_backlog(self):
+        processar_pendentes()
+        self.client.force_login(self.usuario)
+        with self.assertNumQueries(3):  # usuário, contadores e métricas
+            dados = self.client.get(reverse('metricas_diarias'), {'dias': 3}).json()
+        self.assertEqual(
+            [(dia['criados'], dia['finalizados'], dia['backlog']) for dia in dados['dias']],
+            [(0, 0, 0), (4, 3, 1), (1, 0, 2)],
+        )
+        self.assertEqual(dados['dias'][1]['resolucao_p50_h'], 4)
+
+    def test_vazao_por_usuario_e_clientes(self):
+        processar_pendentes()
+        self.client.force_login(self.usuario)
+        usuarios = self.client.get(reverse('metricas_usuarios')).json()['usuarios']
+        self.assertEqual(usuarios[0], {'nome': 'operador', 'criados': 3, 'finalizados': 3})
+        clientes = self.client.get(reverse('metricas_clientes')).json()['clientes']
+        self.assertEqual(clientes, [{'nome': 'ACME', 'criados': 3, 'finalizados': 3}])
+
+    def test_periodo_invalido(self):
+        self.client.force_login(self.usuario)
+        self.assertEqual(self.client.get(reverse('metricas_diarias'), {'dias': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('metricas_diarias'), {'dias': 1000}).status_code, 400)
+
+
+class SQLiteCacheTests(TestCase):
+    def setUp(self):
+        diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(diretorio.cleanup)
+        self.cache = SQLiteCache(
+            os.path.join(diretorio.name, 'teste.sqlite3'),
+            {'TIMEOUT': 60, 'OPTIONS': {'MAX_ENTRIES': 4, 'CULL_FREQUENCY': 2}},
+        )
+
+    def test_operacoes_basicas(self):
+        self.cache.set('a', {'x': [1, 2]})
+        self.assertEqual(self.cache.get('a'), {'x': [1, 2]})
+        self.assertFalse(self.cache.add('a', 'outro'))
+        self.assertTrue(self.cache.add('b', 'novo'))
+        self.assertEqual(self.cache.get_many(['a', 'b', 'c']), {'a': {'x': [1, 2]}, 'b': 'novo'})
+        self.assertTrue(self.cache.delete('a'))
+        self.assertIsNone(self.cache.get('a'))
+
+    def test_expiracao(self):
+        self.cache.set('a', 1, timeout=0)
+        self.assertFalse(self.cache.has_key('a'))
+        self.assertTrue(self.cache.add('a', 2))
+        self.assertEqual(self.cache.get('a'), 2)
+
+    def test_incr_atomico(self):
+        self.cache.set('contador', 10)
+        self.assertEqual(self.cache.incr('contador', 5), 15)
+        self.assertEqual(self.cache.decr('contador'), 14)
+        with self.assertRaises(ValueError):
+            self.cache.incr('inexistente')
+
+    def test_remove_menos_usados_ao_passar_do_limite(self):
+        for chave in 'abcd':
+            self.cache.set(chave, chave)
+        # 'a' foi lido recentemente; as menos usadas são 'b' e 'c'
+        self.cache._conexao().execute(
+            'UPDATE cache SET acesso = acesso - 10 WHERE chave IN (?, ?)',
+            (self.cache.make_key('b'), self.cache.make_key('c')),
+        )
+        self.cache.set('e', 'e')
+        self.assertEqual(sorted(self.cache.get_many('abcde')), ['a', 'd', 'e'])
+        self.assertEqual(len(self.cache), 3)
+
+
+class BuscaTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('operador', password='senha')
+        cls.cliente = Cliente.objects.create(nome='Empresa Alfa', email='contato@alfa.com', senha='x')
+        cls.protocolo = criar_protocolo(cls.usuario, buic_dispositivo='BUIC-7781')
+        cls.protocolo.clientes.add(cls.cliente)
+        cls.outro = criar_protocolo(cls.usuario, descricao_problema='Impressora travada.')
+        Atualizacao.objects.create(protocolo=cls.outro, descricao='Trocado o toner.', usuario=cls.usuario)
+
+    def test_numero_exato(self):
+        self.assertEqual(list(buscar_protocolos(str(self.protocolo.numero))), [self.protocolo])
+        self.assertEqual(list(buscar_protocolos(str(self.protocolo.numero)[:2])), [])
+
+    def test_trecho_do_buic(self):
+        self.assertEqual(list(buscar_protocolos('7781')), [self.protocolo])
+
+    def test_cliente_sem_duplicar(self):
+        outro_cliente = Cliente.objects.create(nome='Empresa Beta', email='beta@alfa.com', senha='x')
+        self.protocolo.clientes.add(outro_cliente)
+        self.assertEqual(list(buscar_protocolos('alfa')), [self.protocolo])
+        self.assertEqual(set(buscar_clientes('alfa')), {self.cliente, outro_cliente})
+
+    def test_historico_de_atualizacoes(self):
+        self.assertEqual(list(buscar_protocolos('toner')), [self.outro])
+
+    def test_cliente_so_reindexa_quando_nome_ou_email_mudam(self):
+        cliente = Cliente.objects.get(pk=self.cliente.pk)
+        with mock.patch('protocolos.signals.reindexar_protocolos') as reindexar:
+            cliente.ativo = False
+            cliente.save()
+            reindexar.assert_not_called()
+            cliente.nome = 'Empresa Alfa Ltda'
+            cliente.save()
+            cliente.save()
+        reindexar.assert_called_once()
+
+    def test_reindexacao_em_lotes_por_faixa_de_pk(self):
+        ids = [self.protocolo.pk, self.outro.pk, criar_protocolo(self.usuario).pk]
+        with mock.patch('protocolos.busca._usa_postgres', return_value=True), \
+                mock.patch('protocolos.busca.atualizar_indice_busca') as atualizar:
+            reindexar_protocolos(Protocolo.objects.all(), lote=2)
+        self.assertEqual([chamada.args[0] for chamada in atualizar.call_args_list], [ids[:2], ids[2:]])
+
+    @skipUnless(connection.vendor == 'postgresql', 'o vetor de busca só existe no PostgreSQL')
+    def test_trecho_no_meio_da_palavra_no_postgres(self):
+        # O parser guarda o email como um único token: só o icontains acha "betacorp"
+        cliente = Cliente.objects.create(nome='Fulano', email='fulano@betacorp.com.br', senha='x')
+        self.protocolo.clientes.add(cliente)
+        self.assertEqual(list(buscar_protocolos('betacorp', relevancia=False)), [self.protocolo])
+        self.assertEqual(list(buscar_protocolos('pressora', relevancia=False)), [self.outro])
+
+    @override_settings(PROTOCOLOS_CONSULTAS_PARALELAS=False)
+    def test_digitos_que_nao_sao_ascii(self):
+        self.assertEqual(list(buscar_protocolos('²')), [])
+        self.client.force_login(self.usuario)
+        for url in (reverse('busca_global'), reverse('busca_global_json')):
+            self.assertEqual(self.client.get(url, {'q': '²'}).status_code, 200)
+
+
+# As seções consultadas em paralelo usam outras conexões, que não enxergam a transação do teste
+@override_settings(PROTOCOLOS_CONSULTAS_PARALELAS=False)
+class BuscaPaginadaTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('operador', password='senha')
+        cls.protocolos = [criar_protocolo(cls.usuario, buic_dispositivo=f'BUIC-{i:03d}') for i in range(45)]
+
+    def setUp(self):
+        limpar_caches()
+        self.client.force_login(self.usuario)
+
+    def test_percorre_todas_as_paginas_sem_repetir(self):
+        vistos, cursor = [], None
+        while True:
+            parametros = {'q': 'BUIC', 'secao': 'protocolos'}
+            if cursor:
+                parametros['cursor'] = cursor
+            dados = self.client.get(reverse('busca_global_json'), parametros).json()
+            pagina = dados['resultados']['protocolos']
+            self.assertLessEqual(len(pagina['itens']), 20)
+            vistos.extend(item['id'] for item in pagina['itens'])
+            cursor = pagina['proximo_cursor']
+            if not cursor:
+                break
+        self.assertEqual(vistos, [p.pk for p in sorted(self.protocolos, key=lambda p: (p.data_criacao, p.pk), reverse=True)])
+
+    def test_primeira_pagina_limitada_por_secao(self):
+        resposta = self.client.get(reverse('busca_global'), {'q': 'BUIC'})
+        protocolos = resposta.context['resultados'][0]
+        self.assertEqual(len(protocolos['itens']), 20)
+        self.assertIsNotNone(protocolos['proximo_cursor'])
+
+    def test_cursor_invalido(self):
+        resposta = self.client.get(reverse('busca_global_json'), {'q': 'BUIC', 'secao': 'protocolos', 'cursor': 'xx'})
+        self.assertEqual(resposta.status_code, 400)
+
+    async def test_cliente_assincrono(self):
+        await self.async_client.aforce_login(self.usuario)
+        resposta = await self.async_client.get(reverse('busca_global_json'), {'q': 'BUIC'})
+        dados = resposta.json()
+        self.assertEqual(len(dados['resultados']['protocolos']['itens']), 20)
+        self.assertEqual(dados['resultados']['clientes']['itens'], [])
+
+
+class BuscaParalelaTests(TransactionTestCase):
+    def setUp(self):
+        limpar_caches()
+        self.usuario = User.objects.create_user('operador', password='senha')
+        cliente = Cliente.objects.create(nome='BUIC Comércio', email='buic@exemplo.com', senha='x')
+        self.protocolo = criar_protocolo(self.usuario, buic_dispositivo='BUIC-001')
+        self.protocolo.clientes.add(cliente)
+        self.client.force_login(self.usuario)
+
+    @override_settings(PROTOCOLOS_CONSULTAS_PARALELAS=True)
+    def test_secoes_consultadas_em_paralelo(self):
+        dados = self.client.get(reverse('busca_global_json'), {'q': 'BUIC'}).json()
+        self.assertEqual([item['id'] for item in dados['resultados']['protocolos']['itens']], [self.protocolo.pk])
+        self.assertEqual([item['nome'] for item in dados['resultados']['clientes']['itens']], ['BUIC Comércio'])
+
+    def test_instrumentacao_conta_consultas_das_threads(self):
+        def contar(paralelas):
+            limpar_caches()
+            with override_settings(PROTOCOLOS_CONSULTAS_PARALELAS=paralelas), coletar_consultas() as coletor:
+                self.client.get(reverse('busca_global_json'), {'q': 'BUIC'})
+            return len(coletor.consultas)
+
+        self.assertEqual(contar(True), contar(False))
+
+
+class AdminListagensTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', password='senha')
+        cls.operador = User.objects.create_user('operador', password='senha')
+        User.objects.create_user('sem_protocolos', password='senha')
+        clientes = [
+            Cliente.objects.create(nome=f'Rede Alfa {i}', email=f'alfa{i}@exemplo.com', senha='x') for i in range(2)
+        ]
+        cls.protocolo = criar_protocolo(cls.operador, buic_dispositivo='BUIC-900')
+        cls.protocolo.clientes.add(*clientes)
+        criar_protocolo(cls.admin, buic_dispositivo='BUIC-901')
+
+    def setUp(self):
+        limpar_caches()
+        self.client.force_login(self.admin)
+
+    def listar(self, **parametros):
+        return self.client.get(reverse('admin:protocolos_protocolo_changelist'), parametros)
+
+    def test_filtro_de_usuario_sem_carregar_todos(self):
+        resposta = self.listar()
+        self.assertContains(resposta, 'data-field-name="usuario_criador"')
+        self.assertNotContains(resposta, 'sem_protocolos')
+
+        resposta = self.listar(usuario_criador__id__exact=self.operador.pk)
+        self.assertEqual(list(resposta.context['cl'].result_list), [self.protocolo])
+        self.assertContains(resposta, f'<option value="{self.operador.pk}" selected>operador</option>', html=True)
+
+        opcoes = self.client.get(reverse('admin:autocomplete'), {
+            'app_label': 'protocolos', 'model_name': 'protocolo', 'field_name': 'usuario_criador', 'term': 'oper',
+        }).json()
+        self.assertEqual([opcao['text'] for opcao in opcoes['results']], ['operador'])
+
+    def test_filtro_com_valor_invalido(self):
+        resposta = self.listar(usuario_criador__id__exact='x')
+        self.assertNotEqual(resposta.status_code, 500)
+
+    def test_busca_por_cliente_sem_duplicar(self):
+        resposta = self.listar(q='rede alfa')
+        self.assertEqual(list(resposta.context['cl'].result_list), [self.protocolo])
+        self.assertEqual(resposta.context['cl'].result_count, 1)
+
+    def test_busca_de_clientes(self):
+        resposta = self.client.get(reverse('admin:protocolos_cliente_changelist'), {'q': 'alfa1@'})
+        self.assertEqual([c.nome for c in resposta.context['cl'].result_list], ['Rede Alfa 1'])
+
+    def test_paginador_conta_ate_o_limite(self):
+        with mock.patch('protocolos.paginacao.LIMITE_CONTAGEM_EXATA', 1):
+            # Fora do PostgreSQL, acima do limite cai para o COUNT completo
+            self.assertEqual(PaginadorEstimado(Protocolo.objects.all(), 1).count, 2)
+        self.assertEqual(PaginadorEstimado(Protocolo.objects.filter(status='finalizado'), 1).count, 0)
+
+
+class ExportacaoCsvTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('operador', password='senha')
+        cls.outro_usuario = User.objects.create_user('suporte', password='senha')
+        clientes = [
+            Cliente.objects.create(nome=f'Cliente {i}', email=f'c{i}@exemplo.com', senha='x') for i in range(2)
+        ]
+        for i in range(6):
+            protocolo = criar_protocolo(
+                cls.usuario if i % 2 else cls.outro_usuario,
+                status='finalizado' if i < 2 else 'aberto',
+            )
+            protocolo.clientes.set(clientes)
+            Atualizacao.objects.create(protocolo=protocolo, descricao='Verificado.', usuario=cls.usuario)
+
+    def setUp(self):
+        self.client.force_login(self.usuario)
+
+    def exportar(self, **parametros):
+        resposta = self.client.get(reverse('exportar_protocolos_csv'), parametros)
+        self.assertEqual(resposta.status_code, 200)
+        return b''.join(resposta.streaming_content).decode().splitlines()
+
+    def test_uma_consulta_por_lote(self):
+        self.client.get(reverse('dashboard'))  # coloca o usuário em cache antes de medir
+        with self.assertNumQueries(1):  # apenas a consulta da exportação
+            linhas = self.exportar(incluir_clientes='on', incluir_atualizacoes='on')
+        self.assertEqual(len(linhas), 7)
+        self.assertTrue(linhas[1].endswith('"Cliente 0, Cliente 1",1') or linhas[1].endswith('"Cliente 1, Cliente 0",1'))
+
+        # Lotes cheios e mais uma consulta, que devolve o lote incompleto (ou vazio)
+        for lote in (2, 4, 6):
+            with self.assertNumQueries(6 // lote + 1):
+                linhas = list(linhas_exportacao(
+                    Protocolo.objects.all(), incluir_clientes=True, incluir_atualizacoes=True, tamanho_lote=lote
+                ))
+            self.assertEqual(len(linhas), 7)
+
+    def test_filtros(self):
+        self.assertEqual(len(self.exportar(status='finalizado')), 3)
+        self.assertEqual(len(self.exportar(usuario='suporte')), 4)
+        self.assertEqual(len(self.exportar(data_inicio='2000-01-01', data_fim='2000-01-02')), 1)
+
+    def test_filtro_invalido(self):
+        resposta = self.client.get(reverse('exportar_protocolos_csv'), {'data_inicio': 'ontem'})
+        self.assertEqual(resposta.status_code, 400)
+
+    def test_lotes_por_numero_sem_cursor_no_servidor(self):
+        # Lotes de 4: uma consulta com 4 linhas e outra com as 2 restantes
+        with self.assertNumQueries(2):
+            linhas = list(linhas_exportacao(Protocolo.objects.all(), tamanho_lote=4))
+        numeros = [linha[0] for linha in linhas[1:]]
+        self.assertEqual(numeros, sorted(Protocolo.objects.values_list('numero', flat=True)))
+
+
+@override_settings(EXPORTACOES_WORKERS=0)
+class ExportacaoSegundoPlanoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('operador', password='senha')
+        for i in range(12):
+            criar_protocolo(cls.usuario, status='finalizado' if i % 3 == 0 else 'aberto')
+
+    def setUp(self):
+        diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(diretorio.cleanup)
+        self.enterContext(override_settings(EXPORTACOES_DIR=diretorio.name))
+        self.client.force_login(self.usuario)
+
+    def exportar(self, **dados):
+        resposta = self.client.post(reverse('criar_exportacao'), dados)
+        self.assertEqual(resposta.status_code, 202)
+        exportacao_id = resposta.json()['exportacao']['id']
+        executar_exportacao(exportacao_id)
+        return self.client.get(reverse('status_exportacao', args=[exportacao_id])).json()['exportacao']
+
+    def test_csv_com_progresso_e_download_retomavel(self):
+        estado = self.exportar(formato='csv', status='finalizado')
+        self.assertEqual(estado['status'], 'concluida')
+        self.assertEqual((estado['linhas_processadas'], estado['total_linhas'], estado['progresso']), (4, 4, 100))
+
+        completo = b''.join(self.client.get(estado['download_url']).streaming_content)
+        self.assertEqual(len(completo.decode().splitlines()), 5)
+
+        parcial = self.client.get(estado['download_url'], HTTP_RANGE='bytes=10-')
+        self.assertEqual(parcial.status_code, 206)
+        self.assertEqual(parcial['Content-Range'], f'bytes 10-{len(completo) - 1}/{len(completo)}')
+        self.assertEqual(b''.join(parcial.streaming_content), completo[10:])
+
+        fora = self.client.get(estado['download_url'], HTTP_RANGE=f'bytes={len(completo)}-')
+        self.assertEqual(fora.status_code, 416)
+
+    def test_job_processado_apenas_uma_vez(self):
+        estado = self.exportar(formato='csv')
+        executar_exportacao(estado['id'])
+        self.assertEqual(Exportacao.objects.get(pk=estado['id']).linhas_processadas, 12)
+
+    def test_outro_usuario_nao_acessa(self):
+        estado = self.exportar(formato='csv')
+        self.client.force_login(User.objects.create_user('intruso', password='senha'))
+        self.assertEqual(self.client.get(estado['status_url']).status_code, 404)
+
+    def test_formato_invalido(self):
+        resposta = self.client.post(reverse('criar_exportacao'), {'formato': 'pdf'})
+        self.assertEqual(resposta.status_code, 400)
+
+    def linhas_esperadas(self):
+        linhas = linhas_exportacao(Protocolo.objects.order_by('numero'), incluir_atualizacoes=True)
+        return [list(linha) for linha in linhas]
+
+    @skipUnless(importlib.util.find_spec('pyarrow'), 'requer pyarrow')
+    def test_parquet_ida_e_volta(self):
+        import pyarrow.parquet as pq
+
+        estado = self.exportar(formato='parquet', incluir_atualizacoes='on')
+        self.assertEqual(estado['status'], 'concluida')
+        tabela = pq.read_table(os.path.join(settings.EXPORTACOES_DIR, f"protocolos_{estado['id']}.parquet"))
+        esperadas = self.linhas_esperadas()
+        self.assertEqual(tabela.column_names, esperadas[0])
+        self.assertEqual(sorted(map(list, zip(*tabela.to_pydict().values()))), sorted(esperadas[1:]))
+
+    @skipUnless(importlib.util.find_spec('openpyxl'), 'requer openpyxl')
+    def test_xlsx_ida_e_volta(self):
+        from openpyxl import load_workbook
+
+        estado = self.exportar(formato='xlsx', incluir_atualizacoes='on')
+        self.assertEqual(estado['status'], 'concluida')
+        planilha = load_workbook(os.path.join(settings.EXPORTACOES_DIR, f"protocolos_{estado['id']}.xlsx"))
+        # Células vazias voltam como None
+        linhas = [
+            ['' if valor is None else valor for valor in linha]
+            for linha in planilha['Protocolos'].iter_rows(values_only=True)
+        ]
+        esperadas = self.linhas_esperadas()
+        self.assertEqual(linhas[0], esperadas[0])
+        self.assertEqual(sorted(linhas[1:]), sorted(esperadas[1:]))
+
+    def test_job_interrompido_volta_para_a_fila_e_depois_falha(self):
+        exportacao = Exportacao.objects.create(usuario=self.usuario, formato='csv')
+        antigo = timezone.now() - datetime.timedelta(seconds=settings.EXPORTACOES_TEMPO_MAXIMO + 1)
+        for tentativa in range(1, settings.EXPORTACOES_TENTATIVAS + 1):
+            self.assertTrue(reivindicar(exportacao.pk))
+            # O worker "cai" sem concluir; um job recente não é tocado
+            self.assertEqual(recuperar_interrompidas(), (0, 0))
+            Exportacao.objects.filter(pk=exportacao.pk).update(data_progresso=antigo)
+            ultima = tentativa == settings.EXPORTACOES_TENTATIVAS
+            self.assertEqual(recuperar_interrompidas(), (0, 1) if ultima else (1, 0))
+
+        exportacao.refresh_from_db()
+        self.assertEqual((exportacao.status, exportacao.tentativas), ('erro', settings.EXPORTACOES_TENTATIVAS))
+        self.assertIn('interrompida', exportacao.erro)
+
+    def test_tentativa_substituida_nao_altera_o_job(self):
+        exportacao = Exportacao.objects.create(usuario=self.usuario, formato='csv')
+        antigo = timezone.now() - datetime.timedelta(seconds=settings.EXPORTACOES_TEMPO_MAXIMO + 1)
+        temporarios = []
+
+        def escrever_devagar(linhas, caminho):
+            # Sem progresso por tempo demais: outro worker assume o job no meio da escrita
+            temporarios.append(caminho)
+            Exportacao.objects.filter(pk=exportacao.pk).update(data_progresso=antigo)
+            self.assertEqual(recuperar_interrompidas(), (1, 0))
+            self.assertTrue(reivindicar(exportacao.pk))
+            escrever_csv(linhas, caminho)
+
+        with mock.patch.dict(ESCRITORES, csv=escrever_devagar):
+            executar_exportacao(exportacao.pk)
+
+        exportacao.refresh_from_db()
+        self.assertEqual((exportacao.status, exportacao.tentativas, exportacao.arquivo), ('processando', 2, ''))
+        self.assertTrue(temporarios[0].name.endswith('.csv.1.parcial'))
+        self.assertFalse(temporarios[0].exists())
+        self.assertFalse(os.listdir(settings.EXPORTACOES_DIR))
+
+
+class AutocompleteClientesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('operador', password='senha')
+        cls.clientes = [
+            Cliente.objects.create(nome=f'Cliente {i:02d}', email=f'c{i}@exemplo.com', senha='x') for i in range(30)
+        ]
+        Cliente.objects.create(nome='Cliente Inativo', email='inativo@exemplo.com', senha='x', ativo=False)
+
+    def setUp(self):
+        limpar_caches()
+
+    def test_paginacao_por_cursor(self):
+        self.client.force_login(self.usuario)
+        url = reverse('autocomplete_clientes')
+        primeira = self.client.get(url, {'q': 'cliente'}).json()
+        self.assertEqual(len(primeira['results']), 20)
+        self.assertTrue(primeira['pagination']['more'])
+        segunda = self.client.get(url, {'q': 'cliente', 'cursor': primeira['cursor']}).json()
+        self.assertEqual(len(segunda['results']), 10)
+        self.assertFalse(segunda['pagination']['more'])
+        nomes = [item['text'] for item in primeira['results'] + segunda['results']]
+        self.assertEqual(nomes, sorted(c.nome for c in self.clientes))
+
+    def test_resposta_em_cache_ate_novo_cliente(self):
+        self.client.force_login(self.usuario)
+        url = reverse('autocomplete_clientes')
+        self.client.get(url, {'q': 'cliente'})
+        with self.assertNumQueries(0):
+            self.client.get(url, {'q': 'cliente'})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Cliente.objects.create(nome='Cliente 00A', email='novo@exemplo.com', senha='x')
+        nomes = [item['text'] for item in self.client.get(url, {'q': 'cliente'}).json()['results']]
+        self.assertIn('Cliente 00A', nomes)
+
+    def test_formulario_valida_apenas_ids_enviados(self):
+        ids = [c.pk for c in self.clientes[:3]]
+        form = ProtocoloForm({'clientes': ids, 'buic_dispositivo': 'BUIC-1', 'descricao_problema': 'x'})
+        with self.assertNumQueries(1):
+            self.assertTrue(form.is_valid())
+        html = str(form['clientes'])
+        self.assertEqual(html.count('<option'), 3)
+
+    def test_formulario_vazio_nao_renderiza_clientes(self):
+        with self.assertNumQueries(0):
+            html = str(ProtocoloForm()['clientes'])
+        self.assertNotIn('<option', html)
+
+    def test_formulario_com_cliente_invalido(self):
+        form = ProtocoloForm({'clientes': ['²'], 'buic_dispositivo': 'BUIC-1', 'descricao_problema': 'x'})
+        self.assertFalse(form.is_valid())
+        self.assertNotIn('<option', str(form['clientes']))
+
+
+class ImportarProtocolosTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('operador', password='senha')
+        Cliente.objects.create(nome='Nome Antigo', email='a@exemplo.com', senha='x')
+
+    def setUp(self):
+        diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(diretorio.cleanup)
+        self.diretorio = diretorio.name
+
+    def escrever(self, nome, conteudo):
+        caminho = os.path.join(self.diretorio, nome)
+        with open(caminho, 'w', encoding='utf-8') as arquivo:
+            arquivo.write(conteudo)
+        return caminho
+
+    def importar(self, *args, **opcoes):
+        call_command('importar_protocolos', *args, stdout=io.StringIO(), stderr=io.StringIO(), **opcoes)
+
+    def test_csv_com_upsert_de_clientes(self):
+        caminho = self.escrever('legado.csv', (
+            'buic_dispositivo,descricao_problema,status,usuario,clientes,atualizacao\n'
+            'BUIC-1,Sem rede,aberto,operador,Empresa A <a@exemplo.com>; Empresa B <b@exemplo.com>,Migrado\n'
+            'BUIC-2,Lento,finalizado,operador,Empresa B <b@exemplo.com>,\n'
+            'BUIC-3,Sem criador,aberto,desconhecido,,\n'
+        ))
+        self.importar(caminho, lote=2)
+
+        self.assertEqual(Protocolo.objects.count(), 2)
+        self.assertEqual(Cliente.objects.get(email='a@exemplo.com').nome, 'Empresa A')
+        primeiro = Protocolo.objects.get(buic_dispositivo='BUIC-1')
+        self.assertEqual(primeiro.numero, NUMERO_INICIAL_PROTOCOLO)
+        self.assertEqual(primeiro.clientes.count(), 2)
+        self.assertEqual(primeiro.atualizacoes.get().descricao, 'Migrado')
+        self.assertEqual(primeiro.status, 'em_andamento')  # como em Atualizacao.save()
+        self.assertIsNotNone(Protocolo.objects.get(buic_dispositivo='BUIC-2').data_finalizacao)
+
+    def test_clientes_sem_email_e_email_com_maiusculas(self):
+        Cliente.objects.create(nome='Caixa Alta', email='Foo@Exemplo.com', senha='x')
+        caminho = self.escrever('legado.csv', (
+            'buic_dispositivo,descricao_problema,usuario,clientes\n'
+            'BUIC-1,Sem rede,operador,Foo Ltda <foo@exemplo.com>\n'
+            'BUIC-2,Lento,operador,João Silva\n'
+            'BUIC-3,Lento,operador,c@exemplo.com\n'
+        ))
+        erros = io.StringIO()
+        call_command('importar_protocolos', caminho, stdout=io.StringIO(), stderr=erros)
+
+        self.assertIn('Registro 2: cliente "João Silva" sem email válido', erros.getvalue())
+        self.assertEqual(
+            sorted(Protocolo.objects.values_list('buic_dispositivo', flat=True)), ['BUIC-1', 'BUIC-3']
+        )
+        self.assertEqual(Cliente.objects.filter(email__iexact='foo@exemplo.com').get().nome, 'Foo Ltda')
+        self.assertFalse(Cliente.objects.filter(email__contains='João').exists())
+        self.assertTrue(Cliente.objects.filter(email='c@exemplo.com').exists())
+
+    def test_mantem_datas_de_origem(self):
+        caminho = self.escrever('legado.csv', (
+            'buic_dispositivo,descricao_problema,status,data_criacao,data_finalizacao\n'
+            'BUIC-1,Sem rede,finalizado,2020-03-01T08:00:00-03:00,2020-03-02 10:30\n'
+            'BUIC-2,Lento,aberto,ontem,\n'
+        ))
+        erros = io.StringIO()
+        call_command('importar_protocolos', caminho, usuario='operador', stdout=io.StringIO(), stderr=erros)
+        self.assertIn('Registro 2: data_criacao/data_finalizacao devem estar em ISO 8601', erros.getvalue())
+        protocolo = Protocolo.objects.get()
+        self.assertEqual(protocolo.data_criacao, datetime.datetime(2020, 3, 1, 11, tzinfo=datetime.timezone.utc))
+        self.assertEqual(timezone.localtime(protocolo.data_finalizacao).date(), datetime.date(2020, 3, 2))
+        self.assertTrue(DiaMetricaPendente.objects.filter(dia=datetime.date(2020, 3, 1)).exists())
+
+    def test_dry_run_nao_grava(self):
+        caminho = self.escrever('legado.jsonl', json.dumps({
+            'buic_dispositivo': 'BUIC-1', 'descricao_problema': 'x',
+            'clientes': [{'nome': 'Novo', 'email': 'novo@exemplo.com'}],
+        }) + '\n')
+        self.importar(caminho, usuario='operador', dry_run=True)
+        self.assertFalse(Protocolo.objects.exists())
+        self.assertFalse(Cliente.objects.filter(email='novo@exemplo.com').exists())
+        self.assertEqual(Protocolo.get_proximo_numero(), NUMERO_INICIAL_PROTOCOLO)
+
+    def test_retoma_do_checkpoint(self):
+        linhas = ''.join(
+            json.dumps({'buic_dispositivo': f'BUIC-{i}', 'descricao_problema': 'x'}) + '\n' for i in range(5)
+        )
+        caminho = self.escrever('legado.jsonl', linhas)
+        checkpoint = self.escrever('progresso.json', json.dumps({'registros_processados': 3}))
+        self.importar(caminho, usuario='operador', checkpoint=checkpoint, retomar=True)
+        self.assertEqual(
+            sorted(Protocolo.objects.values_list('buic_dispositivo', flat=True)), ['BUIC-3', 'BUIC-4']
+        )
+        with open(checkpoint) as arquivo:
+            self.assertEqual(json.load(arquivo)['registros_processados'], 5)
+
+    def test_retoma_depois_de_queda_entre_o_commit_e_o_checkpoint(self):
+        linhas = ''.join(
+            json.dumps({'buic_dispositivo': f'BUIC-{i}', 'descricao_problema': 'x'}) + '\n' for i in range(4)
+        )
+        caminho = self.escrever('legado.jsonl', linhas)
+        checkpoint = self.escrever('progresso.json', '{}')
+        gravar_checkpoint = importar_protocolos.gravar_checkpoint
+
+        def cair_depois_do_commit(*args, pendente=None):
+            if not pendente:
+                raise KeyboardInterrupt
+            gravar_checkpoint(*args, pendente=pendente)
+
+        with mock.patch.object(importar_protocolos, 'gravar_checkpoint', cair_depois_do_commit):
+            with self.assertRaises(KeyboardInterrupt):
+                self.importar(caminho, usuario='operador', lote=2, checkpoint=checkpoint)
+        self.assertEqual(Protocolo.objects.count(), 2)
+
+        self.importar(caminho, usuario='operador', lote=2, checkpoint=checkpoint, retomar=True)
+        self.assertEqual(
+            sorted(Protocolo.objects.values_list('buic_dispositivo', flat=True)), [f'BUIC-{i}' for i in range(4)]
+        )
+
+    def test_numeros_reservados_fora_da_transacao_do_lote(self):
+        caminho = self.escrever('legado.jsonl', json.dumps({'buic_dispositivo': 'BUIC-1', 'descricao_problema': 'x'}) + '\n')
+        profundidade = len(connection.savepoint_ids)
+        reservas = []
+
+        def reservar(quantidade):
+            reservas.append(len(connection.savepoint_ids))
+            return ContadorProtocolo.incrementar(quantidade)
+
+        with mock.patch.object(Protocolo, 'reservar_numeros', side_effect=reservar):
+            self.importar(caminho, usuario='operador')
+        self.assertEqual(reservas, [profundidade])
+
+
+class DadosSinteticosTests(TestCase):
+    def test_gera_volumes_pedidos_de_forma_reproduzivel(self):
+        gerar_dados_sinteticos(clientes=20, protocolos=50, atualizacoes_por_protocolo=2, usuarios=3, lote=15)
+        self.assertEqual(Cliente.objects.count(), 20)
+        self.assertEqual(Protocolo.objects.count(), 50)
+        self.assertFalse(Atualizacao.objects.filter(protocolo__status='aberto').exists())
+        self.assertFalse(Protocolo.objects.filter(status='finalizado', data_finalizacao__isnull=True).exists())
+        primeira = list(Protocolo.objects.order_by('numero').values_list('buic_dispositivo', 'status'))
+
+        Protocolo.objects.all().delete()
+        gerar_dados_sinteticos(clientes=0, protocolos=50, atualizacoes_por_protocolo=2, usuarios=3, lote=15)
+        self.assertEqual(list(Protocolo.objects.order_by('numero').values_list('buic_dispositivo', 'status')), primeira)
+
+
+@override_settings(PROTOCOLOS_INSTRUMENTACAO=True)
+class InstrumentacaoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('operador', password='senha', is_staff=True)
+
+    def setUp(self):
+        estatisticas.zerar()
+        zerar_contagem()
+        limpar_caches()
+        self.client.force_login(self.usuario)
+
+    def test_server_timing_e_endpoint(self):
+        resposta = self.client.get(reverse('dashboard'))
+        self.assertRegex(resposta['Server-Timing'], r'db;dur=[\d.]+;desc="\d+ consultas", total;dur=')
+        dados = self.client.get(reverse('estatisticas_instrumentacao')).json()
+        self.assertEqual(dados['views']['dashboard']['requisicoes'], 1)
+        self.assertEqual(dados['caches']['contadores']['faltas'], 5)
+
+    def test_acertos_e_faltas_por_cache(self):
+        self.client.get(reverse('dashboard'))
+        self.client.get(reverse('dashboard'))
+        contadores = resumo_caches()['contadores']
+        self.assertEqual((contadores['acertos'], contadores['faltas']), (5, 5))
+        self.assertEqual(contadores['taxa_acerto'], 0.5)
+
+    def test_endpoint_restrito_a_staff(self):
+        self.client.force_login(User.objects.create_user('comum', password='senha'))
+        self.assertEqual(self.client.get(reverse('estatisticas_instrumentacao')).status_code, 302)
+
+    def test_benchmark_nao_deixa_usuario_nem_sessao(self):
+        sessoes = Session.objects.count()
+        with tempfile.TemporaryDirectory() as diretorio:
+            saida = os.path.join(diretorio, 'relatorio.json')
+            call_command('benchmark_views', cenarios=['exportar_csv'], repeticoes=1, saida=saida, stdout=io.StringIO())
+            with open(saida) as arquivo:
+                self.assertGreater(json.load(arquivo)['cenarios']['exportar_csv']['consultas'], 0)
+        self.assertFalse(User.objects.filter(username='benchmark').exists())
+        self.assertEqual(Session.objects.count(), sessoes)
+
+    def test_detecta_n_mais_1(self):
+        coletor = ColetorConsultas()
+        for pk in range(4):
+            coletor.consultas.append(('SELECT * FROM auth_user WHERE id = %s', (pk,), 0.001))
+        coletor.consultas.append(('SELECT * FROM auth_user WHERE id = %s', (0,), 0.001))
+        self.assertEqual(coletor.repetidas(), {'SELECT * FROM auth_user WHERE id = %s': 5})
+        self.assertEqual(coletor.duplicadas(), 1)
+
+    @override_settings(PROTOCOLOS_INSTRUMENTACAO=False)
+    def test_desativada_nao_altera_resposta(self):
+        cliente = Client()
+        cliente.force_login(self.usuario)
+        self.assertNotIn('Server-Timing', cliente.get(reverse('dashboard')))
+
+
+class IndicesTests(TestCase):
+    """Confere pelo EXPLAIN que os caminhos de acesso principais usam os índices compostos"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('operador', password='senha')
+        for status in ('aberto', 'em_andamento', 'finalizado'):
+            protocolo = criar_protocolo(cls.usuario, status=status)
+        Atualizacao.objects.bulk_create([
+            Atualizacao(protocolo=protocolo, descricao='Verificado.', usuario=cls.usuario)
+        ])
+
+    def plano(self, queryset):
+        if connection.vendor == 'postgresql':
+            # Com poucas linhas o PostgreSQL prefere varredura sequencial
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        return queryset.explain()
+
+    def assertUsaIndice(self, queryset, *indices):
+        plano = self.plano(queryset)
+        self.assertTrue(any(indice in plano for indice in indices), plano)
+
+    def test_filtro_por_status_ordenado_por_data(self):
+        self.assertUsaIndice(
+            Protocolo.objects.filter(status='aberto').order_by('-data_criacao')[:20],
+            'protocolo_status_criacao_idx',
+        )
+
+    def test_fila_de_protocolos_ativos(self):
+        self.assertUsaIndice(
+            Protocolo.objects.filter(status__in=['aberto', 'em_andamento']).order_by('-data_criacao')[:20],
+            'protocolo_ativos_criacao_idx', 'protocolo_status_criacao_idx',
+        )
+
+    def test_protocolos_do_usuario(self):
+        self.assertUsaIndice(
+            Protocolo.objects.filter(usuario_criador=self.usuario).order_by('-data_criacao')[:20],
+            'protocolo_criador_criacao_idx',
+        )
+
+    def test_historico_do_protocolo(self):
+        protocolo = Protocolo.objects.get(status='finalizado')
+        self.assertUsaIndice(
+            Atualizacao.objects.filter(protocolo=protocolo).order_by('-data_hora'),
+            'atualizacao_protocolo_hora_idx',
+        )
+
+    def test_ordenacao_do_admin(self):
+        self.assertUsaIndice(
+            Protocolo.objects.order_by('status_ordem', '-data_criacao', '-id')[:100],
+            'protocolo_ordem_admin_idx',
+        )
+
+    def test_status_ordem_calculado_pelo_banco(self):
+        self.assertEqual(
+            list(Protocolo.objects.order_by('status_ordem').values_list('status', 'status_ordem')),
+            [('aberto', 0), ('em_andamento', 1), ('finalizado', 2)],
+        )
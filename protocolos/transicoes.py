@@ -0,0 +1,120 @@
+"""
+Transições de status em lote (ações do admin e API JSON).
+
+Cada lote trava as linhas que estão no status de origem, muda todas com um
+único UPDATE (data_finalizacao calculada no próprio SQL) e grava as
+atualizações de auditoria com um bulk_create. Como nem o UPDATE nem o
+bulk_create disparam sinais, contadores, métricas diárias, caches e o feed de
+eventos são ajustados aqui, uma vez por lote, depois do commit.
+"""
+from collections import defaultdict
+from dataclasses import dataclass
+
+from django.db import router, transaction
+from django.db.models import F
+from django.db.models.functions import Coalesce, Now
+from django.utils import timezone
+
+from . import contadores, eventos
+from .busca import atualizar_indice_busca, invalidar_cache_busca
+from .compactacao import reidratar_historicos
+from .historico import invalidar_historicos
+from .metricas import marcar_dias_pendentes
+from .models import Atualizacao, Protocolo
+
+LIMITE_LOTE = 1000  # protocolos por chamada da API
+
+
+@dataclass(frozen=True)
+class Transicao:
+    origens: tuple
+    destino: str
+    descricao: str
+    rotulo: str
+
+
+TRANSICOES = {
+    'finalizar': Transicao(
+        origens=('aberto', 'em_andamento'), destino='finalizado',
+        descricao='Protocolo finalizado em lote.', rotulo='Finalizar protocolos selecionados',
+    ),
+    'reabrir': Transicao(
+        origens=('finalizado',), destino='aberto',
+        descricao='Protocolo reaberto em lote.', rotulo='Reabrir protocolos selecionados',
+    ),
+    'iniciar': Transicao(
+        origens=('aberto',), destino='em_andamento',
+        descricao='Atendimento iniciado em lote.', rotulo='Marcar selecionados como em andamento',
+    ),
+}
+
+
+def aplicar_transicao(nome, protocolos, usuario, observacao=''):
+    """
+    Aplica a transição `nome` (ver TRANSICOES) a `protocolos`, um queryset de
+    Protocolo ou uma lista de ids. Protocolos fora dos status de origem são
+    ignorados. Retorna os ids alterados.
+    """
+    transicao = TRANSICOES[nome]
+    if not isinstance(protocolos, (list, tuple, set)):
+        protocolos = protocolos.values('pk')
+    using = router.db_for_write(Protocolo)
+    descricao = transicao.descricao + (f'\n{observacao}' if observacao else '')
+
+    with transaction.atomic(using=using):
+        # Ordem por pk: lotes concorrentes travam as linhas na mesma ordem
+        travados = list(
+            Protocolo.objects.using(using)
+            .filter(pk__in=protocolos, status__in=transicao.origens)
+            .order_by('pk')
+            .select_for_update()
+            .values_list('pk', 'numero', 'status', 'data_criacao', 'data_finalizacao')
+        )
+        ids = [pk for pk, *_ in travados]
+        if not ids:
+            return []
+
+        # Como em Protocolo.save(): finalizar mantém uma data já preenchida,
+        # reabrir não a apaga e tira do arquivo
+        valores = {'status': transicao.destino}
+        if transicao.destino == 'finalizado':
+            valores['data_finalizacao'] = Coalesce(F('data_finalizacao'), Now())
+        else:
+            valores['arquivado'] = False
+        Protocolo.objects.using(using).filter(pk__in=ids).update(**valores)
+        if 'finalizado' in transicao.origens:
+            reidratar_historicos(ids, using=using)
+        atualizacoes = Atualizacao.objects.using(using).bulk_create([
+            Atualizacao(protocolo=Protocolo(pk=pk, numero=numero), descricao=descricao, usuario=usuario)
+            for pk, numero, *_ in travados
+        ])
+        eventos.publicar_atualizacoes(atualizacoes, using=using)
+
+        por_origem = defaultdict(list)
+        datas = []
+        for pk, _, status, criacao, finalizacao in travados:
+            por_origem[status].append(pk)
+            datas += [criacao, finalizacao]
+        if transicao.destino == 'finalizado':
+            datas.append(timezone.now())
+        marcar_dias_pendentes(datas)
+        atualizar_indice_busca(ids)
+
+        def ajustar():
+            variacoes = defaultdict(int)
+            for status, pks in por_origem.items():
+                variacoes[status] -= len(pks)
+                variacoes[transicao.destino] += len(pks)
+            contadores.ajustar_contadores(variacoes)
+            contadores.invalidar_ultimos_protocolos()
+            invalidar_cache_busca()
+            invalidar_historicos(ids)
+            for status, pks in por_origem.items():
+                eventos.publicar(
+                    'status_alterado', ids=pks, anterior=status, status=transicao.destino,
+                    variacoes={status: -len(pks), transicao.destino: len(pks)},
+                )
+
+        transaction.on_commit(ajustar, using=using)
+
+    return ids
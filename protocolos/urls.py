@@ -3,8 +3,23 @@ from . import views
 
 urlpatterns = [
     path("dashboard/", views.dashboard, name="dashboard"),
+    path("dashboard/eventos/", views.eventos_dashboard, name="eventos_dashboard"),
     path("novo_protocolo/", views.novo_protocolo, name="novo_protocolo"),
+    path("protocolos/<int:numero>/", views.detalhe_protocolo, name="detalhe_protocolo"),
+    path("protocolos/transicoes/<str:nome>/", views.transicao_protocolos, name="transicao_protocolos"),
     path("adicionar_cliente/", views.adicionar_cliente, name="adicionar_cliente"),
+    path("clientes/autocomplete/", views.autocomplete_clientes, name="autocomplete_clientes"),
     path("busca/", views.busca_global, name="busca_global"),
+    path("busca/json/", views.busca_global_json, name="busca_global_json"),
     path("exportar_csv/", views.exportar_protocolos_csv, name="exportar_protocolos_csv"),
+    path("exportacoes/", views.criar_exportacao, name="criar_exportacao"),
+    path("exportacoes/<int:exportacao_id>/", views.status_exportacao, name="status_exportacao"),
+    path("exportacoes/<int:exportacao_id>/download/", views.baixar_exportacao, name="baixar_exportacao"),
+    path("metricas/diarias/", views.metricas_diarias, name="metricas_diarias"),
+    path("metricas/usuarios/", views.metricas_usuarios, name="metricas_usuarios"),
+    path("metricas/clientes/", views.metricas_clientes, name="metricas_clientes"),
+    path("api/protocolos/", views.api_protocolos, name="api_protocolos"),
+    path("api/protocolos/<int:numero>/atualizacoes/", views.api_atualizacoes, name="api_atualizacoes"),
+    path("api/clientes/", views.api_clientes, name="api_clientes"),
+    path("instrumentacao/", views.estatisticas_instrumentacao, name="estatisticas_instrumentacao"),
 ]
\ No newline at end of file
@@ -1,32 +1,102 @@
-from django.shortcuts import render, redirect
-from django.contrib.auth.decorators import login_required
-from django.db.models import Count, Q
-from django.http import JsonResponse
-from django.views.decorators.http import require_POST
-from .models import Protocolo, Cliente, Atualizacao
-from .forms import ProtocoloForm
-import csv
-from django.http import HttpResponse
+import asyncio
 import json
+import re
+
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.shortcuts import get_object_or_404, render, redirect
+from django.core.exceptions import BadRequest
+from django.core.handlers.asgi import ASGIRequest
+from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse
+from django.db import close_old_connections
+from django.urls import reverse
+from django.utils.safestring import mark_safe
+from django.views.decorators.http import condition, require_GET, require_POST
+from . import api
+from .models import Protocolo, Cliente, Atualizacao, Exportacao
+from .forms import FiltroExportacaoForm, FiltroProtocolosApiForm, ProtocoloForm
+from .busca import (
+    buscar_clientes, buscar_protocolos, cache_autocomplete, cache_busca, chave_autocomplete, chave_busca,
+)
+from .cache import resumo_caches
+from .contadores import QUANTIDADE_ULTIMOS, obter_contadores, obter_ultimos_protocolos
+from .eventos import RESSINCRONIZAR, difusor
+from .exportacao import filtrar_protocolos, gerar_csv, linhas_exportacao
+from .historico import renderizar_historico
+from .metricas import clientes_mais_ativos, serie_diaria, vazao_por_usuario
+from .paginacao import CursorInvalido, apaginar_keyset, paginar_keyset
+from .roteamento import leitura_na_replica, lendo_da_replica
+from .instrumentacao import coletar_nesta_thread, estatisticas
+from .tarefas import diretorio_exportacoes, enfileirar_exportacao
+from .transicoes import LIMITE_LOTE, TRANSICOES, aplicar_transicao
+from django.http import StreamingHttpResponse
 
 @login_required
+@leitura_na_replica
 def dashboard(request):
-    total_protocolos = Protocolo.objects.count()
-    protocolos_abertos = Protocolo.objects.filter(status="aberto").count()
-    protocolos_em_andamento = Protocolo.objects.filter(status="em_andamento").count()
-    protocolos_finalizados = Protocolo.objects.filter(status="finalizado").count()
-
-    ultimos_protocolos = Protocolo.objects.order_by("-data_criacao")[:5]
+    contadores = obter_contadores()
 
     context = {
-        "total_protocolos": total_protocolos,
-        "protocolos_abertos": protocolos_abertos,
-        "protocolos_em_andamento": protocolos_em_andamento,
-        "protocolos_finalizados": protocolos_finalizados,
-        "ultimos_protocolos": ultimos_protocolos,
+        "total_protocolos": contadores["total"],
+        "protocolos_abertos": contadores["aberto"],
+        "protocolos_em_andamento": contadores["em_andamento"],
+        "protocolos_finalizados": contadores["finalizado"],
+        "ultimos_protocolos": obter_ultimos_protocolos(),
+        "quantidade_ultimos": QUANTIDADE_ULTIMOS,
+        "contadores_status": {status: contadores[status] for status in ("aberto", "em_andamento", "finalizado")},
     }
     return render(request, "protocolos/dashboard.html", context)
 
+
+INTERVALO_PING_EVENTOS = 15  # segundos; mantém a conexão aberta em proxies
+
+
+def _formatar_evento(evento):
+    return f"event: {evento['tipo']}\ndata: {json.dumps(evento)}\n\n"
+
+
+@login_required
+async def eventos_dashboard(request):
+    """
+    Server-Sent Events com as criações e mudanças de status de protocolos e as
+    novas atualizações (ver protocolos/eventos.py). Ao conectar, e sempre que
+    precisar ressincronizar, o cliente recebe os contadores atuais.
+    """
+    if not isinstance(request, ASGIRequest):
+        # Sob WSGI a conexão prenderia um worker indefinidamente; 204 faz o
+        # EventSource desistir e o dashboard fica sem atualização automática
+        return HttpResponse(status=204)
+    if difusor.lotado():
+        return HttpResponse(status=503, headers={"Retry-After": "30"})
+
+    async def transmitir():
+        assinatura = difusor.assinar()
+        try:
+            yield "retry: 5000\n\n"
+            evento = {"tipo": RESSINCRONIZAR}
+            while True:
+                if evento is None:
+                    yield ": ping\n\n"
+                elif evento["tipo"] == RESSINCRONIZAR:
+                    contadores = await sync_to_async(obter_contadores)()
+                    yield _formatar_evento({"tipo": "contadores", "contadores": contadores})
+                else:
+                    yield _formatar_evento(evento)
+                try:
+                    evento = await assinatura.proximo(INTERVALO_PING_EVENTOS)
+                except TimeoutError:
+                    evento = None
+        finally:
+            difusor.cancelar(assinatura)
+
+    resposta = StreamingHttpResponse(transmitir(), content_type="text/event-stream")
+    resposta["Cache-Control"] = "no-cache"
+    resposta["X-Accel-Buffering"] = "no"
+    return resposta
+
 @login_required
 def novo_protocolo(request):
     if request.method == "POST":
@@ -54,6 +124,74 @@ def novo_protocolo(request):
         "proximo_numero": Protocolo.get_proximo_numero()
     })
 
+@login_required
+def detalhe_protocolo(request, numero):
+    """Linha do tempo do protocolo: dados e clientes em duas consultas, histórico paginado e em cache"""
+    protocolo = get_object_or_404(
+        Protocolo.objects.select_related("usuario_criador").prefetch_related("clientes"),
+        numero=numero,
+    )
+    cursor = request.GET.get("cursor")
+    try:
+        historico = renderizar_historico(protocolo, cursor)
+    except CursorInvalido as e:
+        raise BadRequest(str(e))
+
+    return render(request, "protocolos/detalhe_protocolo.html", {
+        "protocolo": protocolo,
+        "historico": mark_safe(historico),
+        "cursor": cursor,
+    })
+
+
+def _ids_transicao(request):
+    if request.content_type == "application/json":
+        try:
+            dados = json.loads(request.body)
+        except ValueError:
+            raise BadRequest("JSON inválido.")
+        if not isinstance(dados, dict):
+            raise BadRequest("JSON inválido.")
+        ids, observacao = dados.get("ids"), dados.get("observacao") or ""
+    else:
+        ids, observacao = request.POST.getlist("ids"), request.POST.get("observacao", "")
+    try:
+        ids = {int(pk) for pk in ids}
+    except (TypeError, ValueError):
+        raise BadRequest("Informe os ids dos protocolos.")
+    if not ids:
+        raise BadRequest("Informe os ids dos protocolos.")
+    if len(ids) > LIMITE_LOTE:
+        raise BadRequest(f"No máximo {LIMITE_LOTE} protocolos por requisição.")
+    return ids, str(observacao).strip()
+
+
+@login_required
+@require_POST
+def transicao_protocolos(request, nome):
+    """
+    Transição de status em lote: POST com {"ids": [...], "observacao": "..."}
+    em JSON (ou ids repetidos no formulário). Protocolos fora do status de
+    origem são devolvidos em "ignorados".
+    """
+    if nome not in TRANSICOES:
+        return JsonResponse({"success": False, "error": "Transição desconhecida"}, status=404)
+    if not request.user.has_perm("protocolos.change_protocolo"):
+        return JsonResponse({"success": False, "error": "Sem permissão para alterar protocolos"}, status=403)
+    try:
+        ids, observacao = _ids_transicao(request)
+    except BadRequest as e:
+        return JsonResponse({"success": False, "error": str(e)}, status=400)
+
+    alterados = aplicar_transicao(nome, ids, request.user, observacao)
+    return JsonResponse({
+        "success": True,
+        "status": TRANSICOES[nome].destino,
+        "alterados": alterados,
+        "ignorados": sorted(ids - set(alterados)),
+    })
+
+
 @login_required
 @require_POST
 def adicionar_cliente(request):
@@ -98,58 +236,442 @@ def adicionar_cliente(request):
             'error': f'Erro interno: {str(e)}'
         })
 
+# Cada seção da busca é paginada por cursor: (data_criacao, id) para
+# protocolos e (nome, id) para clientes
+SECOES_BUSCA = {
+    "protocolos": ("Protocolos", ["-data_criacao", "-id"]),
+    "clientes": ("Clientes", ["nome", "id"]),
+}
+LIMITE_POR_SECAO = 20
+CAMPOS_JSON_BUSCA = {
+    "protocolos": ["id", "numero", "status", "buic_dispositivo", "descricao_problema", "data_criacao"],
+    "clientes": ["id", "nome", "email"],
+}
+
+
+def _buscar_secao(secao, query, arquivados):
+    if secao == "protocolos":
+        protocolos = buscar_protocolos(query, relevancia=False)
+        # O arquivo só entra na busca quando pedido (?arquivados=1)
+        return protocolos if arquivados else protocolos.quentes()
+    return buscar_clientes(query)
+
+
+def _pagina_secao(secao, query, cursor, campos_valores, arquivados):
+    tipo, ordenacao = SECOES_BUSCA[secao]
+    itens = _buscar_secao(secao, query, arquivados)
+    if campos_valores:
+        itens = itens.values(*campos_valores[secao])
+    pagina = paginar_keyset(itens, ordenacao, cursor=cursor, limite=LIMITE_POR_SECAO)
+    return {
+        "secao": secao,
+        "tipo": tipo,
+        "itens": pagina.itens,
+        "proximo_cursor": pagina.proximo_cursor,
+    }
+
+
+def _pagina_secao_em_thread(*args):
+    try:
+        with coletar_nesta_thread():
+            return _pagina_secao(*args)
+    finally:
+        # Esta thread não passa pelo fim da requisição: devolve a conexão ao
+        # pool (ou a mantém, dentro do CONN_MAX_AGE)
+        close_old_connections()
+
+
+async def _resultados_busca(request, campos_valores=None):
+    """
+    Executa a busca paginada. Sem `secao`, traz a primeira página de cada
+    seção, com as seções consultadas ao mesmo tempo; com `secao` e `cursor`,
+    continua apenas aquela seção.
+    """
+    query = (request.GET.get("q") or "").strip()
+    secao_pedida = request.GET.get("secao")
+    cursor = request.GET.get("cursor")
+    arquivados = request.GET.get("arquivados") == "1"
+    if not query:
+        return query, []
+    if secao_pedida and secao_pedida not in SECOES_BUSCA:
+        raise CursorInvalido("Seção de busca desconhecida.")
+
+    chave = await sync_to_async(chave_busca)(query, secao_pedida, cursor, bool(campos_valores), arquivados)
+    resultados = await cache_busca.aget(chave)
+    if resultados is not None:
+        return query, resultados
+
+    if settings.PROTOCOLOS_CONSULTAS_PARALELAS:
+        # Uma thread, e portanto uma conexão, por seção
+        executar = sync_to_async(_pagina_secao_em_thread, thread_sensitive=False)
+    else:
+        executar = sync_to_async(_pagina_secao)
+    secoes = [secao_pedida] if secao_pedida else list(SECOES_BUSCA)
+    resultados = list(await asyncio.gather(*(
+        executar(secao, query, cursor if secao_pedida else None, campos_valores, arquivados) for secao in secoes
+    )))
+    # Resultados lidos da réplica podem estar atrasados; não vão para o cache compartilhado
+    if not lendo_da_replica():
+        await cache_busca.aset(chave, resultados)
+    return query, resultados
+
+
+LIMITE_AUTOCOMPLETE = 20
+
+
 @login_required
-def busca_global(request):
-    query = request.GET.get("q")
-    resultados = []
-    if query:
-        # Busca em Protocolos
-        protocolos_resultados = Protocolo.objects.filter(
-            Q(numero__icontains=query) |
-            Q(buic_dispositivo__icontains=query) |
-            Q(descricao_problema__icontains=query) |
-            Q(clientes__nome__icontains=query) |
-            Q(clientes__email__icontains=query)
-        ).distinct()
-        resultados.append({
-            "tipo": "Protocolos",
-            "itens": protocolos_resultados
-        })
+@require_GET
+async def autocomplete_clientes(request):
+    """Endpoint AJAX do select2: clientes ativos por nome/email, paginados por cursor"""
+    termo = request.GET.get("q", "").strip()
+    cursor = request.GET.get("cursor")
+    chave = await sync_to_async(chave_autocomplete)(termo, cursor)
+    dados = await cache_autocomplete.aget(chave)
+    if dados is not None:
+        return JsonResponse(dados)
 
-        # Busca em Clientes
-        clientes_resultados = Cliente.objects.filter(
-            Q(nome__icontains=query) |
-            Q(email__icontains=query)
-        ).distinct()
-        resultados.append({
-            "tipo": "Clientes",
-            "itens": clientes_resultados
-        })
+    clientes = buscar_clientes(termo) if termo else Cliente.objects.all()
+    try:
+        pagina = await apaginar_keyset(
+            clientes.filter(ativo=True).values("id", "nome", "email"),
+            ["nome", "id"],
+            cursor=cursor,
+            limite=LIMITE_AUTOCOMPLETE,
+        )
+    except CursorInvalido as e:
+        return JsonResponse({"success": False, "error": str(e)}, status=400)
+
+    dados = {
+        "results": [
+            {"id": cliente["id"], "text": cliente["nome"], "email": cliente["email"]}
+            for cliente in pagina.itens
+        ],
+        "pagination": {"more": pagina.tem_mais},
+        "cursor": pagina.proximo_cursor,
+    }
+    await cache_autocomplete.aset(chave, dados)
+    return JsonResponse(dados)
+
+
+@login_required
+@leitura_na_replica
+async def busca_global(request):
+    try:
+        query, resultados = await _resultados_busca(request)
+    except CursorInvalido as e:
+        raise BadRequest(str(e))
 
     context = {
         "query": query,
-        "resultados": resultados
+        "resultados": resultados,
+        "secao": request.GET.get("secao"),
+        "arquivados": request.GET.get("arquivados") == "1",
     }
-    return render(request, "protocolos/busca_global.html", context)
+    # O template acessa request.user, que é carregado de forma síncrona
+    return await sync_to_async(render)(request, "protocolos/busca_global.html", context)
+
+
+@login_required
+@leitura_na_replica
+async def busca_global_json(request):
+    """Mesma busca de busca_global, em JSON, para integrações e "carregar mais" via AJAX"""
+    try:
+        query, resultados = await _resultados_busca(request, campos_valores=CAMPOS_JSON_BUSCA)
+    except CursorInvalido as e:
+        return JsonResponse({"success": False, "error": str(e)}, status=400)
+
+    return JsonResponse({
+        "success": True,
+        "query": query,
+        "resultados": {
+            resultado["secao"]: {
+                "itens": resultado["itens"],
+                "proximo_cursor": resultado["proximo_cursor"],
+            }
+            for resultado in resultados
+        },
+    })
 
 @login_required
 def exportar_protocolos_csv(request):
-    response = HttpResponse(content_type="text/csv")
+    """
+    Exporta protocolos em CSV por streaming. Aceita os filtros de
+    FiltroExportacaoForm na querystring (status, data_inicio, data_fim,
+    usuario, incluir_clientes, incluir_atualizacoes, incluir_arquivados).
+    """
+    form = FiltroExportacaoForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse({"success": False, "errors": form.errors}, status=400)
+
+    filtros = form.cleaned_data
+    linhas = linhas_exportacao(
+        filtrar_protocolos(filtros),
+        incluir_clientes=filtros["incluir_clientes"],
+        incluir_atualizacoes=filtros["incluir_atualizacoes"],
+    )
+    response = StreamingHttpResponse(gerar_csv(linhas), content_type="text/csv")
     response["Content-Disposition"] = "attachment; filename=\"protocolos.csv\""
+    return response
+
 
-    writer = csv.writer(response)
-    writer.writerow(["Número", "Status", "BUIC Dispositivo", "Descrição do Problema", "Usuário Criador", "Data de Criação", "Data de Finalização"])
-
-    protocolos = Protocolo.objects.all().order_by("numero")
-    for protocolo in protocolos:
-        writer.writerow([
-            protocolo.numero,
-            protocolo.get_status_display(),
-            protocolo.buic_dispositivo,
-            protocolo.descricao_problema,
-            protocolo.usuario_criador.username,
-            protocolo.data_criacao.strftime("%d/%m/%Y %H:%M"),
-            protocolo.data_finalizacao.strftime("%d/%m/%Y %H:%M") if protocolo.data_finalizacao else "",
-        ])
-
-    return response
\ No newline at end of file
+def _dados_exportacao(exportacao):
+    dados = {
+        "id": exportacao.pk,
+        "formato": exportacao.formato,
+        "status": exportacao.status,
+        "progresso": exportacao.progresso,
+        "linhas_processadas": exportacao.linhas_processadas,
+        "total_linhas": exportacao.total_linhas,
+        "erro": exportacao.erro,
+        "status_url": reverse("status_exportacao", args=[exportacao.pk]),
+    }
+    if exportacao.status == "concluida":
+        dados["download_url"] = reverse("baixar_exportacao", args=[exportacao.pk])
+    return dados
+
+
+def _obter_exportacao(request, exportacao_id):
+    exportacao = get_object_or_404(Exportacao, pk=exportacao_id)
+    if exportacao.usuario_id != request.user.pk and not request.user.is_staff:
+        raise Http404
+    return exportacao
+
+
+@login_required
+@require_POST
+def criar_exportacao(request):
+    """Enfileira uma exportação com os mesmos filtros de exportar_protocolos_csv"""
+    formato = request.POST.get("formato", "csv")
+    if formato not in dict(Exportacao.FORMATO_CHOICES):
+        return JsonResponse({"success": False, "error": "Formato de exportação inválido"}, status=400)
+
+    form = FiltroExportacaoForm(request.POST)
+    if not form.is_valid():
+        return JsonResponse({"success": False, "errors": form.errors}, status=400)
+
+    filtros = {
+        campo: valor.isoformat() if hasattr(valor, "isoformat") else valor
+        for campo, valor in form.cleaned_data.items()
+    }
+    exportacao = Exportacao.objects.create(usuario=request.user, formato=formato, filtros=filtros)
+    enfileirar_exportacao(exportacao)
+    return JsonResponse({"success": True, "exportacao": _dados_exportacao(exportacao)}, status=202)
+
+
+@login_required
+@require_GET
+def status_exportacao(request, exportacao_id):
+    exportacao = _obter_exportacao(request, exportacao_id)
+    return JsonResponse({"success": True, "exportacao": _dados_exportacao(exportacao)})
+
+
+TIPOS_EXPORTACAO = {
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+RANGE_BYTES = re.compile(r"^bytes=(\d*)-(\d*)$")
+TAMANHO_BLOCO_DOWNLOAD = 64 * 1024
+
+
+def _intervalo_solicitado(cabecalho, tamanho):
+    """
+    Interpreta um cabeçalho Range com um único intervalo. Retorna (inicio, fim)
+    inclusivos, None para ignorar o cabeçalho ou levanta ValueError se não
+    puder ser atendido.
+    """
+    correspondencia = RANGE_BYTES.match(cabecalho.strip())
+    if not correspondencia:
+        return None
+    inicio, fim = correspondencia.groups()
+    if not inicio:
+        if not fim:
+            return None
+        # "bytes=-N": os últimos N bytes
+        inicio, fim = max(tamanho - int(fim), 0), tamanho - 1
+    else:
+        inicio = int(inicio)
+        fim = min(int(fim), tamanho - 1) if fim else tamanho - 1
+    if inicio >= tamanho or inicio > fim:
+        raise ValueError
+    return inicio, fim
+
+
+def _ler_intervalo(caminho, inicio, fim):
+    with open(caminho, "rb") as arquivo:
+        arquivo.seek(inicio)
+        restante = fim - inicio + 1
+        while restante > 0:
+            bloco = arquivo.read(min(TAMANHO_BLOCO_DOWNLOAD, restante))
+            if not bloco:
+                break
+            restante -= len(bloco)
+            yield bloco
+
+
+@login_required
+@require_GET
+def baixar_exportacao(request, exportacao_id):
+    """Serve o arquivo da exportação com suporte a Range, para retomar downloads"""
+    exportacao = _obter_exportacao(request, exportacao_id)
+    if exportacao.status != "concluida":
+        return JsonResponse({"success": False, "error": "Exportação ainda não concluída"}, status=409)
+
+    caminho = diretorio_exportacoes() / exportacao.arquivo
+    if not caminho.is_file():
+        raise Http404
+    tamanho = caminho.stat().st_size
+    tipo = TIPOS_EXPORTACAO.get(exportacao.formato, "application/octet-stream")
+
+    try:
+        intervalo = _intervalo_solicitado(request.headers.get("Range", ""), tamanho)
+    except ValueError:
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{tamanho}"
+        return response
+
+    if intervalo is None:
+        response = FileResponse(open(caminho, "rb"), as_attachment=True, filename=exportacao.arquivo, content_type=tipo)
+    else:
+        inicio, fim = intervalo
+        response = StreamingHttpResponse(_ler_intervalo(caminho, inicio, fim), status=206, content_type=tipo)
+        response["Content-Range"] = f"bytes {inicio}-{fim}/{tamanho}"
+        response["Content-Length"] = str(fim - inicio + 1)
+        response["Content-Disposition"] = f"attachment; filename=\"{exportacao.arquivo}\""
+    response["Accept-Ranges"] = "bytes"
+    return response
+
+
+@staff_member_required
+@require_GET
+def estatisticas_instrumentacao(request):
+    """Consultas e tempos por URL coletados pelo InstrumentacaoMiddleware neste processo"""
+    return JsonResponse({
+        "ativa": settings.PROTOCOLOS_INSTRUMENTACAO,
+        "views": estatisticas.resumo(),
+        "caches": resumo_caches(),
+    })
+
+
+LIMITE_DIAS_METRICAS = 366
+
+
+def _dias_metricas(request):
+    try:
+        dias = int(request.GET.get("dias", 30))
+    except ValueError:
+        dias = 0
+    if not 1 <= dias <= LIMITE_DIAS_METRICAS:
+        raise BadRequest(f"dias deve ser um inteiro entre 1 e {LIMITE_DIAS_METRICAS}.")
+    return dias
+
+
+async def _metricas_json(request, chave, calcular):
+    """Lê apenas as tabelas de métricas diárias (ver protocolos/metricas.py)"""
+    try:
+        dias = _dias_metricas(request)
+    except BadRequest as e:
+        return JsonResponse({"success": False, "error": str(e)}, status=400)
+    return JsonResponse({"success": True, "dias_consultados": dias, chave: await sync_to_async(calcular)(dias)})
+
+
+@login_required
+@require_GET
+@leitura_na_replica
+async def metricas_diarias(request):
+    """Criados, finalizados, backlog e tempo de resolução por dia"""
+    return await _metricas_json(request, "dias", serie_diaria)
+
+
+@login_required
+@require_GET
+@leitura_na_replica
+async def metricas_usuarios(request):
+    """Protocolos criados e finalizados por usuário criador no período"""
+    return await _metricas_json(request, "usuarios", vazao_por_usuario)
+
+
+@login_required
+@require_GET
+@leitura_na_replica
+async def metricas_clientes(request):
+    """Clientes com mais protocolos criados e finalizados no período"""
+    return await _metricas_json(request, "clientes", clientes_mais_ativos)
+
+
+# API JSON de leitura (ver protocolos/api.py). Sem @leitura_na_replica: o
+# ETag é a versão dos dados no banco principal, e uma réplica atrasada
+# devolveria dados antigos com o ETag novo, que o cliente guardaria até a
+# próxima alteração. A versão é lida antes da consulta, então os dados nunca
+# são mais antigos que o ETag.
+
+def _resposta_api(request, paginar, origem):
+    """Página de `origem` montada por `paginar` (api.pagina_*), com fields, cursor e limite da querystring"""
+    try:
+        limite = api.limite_pedido(request.GET.get("limite"))
+        dados = paginar(origem, request.GET.get("fields"), request.GET.get("cursor"), limite)
+    except (CursorInvalido, api.ParametroInvalido) as e:
+        return JsonResponse({"success": False, "error": str(e)}, status=400)
+    return HttpResponse(api.serializar(dados), content_type="application/json")
+
+
+@login_required
+@require_GET
+@condition(
+    etag_func=lambda request: api.etag([api.versao_protocolos()], request),
+    last_modified_func=lambda request: api.ultima_alteracao([api.versao_protocolos()]),
+)
+def api_protocolos(request):
+    """
+    Protocolos (os não arquivados, salvo incluir_arquivados), do mais recente
+    para o mais antigo. Filtros de FiltroProtocolosApiForm; fields, cursor e limite.
+    """
+    form = FiltroProtocolosApiForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse({"success": False, "errors": form.errors}, status=400)
+    protocolos = filtrar_protocolos(form.cleaned_data)
+    if form.cleaned_data["cliente"]:
+        protocolos = protocolos.filter(clientes=form.cleaned_data["cliente"])
+    return _resposta_api(request, api.pagina_protocolos, protocolos)
+
+
+@login_required
+@require_GET
+@condition(
+    etag_func=lambda request: api.etag([api.versao_clientes()], request),
+    last_modified_func=lambda request: api.ultima_alteracao([api.versao_clientes()]),
+)
+def api_clientes(request):
+    """Clientes por nome; filtros q (nome ou email) e ativo (0 ou 1)"""
+    try:
+        clientes = api.filtrar_clientes(request.GET)
+    except api.ParametroInvalido as e:
+        return JsonResponse({"success": False, "error": str(e)}, status=400)
+    return _resposta_api(request, api.pagina_clientes, clientes)
+
+
+def _versoes_atualizacoes(request, numero):
+    # Uma consulta pelo número, compartilhada entre o ETag e o Last-Modified
+    if not hasattr(request, "_versoes_atualizacoes"):
+        pk = Protocolo.objects.filter(numero=numero).values_list("pk", flat=True).first()
+        request._versoes_atualizacoes = api.versoes_atualizacoes(pk) if pk else None
+    return request._versoes_atualizacoes
+
+
+def _etag_atualizacoes(request, numero):
+    versoes = _versoes_atualizacoes(request, numero)
+    return api.etag(versoes, request) if versoes else None
+
+
+def _ultima_atualizacao(request, numero):
+    versoes = _versoes_atualizacoes(request, numero)
+    return api.ultima_alteracao(versoes) if versoes else None
+
+
+@login_required
+@require_GET
+@condition(etag_func=_etag_atualizacoes, last_modified_func=_ultima_atualizacao)
+def api_atualizacoes(request, numero):
+    """Histórico do protocolo, da atualização mais recente para a mais antiga"""
+    protocolo = get_object_or_404(Protocolo.objects.only("pk", "status"), numero=numero)
+    return _resposta_api(request, api.pagina_atualizacoes, protocolo)
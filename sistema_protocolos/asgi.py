@@ -5,6 +5,26 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+Implantação com uvicorn (pip install uvicorn gunicorn):
+
+    gunicorn sistema_protocolos.asgi:application -w 4 -k uvicorn.workers.UvicornWorker
+
+ou, sem o gunicorn, uvicorn sistema_protocolos.asgi:application --workers 4.
+
+A busca global, o autocomplete de clientes e as métricas do dashboard são
+views assíncronas; no ASGI elas não ocupam um worker enquanto esperam o
+banco, e as seções da busca são consultadas em paralelo
+(PROTOCOLOS_CONSULTAS_PARALELAS). As demais views continuam síncronas e rodam
+na thread do ORM. Cada consulta paralela usa a sua conexão: sob ASGI prefira
+DB_POOL=1, que limita as conexões abertas ao tamanho do pool.
+
+O feed de eventos do dashboard (Server-Sent Events, protocolos/eventos.py)
+só funciona sob ASGI: cada navegador conectado é uma corrotina com uma fila
+limitada, sem prender thread nem conexão com o banco. Sob WSGI o endpoint
+responde 204 e o dashboard mostra os valores do carregamento da página.
+
+Para comparar com o WSGI, veja python manage.py teste_carga --help.
 """
 
 import os
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -23,7 +24,7 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 SECRET_KEY = 'django-insecure-m*5yb(sh68j#*kiopj043-ptd8=7-jvhiss&txjdb5un)3&2ap'
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = os.environ.get('DJANGO_DEBUG', '1') == '1'
 
 ALLOWED_HOSTS = []
 
@@ -37,15 +38,18 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'protocolos',
 ]
 
 MIDDLEWARE = [
+    'protocolos.instrumentacao.InstrumentacaoMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'protocolos.estaticos.EstaticosMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'protocolos.sessoes.UsuarioEmCacheMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -73,19 +77,70 @@ WSGI_APPLICATION = 'sistema_protocolos.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-# settings.py
+# Configuração por variáveis de ambiente; os valores padrão apontam para o
+# pooler do Supabase em modo transação (porta 6543).
 
-DATABASES = {
-    'default': {
+DB_HOST = os.environ.get('DB_HOST', 'aws-1-sa-east-1.pooler.supabase.com')
+
+DB_PORT = os.environ.get('DB_PORT', '6543')
+
+# Em modo transação (PgBouncer/Supavisor) cada transação pode cair em uma
+# conexão diferente do servidor: cursores no servidor e prepared statements
+# não sobrevivem entre transações
+DB_POOLER_TRANSACAO = os.environ.get('DB_POOLER_TRANSACAO', str(DB_PORT == '6543')).lower() in ('1', 'true', 'sim')
+
+# Pool de conexões do Django 5.1+ (psycopg_pool). Sem o pacote instalado, cai
+# para conexões persistentes com CONN_MAX_AGE
+DB_POOL = os.environ.get('DB_POOL', '1').lower() in ('1', 'true', 'sim')
+
+try:
+    from psycopg_pool import ConnectionPool
+except ImportError:
+    ConnectionPool = None
+
+
+def _banco(host, port):
+    banco = {
         'ENGINE': 'django.db.backends.postgresql',
-        'NAME': 'postgres',
-        'USER': 'postgres.hfupojkajsybbtcihctl',
-        'PASSWORD': 'Keu@2013', # Substitua por sua senha real
-        'HOST': 'aws-1-sa-east-1.pooler.supabase.com',
-        'PORT': '6543',
+        'NAME': os.environ.get('DB_NAME', 'postgres'),
+        'USER': os.environ.get('DB_USER', 'postgres.hfupojkajsybbtcihctl'),
+        'PASSWORD': os.environ.get('DB_PASSWORD', 'Keu@2013'),
+        'HOST': host,
+        'PORT': port,
+        'DISABLE_SERVER_SIDE_CURSORS': DB_POOLER_TRANSACAO,
+        'OPTIONS': {
+            'connect_timeout': int(os.environ.get('DB_CONNECT_TIMEOUT', 10)),
+        },
     }
+    if DB_POOLER_TRANSACAO:
+        banco['OPTIONS']['prepare_threshold'] = None
+    if DB_POOL and ConnectionPool is not None:
+        banco['OPTIONS']['pool'] = {
+            'min_size': int(os.environ.get('DB_POOL_MIN', 2)),
+            'max_size': int(os.environ.get('DB_POOL_MAX', 10)),
+            'timeout': int(os.environ.get('DB_POOL_TIMEOUT', 10)),
+            'max_idle': int(os.environ.get('DB_POOL_MAX_IDLE', 300)),
+            # Testa cada conexão ao retirá-la do pool; as derrubadas pelo pooler são descartadas
+            'check': ConnectionPool.check_connection,
+        }
+    else:
+        banco['CONN_MAX_AGE'] = int(os.environ.get('DB_CONN_MAX_AGE', 60))
+        banco['CONN_HEALTH_CHECKS'] = True
+    return banco
+
+
+DATABASES = {
+    'default': _banco(DB_HOST, DB_PORT),
 }
 
+# Réplica de leitura opcional, usada pelas views marcadas com
+# @leitura_na_replica (ver protocolos/roteamento.py)
+if os.environ.get('DB_REPLICA_HOST'):
+    DATABASES['replica'] = _banco(os.environ['DB_REPLICA_HOST'], os.environ.get('DB_REPLICA_PORT', DB_PORT))
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+
+DATABASE_ROUTERS = ['protocolos.roteamento.RoteadorReplica']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -123,6 +178,150 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Destino do collectstatic, servido por protocolos.estaticos.EstaticosMiddleware.
+# Fora do modo DEBUG os arquivos recebem o hash do conteúdo no nome e versões
+# .gz/.br pré-comprimidas. As bibliotecas de terceiros ficam em
+# protocolos/static/protocolos/vendor (comando baixar_estaticos).
+STATIC_ROOT = Path(os.environ.get('STATIC_ROOT', BASE_DIR / 'staticfiles'))
+
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {
+        'BACKEND': (
+            'django.contrib.staticfiles.storage.StaticFilesStorage' if DEBUG
+            else 'protocolos.estaticos.ArmazenamentoComprimido'
+        ),
+    },
+}
+
+# Cache
+# Caches nomeados usados pelo app (ver protocolos/cache.py). O backend vem de
+# PROTOCOLOS_CACHE_BACKEND: 'sqlite' (padrão, um arquivo por cache compartilhado
+# pelos workers da máquina), 'arquivo', 'memoria' (por processo) ou 'redis'
+# (REDIS_URL; o limite de memória e a política LRU ficam no servidor Redis).
+
+PROTOCOLOS_CACHE_BACKEND = os.environ.get('PROTOCOLOS_CACHE_BACKEND', 'redis' if os.environ.get('REDIS_URL') else 'sqlite')
+
+PROTOCOLOS_CACHE_DIR = Path(os.environ.get('PROTOCOLOS_CACHE_DIR', BASE_DIR / 'cache'))
+
+
+def _cache(nome, timeout, max_entradas):
+    if PROTOCOLOS_CACHE_BACKEND == 'redis':
+        return {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ.get('REDIS_URL', 'redis://127.0.0.1:6379/0'),
+            'KEY_PREFIX': nome,
+            'TIMEOUT': timeout,
+        }
+    backends = {
+        'sqlite': ('protocolos.cache.SQLiteCache', str(PROTOCOLOS_CACHE_DIR / f'{nome}.sqlite3')),
+        'arquivo': ('django.core.cache.backends.filebased.FileBasedCache', str(PROTOCOLOS_CACHE_DIR / nome)),
+        'memoria': ('django.core.cache.backends.locmem.LocMemCache', nome),
+    }
+    backend, location = backends[PROTOCOLOS_CACHE_BACKEND]
+    return {
+        'BACKEND': backend,
+        'LOCATION': location,
+        'TIMEOUT': timeout,
+        'OPTIONS': {'MAX_ENTRIES': max_entradas, 'CULL_FREQUENCY': 4},
+    }
+
+
+CACHES = {
+    'default': _cache('default', 300, 5_000),
+    'contadores': _cache('contadores', 300, 100),
+    'busca': _cache('busca', 60, 2_000),
+    'autocomplete': _cache('autocomplete', 60, 2_000),
+    'sessoes': _cache('sessoes', 1_209_600, 10_000),
+}
+
+
+# Sessões e usuário autenticado (ver protocolos/sessoes.py)
+# PROTOCOLOS_SESSOES: 'cached_db' (padrão; cache 'sessoes' com o banco como
+# reserva), 'cookies' (assinadas, sem tabela) ou 'db'. Sessões expiradas no
+# banco são removidas por python manage.py limpar_sessoes.
+
+PROTOCOLOS_SESSOES = os.environ.get('PROTOCOLOS_SESSOES', 'cached_db')
+
+SESSION_ENGINE = {
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'cookies': 'django.contrib.sessions.backends.signed_cookies',
+    'db': 'django.contrib.sessions.backends.db',
+}[PROTOCOLOS_SESSOES]
+
+SESSION_CACHE_ALIAS = 'sessoes'
+
+# Por quanto tempo o usuário autenticado fica em cache; alterações no usuário,
+# nos grupos e nas permissões e o logout o removem antes disso
+PROTOCOLOS_CACHE_USUARIO_SEGUNDOS = 300
+
+
+# Arquivamento (ver protocolos/arquivo.py)
+# Protocolos finalizados há mais dias que isto vão para o arquivo no próximo
+# python manage.py arquivar_protocolos
+
+PROTOCOLOS_HORIZONTE_ARQUIVO_DIAS = int(os.environ.get('PROTOCOLOS_HORIZONTE_ARQUIVO_DIAS', 365))
+
+
+# Histórico compactado (ver protocolos/compactacao.py)
+# python manage.py compactar_historicos junta as atualizações dos protocolos
+# finalizados há mais de PROTOCOLOS_COMPACTAR_APOS_DIAS em um JSON comprimido.
+# 'zstd' requer o pacote zstandard; históricos já gravados continuam legíveis
+# quando o formato muda
+
+PROTOCOLOS_COMPACTAR_APOS_DIAS = int(os.environ.get('PROTOCOLOS_COMPACTAR_APOS_DIAS', 30))
+PROTOCOLOS_HISTORICO_COMPRESSAO = os.environ.get('PROTOCOLOS_HISTORICO_COMPRESSAO', 'zlib')
+
+
+# Views assíncronas (ver sistema_protocolos/asgi.py)
+# As seções da busca global são consultadas em threads e conexões separadas,
+# ao mesmo tempo. Desligado, rodam uma após a outra na thread do ORM
+
+PROTOCOLOS_CONSULTAS_PARALELAS = True
+
+
+# Feed de eventos do dashboard (ver protocolos/eventos.py)
+# Eventos pendentes por conexão SSE e conexões abertas por processo
+
+PROTOCOLOS_EVENTOS_FILA = 50
+
+PROTOCOLOS_EVENTOS_MAX_CONEXOES = 1000
+
+# Com o PostgreSQL os eventos chegam aos outros processos por LISTEN/NOTIFY.
+# LISTEN precisa de uma conexão de sessão: atrás do pooler em modo transação,
+# o ouvinte usa a porta do modo sessão (5432 no Supabase)
+
+PROTOCOLOS_EVENTOS_NOTIFY = os.environ.get('PROTOCOLOS_EVENTOS_NOTIFY', '1').lower() in ('1', 'true', 'sim')
+
+PROTOCOLOS_EVENTOS_PORTA_LISTEN = os.environ.get('DB_LISTEN_PORT', '5432' if DB_POOLER_TRANSACAO else None)
+
+
+# Instrumentação de consultas por view (ver protocolos/instrumentacao.py)
+# Desligada, o middleware é removido na inicialização e não tem custo
+
+PROTOCOLOS_INSTRUMENTACAO = False
+
+PROTOCOLOS_INSTRUMENTACAO_LENTO_MS = 500
+
+
+# Exportações em segundo plano
+# Arquivos gerados pelas exportações e quantidade de threads que as processam
+# dentro da aplicação (0 = apenas o comando processar_exportacoes)
+
+EXPORTACOES_DIR = BASE_DIR / 'exportacoes'
+
+EXPORTACOES_WORKERS = 2
+
+# Um job "processando" sem registrar progresso há mais segundos que isto é
+# tratado como interrompido (worker encerrado no meio) pelo
+# processar_exportacoes: volta para a fila até
+# completar EXPORTACOES_TENTATIVAS tentativas e, depois, fica com erro
+
+EXPORTACOES_TEMPO_MAXIMO = 3600
+
+EXPORTACOES_TENTATIVAS = 3
+
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 